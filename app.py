@@ -1,64 +1,64 @@
+import asyncio
 import gradio as gr
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, Field, StringConstraints
 import urllib.parse
-import urllib.request
 import re
 import os
 import html as html_lib
 import pandas as pd
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import time
+import gc
+import hmac
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Annotated, Literal
+
+from yt_resolver import YTResolver, make_backends
+from yt_cache_store import YTCacheStore, DB_PATH as YT_DB_PATH
+from static_assets import CompressedAsset, asset_response
+from explorer_payload import encode_songs, valid_yt_id
+from explorer_scoring import EMOTION_PROFILES as EXPLORER_PROFILES, ExplorerTable, rank_all, songs_at
+from library_scanner import scan_tree
+from fragment_cache import FragmentCache
+from prefilter import PrefilterIndex
+from page_cursor import encode_cursor, decode_cursor
 
 # ── Language Detection ──────────────────────────────────────
+# (flag, language, patterns, flags) — first rule with any matching pattern wins.
+# Chinese comes after Japanese so kana-bearing titles stay Japanese.
+_LANG_RULES = [
+    ('🇯🇵', 'Japanese', [r'[\u3040-\u309F\u30A0-\u30FF]'], 0),
+    ('🇰🇷', 'Korean', [r'[\uAC00-\uD7AF\u1100-\u11FF]'], 0),
+    ('🇹🇭', 'Thai', [r'[\u0E00-\u0E7F]'], 0),
+    ('🇸🇦', 'Arabic', [r'[\u0600-\u06FF\u0750-\u077F]'], 0),
+    ('🇮🇳', 'Hindi', [r'[\u0900-\u097F]'], 0),
+    ('🇷🇺', 'Russian', [r'[\u0400-\u04FF]'], 0),
+    ('🇨🇳', 'Chinese', [r'[\u4E00-\u9FFF]'], 0),
+    # Latin-based languages - detect by common patterns/characters
+    ('🇪🇸', 'Spanish', [r'[ñ¿¡]', r'\b(el|la|los|las|del|con|por|para|que|como|pero)\b'], re.I),
+    ('🇧🇷', 'Portuguese', [r'[ãõ]', r'\b(não|você|são|também|até)\b'], re.I),
+    ('🇫🇷', 'French', [r'[àâæçéèêëîïôœùûü]', r'\b(le|la|les|du|des|et|en|un|une|pour|avec|sur|dans)\b'], re.I),
+    ('🇩🇪', 'German', [r'[ßäöü]', r'\b(und|der|die|das|ist|für|mit|auf|ich|du|wir)\b'], re.I),
+]
+_LANG_PATTERNS = [
+    (flag, name, re.compile("|".join(pats), flags))
+    for flag, name, pats, flags in _LANG_RULES
+]
+
+
 def detect_language(title: str) -> tuple[str, str]:
     """
     Detect language from song title based on character scripts.
     Returns (flag_emoji, language_name).
     """
-    # Japanese (hiragana or katakana present)
-    if re.search(r'[\u3040-\u309F\u30A0-\u30FF]', title):
-        return '🇯🇵', 'Japanese'
-    
-    # Korean (hangul)
-    if re.search(r'[\uAC00-\uD7AF\u1100-\u11FF]', title):
-        return '🇰🇷', 'Korean'
-    
-    # Thai
-    if re.search(r'[\u0E00-\u0E7F]', title):
-        return '🇹🇭', 'Thai'
-    
-    # Arabic
-    if re.search(r'[\u0600-\u06FF\u0750-\u077F]', title):
-        return '🇸🇦', 'Arabic'
-    
-    # Hindi/Devanagari
-    if re.search(r'[\u0900-\u097F]', title):
-        return '🇮🇳', 'Hindi'
-    
-    # Cyrillic (Russian)
-    if re.search(r'[\u0400-\u04FF]', title):
-        return '🇷🇺', 'Russian'
-    
-    # Chinese (CJK without Japanese kana - check after Japanese)
-    if re.search(r'[\u4E00-\u9FFF]', title):
-        return '🇨🇳', 'Chinese'
-    
-    # Latin-based languages - detect by common patterns/characters
-    # Spanish (ñ, ¿, ¡, or common Spanish words)
-    if re.search(r'[ñ¿¡]', title, re.I) or re.search(r'\b(el|la|los|las|del|con|por|para|que|como|pero)\b', title, re.I):
-        return '🇪🇸', 'Spanish'
-    
-    # Portuguese (ã, õ, ç patterns)
-    if re.search(r'[ãõ]', title, re.I) or re.search(r'\b(não|você|são|também|até)\b', title, re.I):
-        return '🇧🇷', 'Portuguese'
-    
-    # French (common accents and words)
-    if re.search(r'[àâæçéèêëîïôœùûü]', title, re.I) or re.search(r'\b(le|la|les|du|des|et|en|un|une|pour|avec|sur|dans)\b', title, re.I):
-        return '🇫🇷', 'French'
-    
-    # German (ß, ä, ö, ü patterns)
-    if re.search(r'[ßäöü]', title, re.I) or re.search(r'\b(und|der|die|das|ist|für|mit|auf|ich|du|wir)\b', title, re.I):
-        return '🇩🇪', 'German'
-    
+    for flag, name, pattern in _LANG_PATTERNS:
+        if pattern.search(title):
+            return flag, name
     # Default to English for remaining Latin-based text
     return '🇺🇸', 'English'
 
@@ -66,7 +66,7 @@ def detect_language(title: str) -> tuple[str, str]:
 # ── Load Emotion Explorer HTML at startup ───────────────────
 import json as _json
 
-_EMOTION_UI_SRCDOC = ""
+_raw = ""
 try:
     _html_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emotion_ui.html")
     with open(_html_path, "r", encoding="utf-8") as _f:
@@ -77,90 +77,365 @@ except Exception as _e:
     print(f"[Timbre] WARNING: Could not load emotion_ui.html: {_e}")
 # Essentia models are only needed for offline extract_features.py, not at runtime.
 # Do NOT call ensure_models() here — it downloads ~500MB of unused .pb files.
-from recommend_v2 import recommend, song_data
+from recommend_v2 import (
+    get_library, swap_library, library_version,
+    build_library, apply_library_delta, diff_library, read_library_file,
+    detect_emotions_semantic, rank_order, result_rows, nearest_songs, RESULT_FEATURES,
+    shared_or_build, SONG_FEATURES_PATH, BUNDLE_DIR, SHARED_DIR,
+    EMOTION_ORDER,
+)
 
 # ── YouTube ID cache ────────────────────────────────────────
-_YT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "youtube_id_cache.json")
+# SQLite (WAL) store: every resolved ID / miss is written as its own row as soon
+# as it is known; several workers can share the file. The old JSON files are
+# imported once.
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_YT_CACHE_PATH = os.path.join(_APP_DIR, "youtube_id_cache.json")
+_YT_MISS_PATH = os.path.join(_APP_DIR, "youtube_id_misses.json")
+_yt_store = YTCacheStore(os.environ.get("TIMBRE_YT_DB", os.path.join(_APP_DIR, YT_DB_PATH)))
+_migrated = _yt_store.migrate_json(_YT_CACHE_PATH, _YT_MISS_PATH)
+if _migrated:
+    print(f"[Timbre] Migrated {_migrated} YT cache entries from JSON")
+
 _yt_cache: dict = {}
-try:
-    with open(_YT_CACHE_PATH, "r", encoding="utf-8") as _cf:
+if BUNDLE_DIR:
+    # Bundle copy seeds the cache (read-only); lookups are stored in _yt_store
+    with open(os.path.join(BUNDLE_DIR, "youtube_id_cache.json"), "r", encoding="utf-8") as _cf:
         _yt_cache = _json.load(_cf)
-    print(f"[Timbre] Loaded YT cache: {len(_yt_cache)} entries")
-except Exception:
-    print("[Timbre] No YT cache found — will populate in background")
+    print(f"[Timbre] Loaded YT cache from bundle: {len(_yt_cache)} entries")
+_stored_ids, _yt_misses = _yt_store.load()   # misses: title → unix expiry
+_yt_cache.update(_stored_ids)
+print(f"[Timbre] Loaded YT cache: {len(_yt_cache)} IDs, {len(_yt_misses)} negative entries")
+# IDs older than this are revalidated in the background warm-up (0 disables)
+_YT_REVALIDATE_AGE = float(os.environ.get("TIMBRE_YT_REVALIDATE_DAYS", "90")) * 86400
+
+
+# ── Library snapshot served to requests ─────────────────────
+# Full ranked index arrays, keyed by (library version, generation, kind, key,
+# filters): every page of a ranking — first or hundredth — is a slice. Bounded
+# LRU; cleared on reload.
+_rankings = FragmentCache(int(os.environ.get("TIMBRE_RANKING_CACHE", "128")))
+# Local files and YouTube IDs change within a library version (songs/ rescans,
+# lookups landing). Each change gets a new generation; rankings filtered on
+# "available" are keyed by it, so they are rebuilt instead of served stale.
+_generations = itertools.count(1)
+
+
+class AppLibrary:
+    """Everything the handlers read that depends on the library version.
+
+    Built off to the side and published by a single reference assignment
+    (_app_lib = ...), so every request sees one consistent version.
+    """
 
-# ── Inject song library into Emotion Explorer HTML ──────────
-if _raw:
-    _songs_compact = [
-        {
-            "t":  str(r["title"]),
-            "b":  round(float(r["bpm"]),        1),
-            "v":  round(float(r["valence"]),    2),
-            "a":  round(float(r["arousal"]),    2),
-            "h":  round(float(r["mood_happy"]),      3),
-            "s":  round(float(r["mood_sad"]),        3),
-            "ag": round(float(r["mood_aggressive"]), 3),
-            "r":  round(float(r["mood_relaxed"]),    3),
-            "p":  round(float(r["mood_party"]),      3),
-            "d":  round(float(r["danceability"]),    3),
-            "yt": _yt_cache.get(str(r["title"])),   # None if not yet cached
-        }
-        for _, r in song_data.iterrows()
-    ]
-    _yt_ok = sum(1 for s in _songs_compact if s["yt"])
-    print(f"[Timbre] {_yt_ok}/{len(_songs_compact)} songs have cached YouTube IDs")
-
-    _song_script = (
-        "<script>window.__TIMBRE_SONGS__="
-        + _json.dumps(_songs_compact, ensure_ascii=True, separators=(",", ":"))
-        + ";</script>"
-    )
-    _raw_injected = _raw.replace("</head>", _song_script + "</head>", 1)
-    _EMOTION_UI_SRCDOC = _raw_injected.replace("&", "&amp;").replace('"', "&quot;")
-    print(f"[Timbre] Injected {len(_songs_compact)} songs into srcdoc ({len(_EMOTION_UI_SRCDOC):,} chars)")
-
-    # ── Background thread: fill missing YouTube IDs and save cache ──
-    def _fill_yt_cache_bg():
-        missing = [s["t"] for s in _songs_compact if not s["yt"]]
-        if not missing:
-            return
-        print(f"[Timbre] BG: fetching {len(missing)} missing YouTube IDs …")
-
-        def _fetch(title):
-            try:
-                return title, get_youtube_video_id(title)
-            except Exception:
-                return title, None
-
-        updated = 0
-        with ThreadPoolExecutor(max_workers=10) as _ex:
-            for title, vid in _ex.map(_fetch, missing):
-                if vid:
-                    _yt_cache[title] = vid
-                    updated += 1
-
-        if updated:
+    def __init__(self, lib, songs_asset, song_meta, local_audio, youtube_ids):
+        self.lib = lib                      # recommend_v2.LibrarySnapshot
+        self.songs_asset = songs_asset      # columnar Explorer payload (/explorer/songs.bin)
+        self.song_meta = song_meta          # title → (flag, language, local audio path | None)
+        self.youtube_ids = youtube_ids      # title → cached YouTube ID; lookups landing later are added
+        self.local_audio = local_audio      # (songs/ token, {filename: path}) song_meta was built from
+        self._explorer_table = None         # Explorer scoring columns, built on first use
+        self._prefilter = None              # prefilter indexes, built on first filtered query
+        self.generation = next(_generations)   # bumped when availability changes (see _generations)
+
+    def ranking_generation(self, filters=None):
+        """Generation a ranking with these filters (a Filters.key() tuple) depends on — 0 unless
+        it filters on availability, the only input that changes within a library version."""
+        return self.generation if filters and filters[-1] else 0
+
+    def ranking(self, kind, key, filters=None):
+        """Cached ranking: ("mood", emotion) → (order, sim_scores); ("explorer", key) → (order, None).
+
+        filters: a Filters.key() tuple — only the rows passing it are scored.
+        """
+        def build():
+            if kind == "mood":
+                candidates = self.prefilter().candidates(*filters) if filters else None
+                return rank_order(key, self.lib, candidates)
+            return rank_all(self.explorer_table(), key), None
+        cache_key = (self.lib.version, self.ranking_generation(filters), kind, key, filters)
+        return _rankings.get_or_render(cache_key, build)
+
+    def ranked(self, emotion, top_k, offset=0, filters=None):
+        """Tracks offset … offset + top_k for a detected emotion (rank_for_emotion's order)."""
+        order, sim_scores = self.ranking("mood", emotion, filters)
+        page = slice(offset, offset + top_k)
+        return result_rows(self.lib.song_data, order[page], sim_scores[page])
+
+    def explorer_songs(self, key, top_k, offset=0):
+        """Songs offset … offset + top_k of the Explorer's findTopSongs order."""
+        order, _ = self.ranking("explorer", key)
+        return songs_at(self.explorer_table(), order[offset:offset + top_k], self.youtube_ids)
+
+    def explorer_table(self):
+        if self._explorer_table is None:
+            self._explorer_table = ExplorerTable(self.lib.song_data)
+        return self._explorer_table
+
+    def prefilter(self):
+        index = self._prefilter
+        if index is None:
+            df = self.lib.song_data
+            meta = [self.song_meta[title] for title in df["title"].astype(str)]
+            index = self._prefilter = PrefilterIndex(
+                df["bpm"].to_numpy(dtype=float),
+                [lang_name for _, lang_name, _ in meta],
+                df["emotion"].astype(str).tolist(),
+                local=[bool(path) for _, _, path in meta],
+                youtube=[valid_yt_id(self.youtube_ids.get(title)) for title in df["title"].astype(str)],
+            )
+        return index
+
+    def add_youtube_id(self, title, video_id):
+        """A lookup landed. If it makes the title playable, drop the availability
+        index and move to a new generation so filtered rankings pick it up."""
+        became_playable = valid_yt_id(video_id) and not valid_yt_id(self.youtube_ids.get(title))
+        self.youtube_ids[title] = video_id
+        if became_playable:
+            self._prefilter = None              # in this order: a new-generation ranking
+            self.generation = next(_generations)   # never sees the old index
+
+
+# ── Local audio files ───────────────────────────────────────
+_SONG_DIRS = ("songs", os.path.join("..", "songs"))
+
+
+def _songs_dirs_token():
+    """Change token for the songs folders: the mtime of every directory in them."""
+    stamps = []
+    for root in _SONG_DIRS:
+        for dirpath, _, _ in os.walk(root):
             try:
-                with open(_YT_CACHE_PATH, "w", encoding="utf-8") as _cf:
-                    _json.dump(_yt_cache, _cf, ensure_ascii=False)
-                print(f"[Timbre] BG: saved YT cache ({len(_yt_cache)} entries). "
-                      "Restart the Space to serve embedded players.")
-            except Exception as _e:
-                print(f"[Timbre] BG: failed to save YT cache: {_e}")
+                stamps.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            except OSError:
+                pass
+    return hash(tuple(stamps))
+
+
+def scan_local_audio():
+    """(token, {filename: path}) for every audio file under the songs folders.
+
+    One directory walk replaces per-song os.path.exists probes; as before,
+    ./songs wins over ../songs.
+    """
+    token = _songs_dirs_token()
+    files = {}
+    for root in reversed(_SONG_DIRS):
+        if os.path.isdir(root):
+            files.update({rel: os.path.join(root, rel) for rel in scan_tree(root)})
+    return token, files
+
+
+def _build_song_meta(song_data, local_files, prev_meta=None):
+    """Per-title language + local audio path, reusing languages from prev_meta."""
+    prev_meta = prev_meta or {}
+    meta = {}
+    for title, filename in zip(song_data["title"].astype(str), song_data["filename"].astype(str)):
+        prev = prev_meta.get(title)
+        flag, lang_name = prev[:2] if prev else detect_language(title)
+        meta[title] = (flag, lang_name, local_files.get(filename))
+    return meta
+
+
+def build_app_library(lib, prev=None, local_audio=None, songs_asset=None):
+    """Build the per-version app state for a LibrarySnapshot (no global state touched).
+
+    prev:        the AppLibrary being replaced — its languages / local scan are reused
+    local_audio: a fresh scan_local_audio() result (defaults to prev's)
+    songs_asset: reuse an already encoded Explorer payload
+    """
+    youtube_ids = {title: _yt_cache[title] for title in lib.song_data["title"].astype(str)
+                   if _yt_cache.get(title)}
+    if songs_asset is None and _raw:
+        songs_asset = CompressedAsset(encode_songs(lib.song_data, youtube_ids),
+                                      "application/octet-stream", share_dir=_SHARED_ASSETS)
+    if local_audio is None:
+        local_audio = prev.local_audio if prev else scan_local_audio()
+    song_meta = _build_song_meta(lib.song_data, local_audio[1], prev.song_meta if prev else None)
+    return AppLibrary(lib, songs_asset, song_meta, local_audio, youtube_ids)
+
+
+# Precompressed payloads shared by the workers on this host (see static_assets.py)
+_SHARED_ASSETS = os.path.join(SHARED_DIR, "assets") if SHARED_DIR else None
+_app_lib = build_app_library(get_library())
+if _raw:
+    _titles = _app_lib.lib.song_data["title"]
+    _yt_ok = len(_app_lib.youtube_ids)
+    print(f"[Timbre] {_yt_ok}/{len(_titles)} songs have cached YouTube IDs")
+    _gz = len(_app_lib.songs_asset.variants["gzip"])
+    print(f"[Timbre] Explorer payload: {len(_titles)} songs, "
+          f"{_app_lib.songs_asset.size:,} bytes ({_gz:,} gzip)")
+
+# The page itself no longer carries the library, so it is built once. It does carry
+# the Explorer profile table, whose only copy lives in explorer_scoring.py.
+_profile_script = ("<script>window.__TIMBRE_PROFILES__="
+                   + _json.dumps(EXPLORER_PROFILES, separators=(",", ":")) + ";</script>")
+_explorer_page = CompressedAsset(_raw.replace("</head>", _profile_script + "</head>", 1),
+                                 "text/html; charset=utf-8", share_dir=_SHARED_ASSETS) if _raw else None
 
+
+# ── Hot reload ──────────────────────────────────────────────
+_reload_lock = threading.Lock()
+
+
+_DELTA_MAX_FRACTION = 0.2   # larger changes take the full rebuild path
+
+
+def _next_library(version, force=False):
+    """Apply small changes as a delta; rebuild from scratch for big ones."""
+    current = _app_lib.lib
+    if force:
+        return build_library(read_library_file(SONG_FEATURES_PATH), version=version)
+    new_df = read_library_file(SONG_FEATURES_PATH)
+    added, removed = diff_library(current, new_df)
+    if len(added) + len(removed) > _DELTA_MAX_FRACTION * max(len(current.song_data), 1):
+        return build_library(new_df, version=version)
+    print(f"[Timbre] Applying delta: {len(added)} added/changed, {len(removed)} removed")
+    return apply_library_delta(current, added, removed, version=version)
+
+
+def reload_library(force=False):
+    """Rebuild the library in the calling (background) thread, then swap it in.
+
+    Returns True if a new version was published. Requests in flight keep the
+    snapshot they already hold; the old one is freed once they finish.
+    """
+    global _app_lib
+    with _reload_lock:
+        try:
+            version = library_version(SONG_FEATURES_PATH)
+        except OSError as e:
+            print(f"[Timbre] Reload skipped: {e}")
+            return False
+        if not force and version == _app_lib.lib.version:
+            return False
+        print(f"[Timbre] Reloading library ({version}) …")
+        try:
+            # with TIMBRE_SHARED_DIR the first worker to see a version builds it, the rest attach
+            lib = shared_or_build(version, lambda: _next_library(version, force))
+            new_app_lib = build_app_library(lib, prev=_app_lib)
+        except Exception as e:
+            print(f"[Timbre] Reload failed, keeping {_app_lib.lib.version}: {e}")
+            return False
+        swap_library(new_app_lib.lib)
+        _app_lib = new_app_lib
+    _fragments.clear()
+    _rankings.clear()
+    gc.collect()
+    print(f"[Timbre] Library {version} live ({len(new_app_lib.lib.song_data)} songs)")
     threading.Thread(target=_fill_yt_cache_bg, daemon=True).start()
+    return True
+
+
+def refresh_explorer():
+    """Re-inject the Explorer payload (e.g. new YouTube IDs) for the current library."""
+    global _app_lib
+    with _reload_lock:
+        _app_lib = build_app_library(_app_lib.lib, prev=_app_lib)   # new generation
+
+
+def refresh_local_audio():
+    """Rescan the songs folders and republish local audio paths."""
+    global _app_lib
+    with _reload_lock:
+        cur = _app_lib
+        # a new generation: "local" / "playable" rankings are rebuilt from the new scan
+        _app_lib = build_app_library(cur.lib, prev=cur, local_audio=scan_local_audio(),
+                                     songs_asset=cur.songs_asset)
+    print(f"[Timbre] Local audio rescanned ({len(_app_lib.local_audio[1])} files)")
+
+
+def _watch_library(interval):
+    """Poll song_features.csv (reload once a new version has been stable for one tick)
+    and the songs folders (rescan local audio when a directory changes)."""
+    pending = None
+    while True:
+        time.sleep(interval)
+        try:
+            if _songs_dirs_token() != _app_lib.local_audio[0]:
+                refresh_local_audio()
+            version = library_version(SONG_FEATURES_PATH)
+            if version == _app_lib.lib.version:
+                pending = None
+            elif version != pending:
+                pending = version   # may still be mid-write — confirm next tick
+            else:
+                reload_library()
+                pending = None
+        except Exception as e:
+            print(f"[Timbre] Library watcher error: {e}")
+
+
+_RELOAD_INTERVAL = float(os.environ.get("TIMBRE_RELOAD_INTERVAL", "10"))
+_ADMIN_TOKEN = os.environ.get("TIMBRE_ADMIN_TOKEN", "")
 
 
-def get_local_audio_path(filename):
-    """取得本地音檔路徑（如果存在的話）"""
-    possible_paths = [
-        os.path.join("songs", filename),
-        os.path.join("..", "songs", filename)
-    ]
-    for p in possible_paths:
-        if os.path.exists(p):
-            return p
-    return None
+def admin_reload(token):
+    """Admin trigger (/call/reload_library) — only enabled when TIMBRE_ADMIN_TOKEN is set."""
+    if not _ADMIN_TOKEN or not hmac.compare_digest(str(token or ""), _ADMIN_TOKEN):
+        return "forbidden"
+    threading.Thread(target=reload_library, kwargs={"force": True}, daemon=True).start()
+    return "reload scheduled"
+
+
+# ── Background thread: fill missing YouTube IDs and save cache ──
+_yt_fill_lock = threading.Lock()
+
+
+def _fill_yt_cache_bg():
+    if not _yt_fill_lock.acquire(blocking=False):
+        return  # a fill pass is already running
+    try:
+        _fill_yt_cache()
+    finally:
+        _yt_fill_lock.release()
+
+
+def _fill_yt_cache():
+    missing = [str(t) for t in _app_lib.lib.song_data["title"] if str(t) not in _yt_cache]
+    stale = _yt_store.stale(_YT_REVALIDATE_AGE) if _YT_REVALIDATE_AGE > 0 else []
+    futures = yt_resolver.warm(missing, refresh=stale)
+    if not futures:
+        return
+    print(f"[Timbre] BG: resolving {len(futures) - len(stale)} missing / "
+          f"revalidating {len(stale)} YouTube IDs (rate-limited) …")
+
+    updated = 0
+    for fut in as_completed(futures):
+        if not fut.cancelled() and fut.result():
+            updated += 1
+            if updated % 500 == 0:
+                refresh_explorer()
+
+    print(f"[Timbre] BG: warm-up done — {updated} resolved, {len(_yt_misses)} negative-cached")
+    if updated:
+        refresh_explorer()
+
+
+def _yt_store_compactor(interval=6 * 3600):
+    """Drop expired misses and checkpoint the WAL every few hours."""
+    while True:
+        time.sleep(interval)
+        try:
+            removed = _yt_store.compact()
+            print(f"[Timbre] YT cache compacted ({removed} expired misses dropped)")
+        except Exception as e:
+            print(f"[Timbre] YT cache compaction failed: {e}")
+
+
+def _explorer_iframe_html():
+    """Explorer tab content for the snapshot that is live right now."""
+    if _explorer_page is None:
+        return (
+            '<p style="color:#ccc; text-align:center; padding:40px;">'
+            '⚠️ Emotion Explorer could not be loaded. Please use the 📝 Text Search tab.</p>'
+        )
+    return (
+        '<iframe src="/explorer/"'
+        ' sandbox="allow-scripts allow-same-origin allow-popups allow-popups-to-escape-sandbox"'
+        ' style="width:100%; height:82vh; border:none; border-radius:10px; display:block;"'
+        ' title="Emotion Explorer"></iframe>'
+    )
 
 
 # ── i18n 翻譯字典 ───────────────────────────────────────────
@@ -205,6 +480,7 @@ I18N = {
         "sug_space": "注意留白與空間感，不要過度編曲",
         "sug_free": "依照業主情緒描述自由發揮",
         "search_yt": "在 YouTube 搜尋",
+        "finding_player": "正在尋找播放來源…",
     },
     "en": {
         "title": "🎵 Timbre Audio-to-Brief Engine",
@@ -246,6 +522,7 @@ I18N = {
         "sug_space": "Leave space and air in the arrangement, avoid over-producing",
         "sug_free": "Follow the client's mood description freely",
         "search_yt": "Search on YouTube",
+        "finding_player": "Finding a player…",
     },
 }
 
@@ -256,49 +533,67 @@ def t(key, lang="en"):
 
 
 # ── YouTube 搜尋與嵌入 ──────────────────────────────────────
-from ytmusicapi import YTMusic
-ytmusic = YTMusic()
+def _on_yt_resolved(title, video_id):
+    _yt_store.put(title, video_id)
+    snap = _app_lib
+    if title in snap.song_meta:     # keep the current version's column (and filters) current
+        snap.add_youtube_id(title, video_id)
+
+
+def _on_yt_miss(title, expires_at):
+    _yt_store.put_miss(title, expires_at)
+
+
+# Requests never wait on the network longer than this (seconds, for the whole batch);
+# anything slower shows the search link now and is cached for next time.
+_YT_DEADLINE = float(os.environ.get("TIMBRE_YT_DEADLINE", "0.3"))
+# Streamed responses show the ranked list first, so players may take longer to arrive
+_YT_STREAM_DEADLINE = float(os.environ.get("TIMBRE_YT_STREAM_DEADLINE", "10"))
+yt_resolver = YTResolver(
+    make_backends(os.environ.get("TIMBRE_YT_BACKENDS", "ytmusic,duckduckgo,youtube")),
+    _yt_cache, negative=_yt_misses, workers=4,
+    on_resolved=_on_yt_resolved, on_miss=_on_yt_miss,
+)
+
+
+# ── Compute executor ────────────────────────────────────────
+# Handlers are async: they await YouTube lookups (which run on the resolver's
+# own I/O pool) and push encoder inference / scoring onto this sized pool, so a
+# slow lookup never holds a thread that a CPU-bound request needs.
+_COMPUTE_WORKERS = int(os.environ.get("TIMBRE_COMPUTE_WORKERS", str(min(4, os.cpu_count() or 1))))
+_compute_pool = ThreadPoolExecutor(max_workers=_COMPUTE_WORKERS, thread_name_prefix="compute")
+
+
+async def _compute(fn, *args, **kwargs):
+    """Run CPU-bound work (encode, score) on the compute pool."""
+    return await asyncio.get_running_loop().run_in_executor(_compute_pool, partial(fn, *args, **kwargs))
+
 
 def get_youtube_video_id(query):
-    """取得 YouTube Video ID，使用三重 Fallback 機制確保能在 HF Spaces 成功"""
-    # 1. ytmusicapi (YouTube Music 原生搜尋，包含官方 MV 與純音軌，極低廣告干擾)
-    try:
-        results = ytmusic.search(query)
-        for r in results:
-            if 'videoId' in r and r['videoId']:
-                return r['videoId']
-    except Exception as e:
-        print(f"  [Fallback 1 Failed] ytmusicapi: {e}")
-
-    # 2. DuckDuckGo Search (穩定的網頁抓取)
-    try:
-        encoded = urllib.parse.quote('site:youtube.com/watch ' + query)
-        req = urllib.request.Request(
-            f'https://html.duckduckgo.com/html/?q={encoded}', 
-            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        )
-        html = urllib.request.urlopen(req, timeout=5).read().decode('utf-8')
-        match = re.search(r'v=([a-zA-Z0-9_-]{11})', html)
-        if match:
-            return match.group(1)
-    except Exception as e:
-        print(f"  [Fallback 2 Failed] DuckDuckGo: {e}")
-
-    # 3. YouTube Search HTML (最易受廣告干擾)
-    try:
-        encoded = urllib.parse.quote(query)
-        req = urllib.request.Request(
-            f"https://www.youtube.com/results?search_query={encoded}", 
-            headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-        )
-        html = urllib.request.urlopen(req, timeout=5).read().decode("utf-8")
-        match = re.search(r'"videoId":"([a-zA-Z0-9_-]{11})"', html)
-        if match:
-            return match.group(1)
-    except Exception as e:
-        print(f"  [Fallback 3 Failed] YouTube HTML: {e}")
+    """取得 YouTube Video ID（ytmusicapi → DuckDuckGo → YouTube HTML，經 rate limit / 負快取）"""
+    return yt_resolver.lookup(query)
+
+
+async def _stream_video_ids(results, snap, deadline=_YT_STREAM_DEADLINE):
+    """Async-yield (video_ids, pending) for the results without local audio: the
+    known IDs (snap.youtube_ids) first, then once per lookup that lands
+    (see YTResolver.resolve_progressively)."""
+    titles = [r["title"] for r in results if not snap.song_meta[r["title"]][2]]
+    known = {title: snap.youtube_ids[title] for title in titles if title in snap.youtube_ids}
+    missing = [title for title in titles if title not in known]
+    if not missing:
+        yield known, set()
+        return
+    async for video_ids, pending in yt_resolver.resolve_progressively(missing, deadline):
+        yield {**known, **video_ids}, pending
 
-    return None
+
+async def _video_ids_for(results, snap):
+    """YouTube IDs for the results that have no local audio, bounded by _YT_DEADLINE."""
+    video_ids = {}
+    async for video_ids, _ in _stream_video_ids(results, snap, _YT_DEADLINE):
+        pass
+    return video_ids
 
 
 def get_youtube_search_url(title):
@@ -331,6 +626,14 @@ def build_player_html(title, video_id, lang="zh"):
         </div>'''
 
 
+def build_pending_player_html(lang="zh"):
+    """播放器尚未就緒時的佔位（串流回應中，查到後會被替換）"""
+    return f'''
+        <div style="margin: 8px 0; color:#888; font-size:14px;">
+            ⏳ {t("finding_player", lang)}
+        </div>'''
+
+
 # ── CSS ─────────────────────────────────────────────────────
 CARD_STYLE = """
 <style>
@@ -406,32 +709,41 @@ CARD_STYLE = """
 
 
 
-def recommend_for_client(mood, lang):
-    """業主版：推薦音樂 + 嵌入式 YouTube 播放器 / 本地播放器"""
-    if not mood.strip():
-        return f"<p>{t('empty_input', lang)}</p>"
+# ── Rendered fragment cache ─────────────────────────────────
+# Keys include the library version and player state, so a reload or a newly
+# resolved YouTube ID simply misses; reload_library() also clears it.
+_fragments = FragmentCache(int(os.environ.get("TIMBRE_FRAGMENT_CACHE", "4096")))
 
-    results = recommend(mood, top_k=3, return_results=True)
 
-    html = CARD_STYLE
-    html += f"<h2 style='color:#212529;'>{t('client_header', lang)}</h2>"
+def _card_fragment(snap, title, lang, video_ids, pending=()):
+    """(escaped title + language tag, player HTML) for one track."""
+    flag, lang_name, local_path = snap.song_meta[title]
+    waiting = not local_path and title in pending
+    video_id = None if local_path or waiting else video_ids.get(title)
 
-    for i, r in enumerate(results):
-        title = r["title"]
-        filename = r["filename"]
-        local_path = get_local_audio_path(filename)
-        flag, lang_name = detect_language(title)
+    def render():
         lang_tag = f'<span style="display:inline-block;margin-left:10px;padding:2px 8px;background:rgba(0,0,0,0.06);border-radius:12px;font-size:12px;font-weight:400;color:#555;">{flag} {lang_name}</span>'
         if local_path:
             player = f'<div style="margin: 8px 0;"><audio controls src="file={local_path}" style="width:100%"></audio></div>'
+        elif waiting:
+            player = build_pending_player_html(lang)
         else:
-            video_id = _yt_cache.get(title) or get_youtube_video_id(title)
             player = build_player_html(title, video_id, lang)
+        return html_lib.escape(title) + lang_tag, player
+
+    key = ("card", snap.lib.version, title, lang, local_path, waiting, video_id)
+    return _fragments.get_or_render(key, render)
 
-        safe_title = html_lib.escape(title)
+
+def _client_html(snap, results, lang, video_ids, pending=()):
+    html = CARD_STYLE
+    html += f"<h2 style='color:#212529;'>{t('client_header', lang)}</h2>"
+
+    for i, r in enumerate(results):
+        head, player = _card_fragment(snap, r["title"], lang, video_ids, pending)
         html += f'''
         <div class="song-card">
-            <h3>{i+1}. {safe_title}{lang_tag}</h3>
+            <h3>{i+1}. {head}</h3>
             {player}
         </div>'''
 
@@ -440,126 +752,137 @@ def recommend_for_client(mood, lang):
     return html
 
 
+def _recommend(snap, mood, top_k):
+    """recommend() against one snapshot (ranking cached per emotion and library version)."""
+    best, _ = detect_emotions_semantic([mood])[0]
+    return snap.ranked(best, top_k)
+
+
+async def recommend_for_client(mood, lang):
+    """業主版：推薦音樂 + 嵌入式 YouTube 播放器 / 本地播放器
+
+    Streams: the ranked list goes out right after ranking, and each player
+    is filled in as its YouTube lookup lands.
+    """
+    if not mood.strip():
+        yield f"<p>{t('empty_input', lang)}</p>"
+        return
+
+    snap = _app_lib
+    results = await _compute(_recommend, snap, mood, 3)
+    async for video_ids, pending in _stream_video_ids(results, snap):
+        yield _client_html(snap, results, lang, video_ids, pending)
+
+
 # ── 聲學規格建議 ────────────────────────────────────────────
-def generate_acoustic_brief_html(avg, lang):
-    """根據平均聲學特徵自動產生聲學規格建議（HTML 版）"""
+def acoustic_brief(avg):
+    """根據平均聲學特徵產生聲學規格建議 — structured, as I18N keys (no rendering)"""
 
     # 速度
     bpm = avg['bpm']
     if bpm < 80:
-        tempo_desc = t("slow", lang)
+        tempo = "slow"
     elif bpm < 110:
-        tempo_desc = t("moderate", lang)
+        tempo = "moderate"
     elif bpm < 140:
-        tempo_desc = t("fast", lang)
+        tempo = "fast"
     else:
-        tempo_desc = t("very_fast", lang)
+        tempo = "very_fast"
 
     # 能量
     arousal = avg['arousal']
     if arousal < 3.5:
-        energy_desc = t("energy_low", lang)
+        energy = "energy_low"
     elif arousal < 5.5:
-        energy_desc = t("energy_med", lang)
+        energy = "energy_med"
     elif arousal < 7:
-        energy_desc = t("energy_high", lang)
+        energy = "energy_high"
     else:
-        energy_desc = t("energy_max", lang)
+        energy = "energy_max"
 
     # 情緒色彩
     valence = avg['valence']
     if valence < 3:
-        valence_desc = t("tone_dark", lang)
+        tone = "tone_dark"
     elif valence < 5:
-        valence_desc = t("tone_neutral", lang)
+        tone = "tone_neutral"
     elif valence < 7:
-        valence_desc = t("tone_bright", lang)
+        tone = "tone_bright"
     else:
-        valence_desc = t("tone_very_bright", lang)
+        tone = "tone_very_bright"
 
     # 風格標籤
     mood_tags = []
     if avg['mood_happy'] > 0.4:
-        mood_tags.append(t("tag_happy", lang))
+        mood_tags.append("tag_happy")
     if avg['mood_sad'] > 0.4:
-        mood_tags.append(t("tag_sad", lang))
+        mood_tags.append("tag_sad")
     if avg['mood_aggressive'] > 0.3:
-        mood_tags.append(t("tag_aggressive", lang))
+        mood_tags.append("tag_aggressive")
     if avg['mood_relaxed'] > 0.4:
-        mood_tags.append(t("tag_relaxed", lang))
+        mood_tags.append("tag_relaxed")
     if avg['mood_party'] > 0.4:
-        mood_tags.append(t("tag_party", lang))
+        mood_tags.append("tag_party")
     if avg['danceability'] > 0.6:
-        mood_tags.append(t("tag_groovy", lang))
+        mood_tags.append("tag_groovy")
     if not mood_tags:
-        mood_tags.append(t("tag_neutral", lang))
+        mood_tags.append("tag_neutral")
 
     # 製作建議
     suggestions = []
     if avg['danceability'] > 0.6:
-        suggestions.append(t("sug_groove", lang))
+        suggestions.append("sug_groove")
     if avg['mood_relaxed'] > 0.5 and arousal < 4:
-        suggestions.append(t("sug_soft", lang))
+        suggestions.append("sug_soft")
     if avg['mood_aggressive'] > 0.3 and arousal > 5:
-        suggestions.append(t("sug_distortion", lang))
+        suggestions.append("sug_distortion")
     if avg['mood_sad'] > 0.4 and valence < 4:
-        suggestions.append(t("sug_minor", lang))
+        suggestions.append("sug_minor")
     if avg['mood_happy'] > 0.5 and valence > 5:
-        suggestions.append(t("sug_major", lang))
+        suggestions.append("sug_major")
     if avg['mood_party'] > 0.4 and avg['danceability'] > 0.5:
-        suggestions.append(t("sug_synth", lang))
+        suggestions.append("sug_synth")
     if arousal < 3:
-        suggestions.append(t("sug_space", lang))
+        suggestions.append("sug_space")
     if not suggestions:
-        suggestions.append(t("sug_free", lang))
+        suggestions.append("sug_free")
+
+    return {
+        "bpm": float(bpm), "tempo": tempo,
+        "arousal": float(arousal), "energy": energy,
+        "valence": float(valence), "tone": tone,
+        "tags": mood_tags,
+        "suggestions": suggestions[:5],
+    }
+
+
+def generate_acoustic_brief_html(avg, lang):
+    """根據平均聲學特徵自動產生聲學規格建議（HTML 版）"""
+    b = acoustic_brief(avg)
+    tags = " / ".join(t(k, lang) for k in b["tags"])
 
     html = ""
-    html += f'<div class="spec-line">{t("tempo_label", lang)}：~{bpm:.0f} BPM（{tempo_desc}）</div>'
-    html += f'<div class="spec-line">{t("energy_label", lang)}：{energy_desc}（arousal {arousal:.1f}/9）</div>'
-    html += f'<div class="spec-line">{t("tone_label", lang)}：{valence_desc}（valence {valence:.1f}/9）</div>'
-    html += f'<div class="spec-line">{t("tags_label", lang)}：{" / ".join(mood_tags)}</div>'
+    html += f'<div class="spec-line">{t("tempo_label", lang)}：~{b["bpm"]:.0f} BPM（{t(b["tempo"], lang)}）</div>'
+    html += f'<div class="spec-line">{t("energy_label", lang)}：{t(b["energy"], lang)}（arousal {b["arousal"]:.1f}/9）</div>'
+    html += f'<div class="spec-line">{t("tone_label", lang)}：{t(b["tone"], lang)}（valence {b["valence"]:.1f}/9）</div>'
+    html += f'<div class="spec-line">{t("tags_label", lang)}：{tags}</div>'
 
     html += f'<div class="spec-line" style="margin-top:12px;"><strong>{t("production_label", lang)}：</strong></div>'
-    for i, s in enumerate(suggestions[:5]):
-        html += f'<div class="suggestion-item">• {s}</div>'
+    for key in b["suggestions"]:
+        html += f'<div class="suggestion-item">• {t(key, lang)}</div>'
 
     return html
 
 
-def recommend_for_musician(mood, lang):
-    """音樂人版：嵌入式播放器 + 聲學參數 + 規格書"""
-    if not mood.strip():
-        return f"<p>{t('empty_input', lang)}</p>"
-
-    results = recommend(mood, top_k=3, return_results=True)
-
-    html = CARD_STYLE
-    html += f"<h2 style='color:#212529;'>{t('musician_header', lang)}</h2>"
-    feature_rows = []
-
-    for i, r in enumerate(results):
-        title = r["title"]
-        filename = r["filename"]
-        score = r["score"]
-        feat = r["features"]
-
-        flag, lang_name = detect_language(title)
-        lang_tag = f'<span style="display:inline-block;margin-left:10px;padding:2px 8px;background:rgba(0,0,0,0.06);border-radius:12px;font-size:12px;font-weight:400;color:#555;">{flag} {lang_name}</span>'
-        local_path = get_local_audio_path(filename)
-        if local_path:
-            player = f'<div style="margin: 8px 0;"><audio controls src="file={local_path}" style="width:100%"></audio></div>'
-        else:
-            video_id = _yt_cache.get(title) or get_youtube_video_id(title)
-            player = build_player_html(title, video_id, lang)
+def _average_features(results):
+    """Mean features of a result set, independent of rank order."""
+    rows = [r["features"] for r in sorted(results, key=lambda r: r["title"])]
+    return pd.DataFrame(rows).mean()
 
-        safe_title = html_lib.escape(title)
-        html += f'<div class="song-card">'
-        html += f'<h3>{i+1}. {safe_title}{lang_tag}</h3>'
-        html += f'<div class="score">{t("similarity", lang)}：{score:.3f}</div>'
-        html += player
 
-        feature_rows.append(feat)
-        html += f'''
+def _feature_detail_fragment(snap, title, feat):
+    def render():
+        return f'''
             <div class="feat-detail">
                 BPM：{feat["bpm"]:.0f} &nbsp;│&nbsp;
                 Valence：{feat["valence"]:.2f} &nbsp;│&nbsp;
@@ -572,13 +895,17 @@ def recommend_for_musician(mood, lang):
                 Party {feat["mood_party"]:.2f}<br>
                 Danceability：{feat["danceability"]:.2f}
             </div>'''
-        html += '</div>'
 
-    # 聲學規格書
-    if feature_rows:
-        avg = pd.DataFrame(feature_rows).mean()
+    return _fragments.get_or_render(("feat", snap.lib.version, title), render)
 
-        html += f'''
+
+def _brief_fragment(snap, results, lang):
+    """Acoustic brief for a result set — the average doesn't depend on rank order."""
+    titles = tuple(sorted(r["title"] for r in results))
+
+    def render():
+        avg = _average_features(results)
+        return f'''
         <div class="spec-section">
             <h2>{t("spec_title", lang)}</h2>
             <div style="color:#888; font-size:12px; margin-bottom:12px;">
@@ -586,10 +913,58 @@ def recommend_for_musician(mood, lang):
             </div>
             {generate_acoustic_brief_html(avg, lang)}
         </div>'''
+
+    return _fragments.get_or_render(("brief", snap.lib.version, titles, lang), render)
+
+
+def _musician_html(snap, results, lang, video_ids, pending=(), brief=True):
+    html = CARD_STYLE
+    html += f"<h2 style='color:#212529;'>{t('musician_header', lang)}</h2>"
+
+    for i, r in enumerate(results):
+        head, player = _card_fragment(snap, r["title"], lang, video_ids, pending)
+        html += f'<div class="song-card">'
+        html += f'<h3>{i+1}. {head}</h3>'
+        html += f'<div class="score">{t("similarity", lang)}：{r["score"]:.3f}</div>'
+        html += player
+        html += _feature_detail_fragment(snap, r["title"], r["features"])
+        html += '</div>'
+
+    # 聲學規格書
+    if brief and results:
+        html += _brief_fragment(snap, results, lang)
     html += '</div>'
     return html
 
 
+async def recommend_for_musician(mood, lang):
+    """音樂人版：嵌入式播放器 + 聲學參數 + 規格書
+
+    Streams: ranked tracks with their features first, then the acoustic
+    brief, then each player as its YouTube lookup lands.
+    """
+    if not mood.strip():
+        yield f"<p>{t('empty_input', lang)}</p>"
+        return
+
+    snap = _app_lib
+    results = await _compute(_recommend, snap, mood, 3)
+    stream = _stream_video_ids(results, snap)
+    video_ids, pending = await anext(stream)
+    yield _musician_html(snap, results, lang, video_ids, pending, brief=False)
+    yield _musician_html(snap, results, lang, video_ids, pending)
+    async for video_ids, pending in stream:
+        yield _musician_html(snap, results, lang, video_ids, pending)
+
+
+# ── Background workers (started once everything above is defined) ──
+if _raw:
+    threading.Thread(target=_fill_yt_cache_bg, daemon=True).start()
+threading.Thread(target=_yt_store_compactor, daemon=True).start()
+if _RELOAD_INTERVAL > 0:
+    threading.Thread(target=_watch_library, args=(_RELOAD_INTERVAL,), daemon=True).start()
+
+
 # ── Gradio 介面 ─────────────────────────────────────────────
 with gr.Blocks(title="Timbre Audio-to-Brief Engine") as demo:
 
@@ -597,18 +972,10 @@ with gr.Blocks(title="Timbre Audio-to-Brief Engine") as demo:
 
         # ── Tab 1: Emotion Explorer (interactive bubble UI) ──────────
         with gr.Tab("🌌 Emotion Explorer"):
-            if _EMOTION_UI_SRCDOC:
-                gr.HTML(
-                    f'<iframe srcdoc="{_EMOTION_UI_SRCDOC}"'
-                    ' sandbox="allow-scripts allow-same-origin allow-popups allow-popups-to-escape-sandbox"'
-' style="width:100%; height:82vh; border:none; border-radius:10px; display:block;"'
-                    ' title="Emotion Explorer"></iframe>'
-                )
-            else:
-                gr.HTML(
-                    '<p style="color:#ccc; text-align:center; padding:40px;">'
-                    '⚠️ Emotion Explorer could not be loaded. Please use the 📝 Text Search tab.</p>'
-                )
+            # Filled on page load so a hot-reloaded library reaches new visitors
+            explorer_html = gr.HTML(
+                '<p style="color:#888; text-align:center; padding:40px;">Loading Emotion Explorer…</p>'
+            )
 
         # ── Tab 2: Text Search (original text-based interface) ───────
         with gr.Tab("📝 Text Search"):
@@ -670,13 +1037,331 @@ with gr.Blocks(title="Timbre Audio-to-Brief Engine") as demo:
                 inputs=[mood_input, lang_state],
                 outputs=outputs,
                 api_name="recommend_client",
+                show_progress="minimal",   # streamed: placeholders already show what's pending
             )
             musician_btn.click(
                 fn=recommend_for_musician,
                 inputs=[mood_input, lang_state],
                 outputs=outputs,
                 api_name="recommend_musician",
+                show_progress="minimal",
             )
 
+    # Admin-only hot reload trigger (hidden; see admin_reload)
+    admin_token = gr.Textbox(visible=False)
+    admin_status = gr.Textbox(visible=False)
+    admin_btn = gr.Button(visible=False)
+    admin_btn.click(fn=admin_reload, inputs=[admin_token], outputs=[admin_status],
+                    api_name="reload_library")
+
+    demo.load(fn=_explorer_iframe_html, outputs=[explorer_html], api_name=False)
+
+# Explicit queue limits per deployment: events running at once per handler, and
+# how many may wait before new ones are rejected. The text-search handlers are
+# async, so concurrency is cheap; CPU work is bounded by TIMBRE_COMPUTE_WORKERS.
+demo.queue(
+    default_concurrency_limit=int(os.environ.get("TIMBRE_CONCURRENCY", "16")),
+    max_size=int(os.environ.get("TIMBRE_QUEUE_SIZE", "128")),
+)
+
+
+# ── HTTP server: Explorer assets + Gradio ───────────────────
+# The Explorer page and its song payload are separate, precompressed,
+# ETag-cached responses; the page fetches songs.bin asynchronously.
+server = FastAPI()
+
+
+@server.get("/explorer/")
+def explorer_page(request: Request):
+    if _explorer_page is None:
+        return Response(status_code=404)
+    return asset_response(request, _explorer_page)
+
+
+@server.get("/explorer/songs.bin")
+def explorer_songs(request: Request):
+    asset = _app_lib.songs_asset   # one snapshot per response
+    if asset is None:
+        return Response(status_code=404)
+    return asset_response(request, asset)
+
+
+@server.get("/metrics/fragments")
+def fragment_metrics():
+    """Hit / miss counters of the rendered-fragment cache."""
+    return _fragments.stats()
+
+
+@server.get("/metrics/rankings")
+def ranking_metrics():
+    """Hit / miss counters of the ranked-index cache behind paging."""
+    return _rankings.stats()
+
+
+# ── JSON API (/api/v1) ──────────────────────────────────────
+# Machine-facing twin of the text-search modes: structured results straight from
+# recommend_v2, no HTML. Each endpoint takes one query object or {"queries": [...]};
+# a batch is embedded in one encoder call and ranked against one library snapshot.
+# Ranked lists are paged with opaque cursors (next_cursor → {"cursor": ...}).
+_API_MAX_BATCH = int(os.environ.get("TIMBRE_API_MAX_BATCH", "64"))
+_API_MAX_TOP_K = 50
+
+
+class Filters(BaseModel):
+    """Constraints applied before ranking (prefilter.py); a list means any of its values."""
+    bpm_min: float | None = None
+    bpm_max: float | None = None
+    languages: list[str] = []        # as in results' "language": "Japanese", "English", …
+    emotions: list[str] = []         # library emotion labels
+    available: Literal["local", "youtube", "playable"] | None = None
+
+    def key(self):
+        """Canonical hashable form, or None when nothing is constrained."""
+        key = (self.bpm_min, self.bpm_max, tuple(sorted({x.lower() for x in self.languages})),
+               tuple(sorted(set(self.emotions))), self.available)
+        return None if key == (None, None, (), (), None) else key
+
+
+def _filter_key(filters):
+    return filters.key() if filters else None
+
+
+# Surrounding whitespace is dropped; a mood with nothing left is a 422, not a query.
+MoodText = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+class MoodQuery(BaseModel):
+    mood: MoodText | None = None
+    cursor: str | None = None        # a previous page's next_cursor, instead of mood
+    top_k: int = Field(3, ge=1, le=_API_MAX_TOP_K)
+    filters: Filters | None = None
+
+
+class MoodBatch(BaseModel):
+    queries: list[MoodQuery] = Field(min_length=1, max_length=_API_MAX_BATCH)
+
+
+class BriefQuery(BaseModel):
+    mood: MoodText | None = None     # rank first, then brief the top_k tracks …
+    titles: list[str] | None = None  # … or brief these tracks directly
+    top_k: int = Field(3, ge=1, le=_API_MAX_TOP_K)
+    lang: str | None = None          # "en" / "zh": add localized text next to the keys
+    filters: Filters | None = None   # with mood: brief the top tracks that pass these
+
+
+class BriefBatch(BaseModel):
+    queries: list[BriefQuery] = Field(min_length=1, max_length=_API_MAX_BATCH)
+
+
+class SimilarQuery(BaseModel):
+    title: str | None = None                 # seed track …
+    target: dict[str, float] | None = None   # … or {feature: value in raw units}, e.g. {"bpm": 120}
+    emotion: str | None = None               # rank this emotion's tracks first, then its neighbours
+    top_k: int = Field(5, ge=1, le=_API_MAX_TOP_K)
+
+
+class SimilarBatch(BaseModel):
+    queries: list[SimilarQuery] = Field(min_length=1, max_length=_API_MAX_BATCH)
+
+
+class ExplorerTopQuery(BaseModel):
+    emotion: str | None = None       # Explorer key: "joy", "calm+sadness", … (or a cursor)
+    cursor: str | None = None
+    top_k: int = Field(25, ge=1, le=_API_MAX_TOP_K)
+
+
+def _api_queries(body):
+    """(queries, is_batch) for a single-or-batch request body."""
+    queries = getattr(body, "queries", None)
+    return (queries, True) if queries is not None else ([body], False)
+
+
+def _api_reply(snap, items, batch):
+    if batch:
+        return {"version": snap.lib.version, "results": items}
+    return {"version": snap.lib.version, **items[0]}
+
+
+def _next_cursor(snap, kind, key, offset, size, filters=None):
+    """Opaque cursor for the page after [offset, offset + size), or None at the end."""
+    generation = snap.ranking_generation(_filter_key(filters))
+    order, _ = snap.ranking(kind, key, _filter_key(filters))
+    if offset + size >= len(order):
+        return None
+    return encode_cursor(snap.lib.version, generation, kind, key, offset + size, size,
+                         filters.model_dump(exclude_defaults=True) if filters else None)
+
+
+def _open_cursor(snap, cursor, kind):
+    """cursor → (key, offset, size, filters); 400 if it isn't one of ours, 410 once the library
+    or, for an availability-filtered list, its generation moved on."""
+    keys = EMOTION_ORDER if kind == "mood" else EXPLORER_PROFILES
+    try:
+        version, generation, key, offset, size, filters = decode_cursor(cursor, kind, keys, _API_MAX_TOP_K)
+        filters = Filters.model_validate(filters) if filters else None
+    except ValueError:   # pydantic's ValidationError included
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if version != snap.lib.version:
+        raise HTTPException(status_code=410, detail="cursor expired: the library was reloaded")
+    if generation != snap.ranking_generation(_filter_key(filters)):
+        raise HTTPException(status_code=410, detail="cursor expired: available tracks changed")
+    return key, offset, size, filters
+
+
+def _rank_moods(snap, queries):
+    """[(emotion, emotion_score, results)] — one encoder call for the whole batch."""
+    detected = detect_emotions_semantic([q.mood for q in queries])
+    return [(best, scores[best], snap.ranked(best, q.top_k, filters=_filter_key(q.filters)))
+            for q, (best, scores) in zip(queries, detected)]
+
+
+async def _api_tracks(snap, result_lists):
+    """Result lists → track dicts, with one bounded YouTube lookup for the whole batch."""
+    video_ids = await _video_ids_for([r for rs in result_lists for r in rs], snap)
+    tracks = []
+    for rs in result_lists:
+        tracks.append([])
+        for r in rs:
+            _, lang_name, local_path = snap.song_meta[r["title"]]
+            tracks[-1].append({
+                "title": r["title"],
+                "score": r["score"],
+                "emotion": r["emotion"],
+                "language": lang_name,
+                "local_audio": local_path or None,
+                "youtube_id": None if local_path else video_ids.get(r["title"]),
+                "features": r["features"],
+            })
+    return tracks
+
+
+def _brief_payload(results, lang=None):
+    brief = acoustic_brief(_average_features(results))
+    if lang:
+        brief["text"] = {
+            k: [t(v, lang) for v in brief[k]] if isinstance(brief[k], list) else t(brief[k], lang)
+            for k in ("tempo", "energy", "tone", "tags", "suggestions")
+        }
+    return brief
+
+
+def _feature_rows(snap, titles):
+    """Results-shaped dicts ({"title", "features"}) for known titles, plus the unknown ones."""
+    df = snap.lib.song_data
+    rows = df[df["title"].isin(titles)].drop_duplicates("title")
+    found = {row["title"]: {"title": row["title"], "features": {c: float(row[c]) for c in RESULT_FEATURES}}
+             for _, row in rows.iterrows()}
+    return [found[x] for x in dict.fromkeys(titles) if x in found], [x for x in titles if x not in found]
+
+
+def _recommend_pages(snap, queries):
+    """[(emotion, emotion_score, results, next cursor)] — new moods share one encoder call,
+    cursor pages are slices of the cached ranking (their emotion_score is None)."""
+    fresh = [q for q in queries if q.mood]
+    ranked = iter(_rank_moods(snap, fresh) if fresh else [])
+    pages = []
+    for q in queries:
+        if q.mood:
+            emotion, score, results = next(ranked)
+            offset, size, filters = 0, q.top_k, q.filters
+        else:
+            emotion, offset, size, filters = _open_cursor(snap, q.cursor, "mood")
+            score, results = None, snap.ranked(emotion, size, offset, _filter_key(filters))
+        pages.append((emotion, score, results, _next_cursor(snap, "mood", emotion, offset, size, filters)))
+    return pages
+
+
+@server.post("/api/v1/recommend")
+async def api_recommend(body: MoodQuery | MoodBatch):
+    """Top tracks per mood description (same ranking as the Client / Musician modes)."""
+    snap = _app_lib
+    queries, batch = _api_queries(body)
+    if any(bool(q.mood) == bool(q.cursor) for q in queries):
+        raise HTTPException(status_code=422, detail="each query needs exactly one of mood / cursor")
+    pages = await _compute(_recommend_pages, snap, queries)
+    tracks = await _api_tracks(snap, [results for _, _, results, _ in pages])
+    items = [{"mood": q.mood, "emotion": emotion, "emotion_score": score, "tracks": tr, "next_cursor": cursor}
+             for q, (emotion, score, _, cursor), tr in zip(queries, pages, tracks)]
+    return _api_reply(snap, items, batch)
+
+
+@server.post("/api/v1/brief")
+async def api_brief(body: BriefQuery | BriefBatch):
+    """Acoustic spec brief for a mood (its top_k tracks) or for an explicit track list."""
+    snap = _app_lib
+    queries, batch = _api_queries(body)
+    if any(bool(q.mood) == bool(q.titles) for q in queries):
+        raise HTTPException(status_code=422, detail="each query needs exactly one of mood / titles")
+    return _api_reply(snap, await _compute(_brief_items, snap, queries), batch)
+
+
+def _brief_items(snap, queries):
+    mood_queries = [q for q in queries if q.mood]
+    ranked = iter(_rank_moods(snap, mood_queries) if mood_queries else [])
+    items = []
+    for q in queries:
+        if q.mood:
+            emotion, score, results = next(ranked)
+            item = {"mood": q.mood, "emotion": emotion, "emotion_score": score}
+        else:
+            results, unknown = _feature_rows(snap, q.titles)
+            item = {"unknown_titles": unknown}
+        item["tracks"] = [r["title"] for r in results]
+        item["brief"] = _brief_payload(results, q.lang) if results else None
+        items.append(item)
+    return items
+
+
+@server.post("/api/v1/similar")
+async def api_similar(body: SimilarQuery | SimilarBatch):
+    """Nearest tracks to a library track or to a target feature vector (KD-tree, see feature_index.py)."""
+    snap = _app_lib
+    queries, batch = _api_queries(body)
+    for q in queries:
+        if (q.title is None) == (q.target is None):
+            raise HTTPException(status_code=422, detail="need exactly one of title / target")
+        if q.emotion is not None and q.emotion not in EMOTION_ORDER:
+            raise HTTPException(status_code=422, detail=f"unknown emotion: {q.emotion}")
+
+    def nearest():
+        return [nearest_songs(q.target, q.title, q.top_k, q.emotion, snap.lib) for q in queries]
+    try:
+        found = await _compute(nearest)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not batch and found[0] is None:
+        raise HTTPException(status_code=404, detail=f"unknown title: {body.title}")
+    tracks = await _api_tracks(snap, [results or [] for results in found])
+    items = []
+    for q, results, tr in zip(queries, found, tracks):
+        item = {"title": q.title} if q.title is not None else {"target": q.target}
+        if q.emotion:
+            item["emotion"] = q.emotion
+        item.update({"tracks": tr} if results is not None else {"error": "unknown title"})
+        items.append(item)
+    return _api_reply(snap, items, batch)
+
+
+@server.post("/api/v1/explorer/top")
+async def api_explorer_top(body: ExplorerTopQuery):
+    """The Explorer's findTopSongs, scored here — same songs, same order as the page."""
+    snap = _app_lib
+    if bool(body.emotion) == bool(body.cursor):
+        raise HTTPException(status_code=422, detail="need exactly one of emotion / cursor")
+    if body.cursor:
+        key, offset, size, _ = _open_cursor(snap, body.cursor, "explorer")
+    elif body.emotion in EXPLORER_PROFILES:
+        key, offset, size = body.emotion, 0, body.top_k
+    else:
+        raise HTTPException(status_code=422, detail=f"unknown Explorer emotion: {body.emotion}")
+    songs = await _compute(snap.explorer_songs, key, size, offset)
+    return {"version": snap.lib.version, "emotion": key, "songs": songs,
+            "next_cursor": _next_cursor(snap, "explorer", key, offset, size)}
+
+
+app = gr.mount_gradio_app(server, demo, path="/", allowed_paths=["songs", "../songs"])
 
-demo.launch(server_name="0.0.0.0", server_port=7860, allowed_paths=["songs", "../songs"])
\ No newline at end of file
+if __name__ == "__main__":
+    # Integrations reuse connections; keep idle ones open well past uvicorn's 5 s default
+    uvicorn.run(app, host="0.0.0.0", port=7860,
+                timeout_keep_alive=int(os.environ.get("TIMBRE_KEEPALIVE", "30")))
@@ -1,23 +1,41 @@
 """
 建立歌曲資料庫 (song_library.csv)
-掃描 songs/ 資料夾中的 .wav 檔案
+掃描 songs/ 資料夾（含子資料夾）中的音檔
 
 注意：已移除 CLAP embedding，現在只建立歌曲清單。
 特徵提取由 extract_features.py 負責。
+
+增量掃描由 library_scanner.py 負責：只有大小 / mtime 變動的檔案會重新計算
+hash，新增 / 變更 / 移除的項目寫入 song_library_delta.csv 給
+extract_features.py 處理。
 """
-import os
-import pandas as pd
+import argparse
+import time
+
+from library_scanner import SONGS_FOLDER, DELTA_PATH, scan
+
+parser = argparse.ArgumentParser(description="Scan songs/ into song_library.csv")
+parser.add_argument("--root", default=SONGS_FOLDER, help="songs folder (default: ./songs)")
+parser.add_argument("--workers", type=int, default=32, help="parallel stat/hash workers")
+parser.add_argument("--full", action="store_true", help="ignore the manifest and rescan everything")
+parser.add_argument("--pcm", action="store_true",
+                    help="also fingerprint decoded audio to catch re-encoded duplicates (needs essentia)")
+args = parser.parse_args()
 
-SONGS_FOLDER = "./songs"
+start = time.time()
+try:
+    changes = scan(args.root, workers=args.workers, full=args.full, pcm=args.pcm)
+except ValueError as e:   # title collisions: nothing was written
+    raise SystemExit(f"❌ {e}")
 
-songs = []
-for filename in sorted(os.listdir(SONGS_FOLDER)):
-    if filename.endswith((".wav", ".mp3")):
-        songs.append({
-            "filename": filename,
-            "title": os.path.splitext(filename)[0],
-        })
-        print(f"  ✅ {filename}")
+counts = {c: sum(1 for v in changes.values() if v == c) for c in ("added", "changed", "removed")}
+for filename, change in sorted(changes.items())[:50]:
+    mark = {"added": "✅", "changed": "🔄", "removed": "🗑️ "}[change]
+    print(f"  {mark} {filename}")
+if len(changes) > 50:
+    print(f"  … 另外 {len(changes) - 50} 筆")
 
-pd.DataFrame(songs).to_csv("song_library.csv", index=False)
-print(f"\n✅ 完成！共 {len(songs)} 首歌寫入 song_library.csv")
\ No newline at end of file
+print(f"\n✅ 完成！新增 {counts['added']}、變更 {counts['changed']}、移除 {counts['removed']} "
+      f"（{time.time() - start:.1f}s）")
+if changes:
+    print(f"   待處理項目已寫入 {DELTA_PATH}，接著執行 extract_features.py")
@@ -0,0 +1,178 @@
+"""
+Timbre – Offline runtime bundle
+
+把 app 啟動需要的所有東西打包成一個有版本號的資料夾，replica 可以完全離線啟動：
+
+  bundles/<version>/
+    manifest.json              version, encoder name, emotion order, file hashes
+    encoder/                   SentenceTransformer.save() output
+    emotion_embeddings.npy     (n_emotions, dim) float32, rows in manifest order
+    library.npz                song_features columns as typed arrays
+    youtube_id_cache.json      title → video id
+  bundles/CURRENT              name of the newest bundle
+
+Build (online):  python bundle.py [--out bundles]
+Verify:          python bundle.py --verify bundles/<version>
+Run offline:     TIMBRE_BUNDLE_DIR=bundles python app.py
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+BUNDLE_ROOT = "bundles"
+MANIFEST = "manifest.json"
+ENCODER_DIR = "encoder"
+EMBEDDINGS_FILE = "emotion_embeddings.npy"
+LIBRARY_FILE = "library.npz"
+YT_CACHE_FILE = "youtube_id_cache.json"
+
+_STRING_COLS = ("filename", "title", "emotion")
+
+
+# ── Locating a bundle ─────────────────────────────────────
+def resolve_bundle_dir(path=None):
+    """TIMBRE_BUNDLE_DIR (a bundle, or a root with CURRENT) → bundle dir, or None."""
+    path = path or os.environ.get("TIMBRE_BUNDLE_DIR", "")
+    if not path:
+        return None
+    current = os.path.join(path, "CURRENT")
+    if not os.path.exists(os.path.join(path, MANIFEST)) and os.path.exists(current):
+        with open(current, "r", encoding="utf-8") as f:
+            path = os.path.join(path, f.read().strip())
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        raise FileNotFoundError(f"No bundle manifest under {path}")
+    return path
+
+
+def read_manifest(bundle_dir):
+    with open(os.path.join(bundle_dir, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ── Binary library artifact ───────────────────────────────
+def save_library_npz(df, path):
+    arrays = {}
+    for col in df.columns:
+        if col in _STRING_COLS or df[col].dtype == object:
+            arrays[col] = df[col].fillna("").astype(str).values.astype(np.str_)
+        else:
+            arrays[col] = df[col].values.astype(np.float64)
+    np.savez(path, **arrays)
+
+
+def load_library_npz(path):
+    with np.load(path, allow_pickle=False) as data:
+        df = pd.DataFrame({col: data[col] for col in data.files})
+    for col in df.columns:
+        if df[col].dtype.kind == "U":
+            df[col] = df[col].astype(object)
+    if "emotion" in df.columns:
+        df["emotion"] = df["emotion"].replace("", np.nan)
+    return df
+
+
+# ── Building ──────────────────────────────────────────────
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_hashes(bundle_dir):
+    hashes = {}
+    for dirpath, _, files in os.walk(bundle_dir):
+        for name in files:
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, bundle_dir).replace(os.sep, "/")
+            if rel != MANIFEST:
+                hashes[rel] = _sha256(full)
+    return dict(sorted(hashes.items()))
+
+
+def build_bundle(out_root=BUNDLE_ROOT, features_path="song_features.csv",
+                 yt_cache_path=YT_CACHE_FILE, yt_db_path="youtube_ids.sqlite"):
+    """Pack encoder, emotion embeddings, library and YT cache → bundles/<version>."""
+    os.environ["TIMBRE_ENCODER_WORKERS"] = "0"   # need the in-process float model to save it
+    os.environ["TIMBRE_ENCODER_BACKEND"] = "float"
+    import recommend_v2 as rv   # loads the encoder (needs network the first time)
+
+    os.makedirs(out_root, exist_ok=True)
+    tmp = os.path.join(out_root, f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    rv.semantic_model.save(os.path.join(tmp, ENCODER_DIR))
+    np.save(os.path.join(tmp, EMBEDDINGS_FILE), rv.EMOTION_MATRIX.astype(np.float32))
+    save_library_npz(pd.read_csv(features_path), os.path.join(tmp, LIBRARY_FILE))
+    yt_cache = {}
+    if os.path.exists(yt_cache_path):
+        with open(yt_cache_path, "r", encoding="utf-8") as f:
+            yt_cache = json.load(f)
+    if os.path.exists(yt_db_path):
+        from yt_cache_store import YTCacheStore
+        yt_cache.update(YTCacheStore(yt_db_path).load()[0])
+    with open(os.path.join(tmp, YT_CACHE_FILE), "w", encoding="utf-8") as f:
+        json.dump(yt_cache, f, ensure_ascii=False)
+
+    files = _file_hashes(tmp)
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:12]
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "encoder": rv.MODEL_NAME,
+        "emotions": list(rv.EMOTION_DESCRIPTIONS),
+        "descriptions": rv.EMOTION_DESCRIPTIONS,
+        "songs": int(len(rv.get_library().song_data)),
+        "youtube_ids": len(yt_cache),
+        "files": files,
+    }
+    with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    final = os.path.join(out_root, version)
+    if os.path.exists(final):
+        shutil.rmtree(tmp)
+        print(f"Bundle {version} already exists — unchanged")
+    else:
+        os.replace(tmp, final)
+        print(f"✅ Bundle written → {final}")
+    with open(os.path.join(out_root, "CURRENT.tmp"), "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(os.path.join(out_root, "CURRENT.tmp"), os.path.join(out_root, "CURRENT"))
+    return final
+
+
+def verify_bundle(bundle_dir):
+    """Re-hash every file against the manifest; returns a list of problems."""
+    manifest = read_manifest(bundle_dir)
+    actual = _file_hashes(bundle_dir)
+    problems = [f"missing: {name}" for name in manifest["files"] if name not in actual]
+    problems += [f"modified: {name}" for name, h in manifest["files"].items()
+                 if name in actual and actual[name] != h]
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or verify an offline runtime bundle")
+    parser.add_argument("--out", default=BUNDLE_ROOT, help="bundle root directory")
+    parser.add_argument("--verify", metavar="DIR", help="verify an existing bundle and exit")
+    args = parser.parse_args()
+
+    if args.verify:
+        bundle_dir = resolve_bundle_dir(args.verify)
+        problems = verify_bundle(bundle_dir)
+        for p in problems:
+            print(f"  ❌ {p}")
+        print("✅ Bundle OK" if not problems else f"{len(problems)} problems")
+        raise SystemExit(1 if problems else 0)
+
+    build_bundle(args.out)
@@ -1,12 +1,29 @@
 """
 下載 Essentia 預訓練模型權重
 只需要跑一次：python download_models.py
+
+- 平行下載，HTTP Range 續傳（.part 暫存檔），完成後 SHA-256 驗證再 atomic rename，
+  失敗不會留下被當成「已存在」的殘缺檔案。
+- 校驗碼放在 models.sha256（sha256sum 格式）。在可信任的網路上跑
+  python download_models.py --pin 一次，把下載結果（大小對過伺服器的
+  Content-Length）的校驗碼寫入 models.sha256 並提交。該檔存在後，沒有記錄
+  校驗碼的模型一律視為失敗；該檔還不存在時照舊下載（只檢查大小）並印出警告。
+- 可指定鏡像：TIMBRE_MODELS_MIRROR=https://mirror.example/models 或本地資料夾；
+  有設定時先從鏡像取，鏡像失敗才連上游（離線建置機不必等上游逾時）。
 """
+import argparse
+import hashlib
 import os
+import shutil
+import threading
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
 BASE_URL = "https://essentia.upf.edu/models"
+CHECKSUMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.sha256")
+MIRROR = os.environ.get("TIMBRE_MODELS_MIRROR", "")
 
 # 需要的模型列表
 MODELS = {
@@ -30,19 +47,186 @@ MODELS = {
     "danceability-discogs-effnet-1.pb": f"{BASE_URL}/classification-heads/danceability/danceability-discogs-effnet-1.pb",
 }
 
-def ensure_models():
+CHUNK = 1 << 20
+RETRIES = 3
+TIMEOUT = 30
+
+_checksums_lock = threading.Lock()
+
+
+# ── Checksums ─────────────────────────────────────────────
+def load_checksums(path=CHECKSUMS_PATH):
+    sums = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and not line.startswith("#"):
+                    sums[parts[1].lstrip("*")] = parts[0].lower()
+    return sums
+
+
+def save_checksums(sums, path=CHECKSUMS_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for name in sorted(sums):
+            f.write(f"{sums[name]}  {name}\n")
+    os.replace(tmp, path)
+
+
+def sha256_of(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ── Sources ───────────────────────────────────────────────
+def source_for(filename, url, mirror=MIRROR):
+    """Mirror URL / local path for a model, keeping the path relative to BASE_URL."""
+    if not mirror:
+        return url
+    rel = url[len(BASE_URL):].lstrip("/")
+    if mirror.startswith("file://"):
+        mirror = mirror[len("file://"):]
+    if "://" not in mirror:
+        # Local directory: either the same tree as BASE_URL or a flat folder
+        nested = os.path.join(mirror, *rel.split("/"))
+        return nested if os.path.exists(nested) else os.path.join(mirror, filename)
+    return f"{mirror.rstrip('/')}/{rel}"
+
+
+def _total_size(resp, offset):
+    """Full file size the server reports, or None if it doesn't say."""
+    content_range = resp.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = resp.headers.get("Content-Length")
+    if length is None:
+        return None
+    return int(length) + (offset if resp.status == 206 else 0)
+
+
+def _fetch_to_part(source, part):
+    """Download (resuming a previous .part if the server honours Range) or copy.
+
+    Raises if the result's size differs from what the server reports.
+    """
+    if "://" not in source:
+        shutil.copyfile(source, part)
+        return
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    headers = {"User-Agent": "Timbre/1.0"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    req = urllib.request.Request(source, headers=headers)
+    try:
+        resp = urllib.request.urlopen(req, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:   # nothing past offset: complete, unless the size says otherwise
+            total = _total_size(e, 0)
+            if total is not None and total != offset:
+                os.remove(part)
+                raise ValueError(f"partial file is {offset} bytes, server has {total}")
+            return
+        raise
+    with resp:
+        total = _total_size(resp, offset)
+        mode = "ab" if offset and resp.status == 206 else "wb"
+        with open(part, mode) as f:
+            shutil.copyfileobj(resp, f, CHUNK)
+    size = os.path.getsize(part)
+    if total is not None and size != total:
+        raise ValueError(f"got {size} of {total} bytes")
+
+
+def download_one(filename, url, checksums, mirror=MIRROR, pin=False, strict=True):
+    """Fetch one model into MODELS_DIR; returns (filename, ok, message).
+
+    Without a pinned checksum:
+      pin=True     (re)fetch it, check its size against the source, record its hash
+      strict=True  fail (models.sha256 exists, so an unlisted model is unexpected)
+      otherwise    fetch it with the size check only, and warn
+    """
+    filepath = os.path.join(MODELS_DIR, filename)
+    expected = checksums.get(filename)
+    if not expected and not pin:
+        if strict:
+            return filename, False, f"{os.path.basename(CHECKSUMS_PATH)} 沒有校驗碼（在可信任的網路上用 --pin 記錄）"
+        print(f"  ⚠️  {filename} 沒有校驗碼，只檢查大小（請用 --pin 記錄並提交 "
+              f"{os.path.basename(CHECKSUMS_PATH)}）")
+
+    part = filepath + ".part"
+    if os.path.exists(filepath):
+        if expected and sha256_of(filepath) == expected:
+            return filename, True, "exists"
+        if expected:
+            print(f"  ⚠️  校驗碼不符，重新下載：{filename}")
+            os.remove(filepath)
+        elif pin:   # unpinned (e.g. left by an old download): resume it, so the size gets checked
+            os.replace(filepath, part)
+        else:
+            return filename, True, "exists"
+
+    # mirror first: a host that was given one may not reach upstream at all
+    sources = ([source_for(filename, url, mirror)] if mirror else []) + [url]
+    last_error = None
+    for attempt in range(1, RETRIES + 1):
+        for source in sources:
+            try:
+                _fetch_to_part(source, part)
+                digest = sha256_of(part)
+                if expected and digest != expected:
+                    os.remove(part)   # corrupt — start over rather than resume
+                    raise ValueError(f"SHA-256 mismatch ({digest[:12]}… != {expected[:12]}…)")
+                os.replace(part, filepath)
+                if not expected and pin:
+                    with _checksums_lock:
+                        checksums[filename] = digest
+                size_mb = os.path.getsize(filepath) / (1024 * 1024)
+                return filename, True, f"{size_mb:.1f} MB"
+            except Exception as e:
+                last_error = e
+                print(f"  ↻ {filename} 第 {attempt}/{RETRIES} 次失敗（{source}）：{e}")
+    return filename, False, str(last_error)
+
+
+def ensure_models(mirror=MIRROR, workers=4, pin=False):
+    """Make sure every model is present and verified. Returns True if all succeeded.
+
+    pin: record checksums for models models.sha256 doesn't list yet.
+    Until models.sha256 exists, unlisted models are fetched unverified (with a warning).
+    """
     os.makedirs(MODELS_DIR, exist_ok=True)
-    for filename, url in MODELS.items():
-        filepath = os.path.join(MODELS_DIR, filename)
-        if os.path.exists(filepath):
-            continue
-        print(f"  ⬇️  下載模型：{filename}...")
-        try:
-            urllib.request.urlretrieve(url, filepath)
-            size_mb = os.path.getsize(filepath) / (1024 * 1024)
-            print(f"  ✅ 完成：{filename} ({size_mb:.1f} MB)")
-        except Exception as e:
-            print(f"  ❌ 失敗：{filename} - {e}")
+    strict = os.path.exists(CHECKSUMS_PATH)
+    checksums = load_checksums(CHECKSUMS_PATH)
+    pinned_before = dict(checksums)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        results = list(ex.map(lambda item: download_one(item[0], item[1], checksums, mirror, pin, strict),
+                              MODELS.items()))
+
+    ok = True
+    for filename, success, msg in results:
+        if not success:
+            ok = False
+            print(f"  ❌ 失敗：{filename} - {msg}")
+        elif msg != "exists":
+            print(f"  ✅ 完成：{filename} ({msg})")
+
+    if checksums != pinned_before:
+        save_checksums(checksums, CHECKSUMS_PATH)
+        print(f"  📝 新的校驗碼已寫入 {os.path.basename(CHECKSUMS_PATH)}（請提交以鎖定版本）")
+    return ok
+
 
 if __name__ == "__main__":
-    ensure_models()
+    parser = argparse.ArgumentParser(description="Download Essentia models")
+    parser.add_argument("--mirror", default=MIRROR,
+                        help="mirror base URL or local directory (default: $TIMBRE_MODELS_MIRROR)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent downloads")
+    parser.add_argument("--pin", action="store_true",
+                        help="record checksums for models missing from models.sha256 (trusted network only)")
+    args = parser.parse_args()
+    raise SystemExit(0 if ensure_models(args.mirror, args.workers, args.pin) else 1)
@@ -0,0 +1,161 @@
+"""
+Timbre – Selectable sentence-transformer backends for CPU hosts
+
+  float   the stock fp32 model (default)
+  int8    torch dynamic quantization of every nn.Linear: int8 weights,
+          activations quantized on the fly. No extra dependencies.
+  onnx    sentence-transformers' ONNX backend on onnxruntime
+          (pip install "sentence-transformers[onnx]"); exported on first load
+
+All of them keep SentenceTransformer.encode(), so recommend_v2 and the
+encoder pool only call load_encoder(TIMBRE_ENCODER_BACKEND, path).
+
+Before switching a deployment, check what the faster backend costs:
+
+  python encoder_backends.py --report [--backends int8,onnx] [--corpus FILE]
+
+prints, per backend, how often best_emotion agrees with the float model on a
+query corpus (labels.csv moods plus a built-in English / Chinese set, or
+FILE: a CSV with a "mood" column or one query per line), the mean cosine
+between the two embeddings, and the single-query encode latency.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+BACKENDS = ("float", "int8", "onnx")
+
+
+def load_encoder(backend, model_path):
+    """SentenceTransformer-compatible encoder for the given backend."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "float":
+        return SentenceTransformer(model_path)
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(model_path, device="cpu")
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":   # raises with install instructions if optimum / onnxruntime are missing
+        return SentenceTransformer(model_path, backend="onnx", device="cpu")
+    raise ValueError(f"unknown encoder backend {backend!r} (choose from {', '.join(BACKENDS)})")
+
+
+# ── Agreement report ──────────────────────────────────────
+# A few queries per emotion, in both UI languages
+DEFAULT_QUERIES = [
+    "friday night out with friends", "club dancing till sunrise", "週末跟朋友去夜店狂歡",
+    "pure joy, on top of the world", "adrenaline rush festival drop", "開心到飛起來",
+    "first date butterflies", "falling in love all over again", "心動的感覺",
+    "we won the championship", "epic hero moment", "勝利的時刻",
+    "so angry I want to scream", "mosh pit rage", "憤怒想要發洩",
+    "villain entrance, ominous", "dark cinematic battle", "黑暗又壯闊的戰鬥",
+    "nervous before the exam results", "panic, everything is too much", "焦慮到睡不著",
+    "lazy sunday coffee and a book", "calm evening, nothing to do", "放鬆的午後",
+    "slow dance in the kitchen", "holding hands, warm and soft", "溫柔的擁抱",
+    "new beginnings, sunrise", "things will get better", "充滿希望的早晨",
+    "old photos from my hometown", "missing the summers we had", "懷念以前的時光",
+    "heartbroken after a breakup", "crying alone in my room", "分手後很難過",
+    "rainy autumn afternoon, grey sky", "quietly thinking about life", "陰天的憂鬱",
+    "empty apartment at midnight", "nobody to talk to", "一個人好孤單",
+    "eerie space drone", "haunting atmosphere, minimal", "空靈的太空氛圍",
+    "deep focus while coding", "background music for studying", "專心讀書",
+]
+
+
+def load_corpus(path=None):
+    """Queries for the report: FILE if given, else labels.csv moods + DEFAULT_QUERIES."""
+    import pandas as pd
+
+    if path and not path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    queries = []
+    csv_path = path or "labels.csv"
+    if os.path.exists(csv_path):
+        df = pd.read_csv(csv_path)
+        for col in ("mood", "mood_english"):
+            if col in df:
+                queries += df[col].dropna().astype(str).tolist()
+    if not path:
+        queries += DEFAULT_QUERIES
+    return list(dict.fromkeys(q for q in queries if q.strip()))
+
+
+def _unit(m):
+    m = np.atleast_2d(np.asarray(m, dtype=np.float32))
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def _profile(model, queries, descriptions):
+    """(query embeddings, best emotion index per query, median single-query ms)."""
+    emotions = _unit(model.encode(descriptions, convert_to_numpy=True))
+    q = _unit(model.encode(queries, convert_to_numpy=True))
+    best = (q @ emotions.T).argmax(axis=1)
+    model.encode(queries[0], convert_to_numpy=True)   # warm-up
+    times = []
+    for text in queries:
+        t0 = time.perf_counter()
+        model.encode(text, convert_to_numpy=True)
+        times.append((time.perf_counter() - t0) * 1000)
+    return q, best, float(np.median(times))
+
+
+def agreement_report(reference, candidates, queries, descriptions, emotion_order):
+    """candidates: {backend name: encoder}. Returns one row per backend (float first)."""
+    ref_q, ref_best, ref_ms = _profile(reference, queries, descriptions)
+    rows = [{"backend": "float", "agreement": 1.0, "mean_cosine": 1.0,
+             "median_ms": ref_ms, "speedup": 1.0, "disagreements": []}]
+    for name, model in candidates.items():
+        q, best, ms = _profile(model, queries, descriptions)
+        diff = np.flatnonzero(best != ref_best)
+        rows.append({
+            "backend": name,
+            "agreement": float(1 - len(diff) / len(queries)),
+            "mean_cosine": float(np.mean(np.sum(q * ref_q, axis=1))),
+            "median_ms": ms,
+            "speedup": ref_ms / ms if ms else float("inf"),
+            "disagreements": [(queries[i], emotion_order[ref_best[i]], emotion_order[best[i]])
+                              for i in diff],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoder backend agreement report")
+    parser.add_argument("--report", action="store_true", help="compare backends against float")
+    parser.add_argument("--backends", default="int8,onnx", help="comma-separated, e.g. int8,onnx")
+    parser.add_argument("--corpus", help="CSV with a 'mood' column, or a text file (one query per line)")
+    args = parser.parse_args()
+    if not args.report:
+        parser.print_help()
+        return
+
+    os.environ["TIMBRE_ENCODER_BACKEND"] = "float"   # the reference must be the float model
+    os.environ["TIMBRE_ENCODER_WORKERS"] = "0"
+    import recommend_v2 as rv
+
+    queries = load_corpus(args.corpus)
+    descriptions = [rv.EMOTION_DESCRIPTIONS[e] for e in rv.EMOTION_ORDER]
+    candidates = {}
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            candidates[name] = load_encoder(name, rv.MODEL_PATH)
+        except Exception as e:
+            print(f"⚠️  {name}: {e}")
+
+    rows = agreement_report(rv.semantic_model, candidates, queries, descriptions, rv.EMOTION_ORDER)
+    print(f"\n{len(queries)} queries, model {rv.MODEL_PATH}\n")
+    print(f"{'backend':<8} {'agreement':>10} {'cosine':>8} {'ms/query':>9} {'speedup':>8}")
+    for r in rows:
+        print(f"{r['backend']:<8} {r['agreement']:>9.1%} {r['mean_cosine']:>8.4f} "
+              f"{r['median_ms']:>9.2f} {r['speedup']:>7.2f}x")
+    for r in rows:
+        for query, ref, got in r["disagreements"]:
+            print(f"  [{r['backend']}] {query!r}: float → {ref}, {r['backend']} → {got}")
+
+
+if __name__ == "__main__":
+    main()
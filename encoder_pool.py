@@ -0,0 +1,222 @@
+"""
+Timbre – Sentence-transformer inference in dedicated worker processes
+
+Keeps encoder inference out of the web process: each worker is a separate
+Python process with its own model copy and a pinned torch thread count, so
+inference scales across cores without contending for the server's GIL.
+
+Texts and embeddings never get pickled. Each worker owns one shared-memory
+block laid out as
+
+  offsets   uint32[max_texts + 1]      byte offsets into the text area
+  text      UTF-8, max_text_bytes      the batch, concatenated
+  output    float32[max_texts, MAX_DIM] embeddings written by the worker
+
+and a socket carries only tiny control tuples ("encode n" / "ok dim").
+A worker that dies or hangs is killed and restarted, and the batch is
+retried once on the fresh process.
+
+Workers are started with subprocess (not multiprocessing spawn, which would
+re-run app.py as __mp_main__ in every worker).
+
+EncoderPool.encode() mirrors SentenceTransformer.encode(convert_to_numpy=True),
+so it can stand in for recommend_v2.semantic_model (TIMBRE_ENCODER_WORKERS).
+"""
+import atexit
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Connection
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAX_DIM = 1024                 # largest embedding size the output area holds
+READY_TIMEOUT = 300.0          # model load on a cold cache can take a while
+
+
+def _layout(max_texts, max_text_bytes):
+    """(text offset, output offset, total bytes) of one worker's block."""
+    text_off = 4 * (max_texts + 1)
+    out_off = text_off + max_text_bytes
+    out_off += (-out_off) % 16
+    return text_off, out_off, out_off + 4 * max_texts * MAX_DIM
+
+
+# ── Worker process ────────────────────────────────────────
+def _worker_main(model_path, backend, shm_name, fd, max_texts, max_text_bytes, threads):
+    import torch
+    torch.set_num_threads(threads)
+    from encoder_backends import load_encoder
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:   # the parent owns the block; don't let this process's tracker unlink it
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    conn = Connection(fd)
+    model = load_encoder(backend, model_path)
+    text_off, out_off, _ = _layout(max_texts, max_text_bytes)
+    offsets = np.ndarray((max_texts + 1,), dtype=np.uint32, buffer=shm.buf)
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            _, n = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            raw = bytes(shm.buf[text_off:text_off + int(offsets[n])])
+            texts = [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(n)]
+            emb = np.asarray(model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+            dim = emb.shape[1]
+            if dim > MAX_DIM:
+                raise ValueError(f"embedding dim {dim} > MAX_DIM {MAX_DIM}")
+            np.ndarray((n, dim), dtype=np.float32, buffer=shm.buf, offset=out_off)[:] = emb
+            conn.send(("ok", dim))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    shm.close()
+
+
+# ── Parent side ───────────────────────────────────────────
+class _Worker:
+    def __init__(self, pool, index):
+        self.index = index
+        self.shm = shared_memory.SharedMemory(create=True, size=pool._block_size)
+        self.proc = None
+        self.conn = None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class EncoderPool:
+    """Fixed pool of encoder processes; encode() is thread-safe and blocks for a free worker."""
+
+    def __init__(self, model_path, workers=2, torch_threads=1, backend="float",
+                 max_texts=64, max_text_bytes=256 * 1024, timeout=30.0):
+        self.model_path = model_path
+        self.backend = backend
+        self.torch_threads = torch_threads
+        self.max_texts = max_texts
+        self.max_text_bytes = max_text_bytes
+        self.timeout = timeout
+        self.restarts = 0
+        self._text_off, self._out_off, self._block_size = _layout(max_texts, max_text_bytes)
+        self._workers = [_Worker(self, i) for i in range(workers)]
+        self._idle = queue.Queue()
+        self._closed = False
+        atexit.register(self.close)
+
+        # Load every model copy in parallel, then hand the workers out
+        starters = [threading.Thread(target=self._start, args=(w,)) for w in self._workers]
+        for s in starters:
+            s.start()
+        for s in starters:
+            s.join()
+        for w in self._workers:
+            self._idle.put(w)
+
+    def _start(self, w):
+        w.stop()
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ, OMP_NUM_THREADS=str(self.torch_threads),
+                   MKL_NUM_THREADS=str(self.torch_threads), TOKENIZERS_PARALLELISM="false")
+        code = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+                "import encoder_pool as p; p._worker_main(*sys.argv[1:4], *map(int, sys.argv[4:]))")
+        w.proc = subprocess.Popen(
+            [sys.executable, "-c", code, self.model_path, self.backend, w.shm.name, str(child_sock.fileno()),
+             str(self.max_texts), str(self.max_text_bytes), str(self.torch_threads)],
+            pass_fds=(child_sock.fileno(),), env=env,
+        )
+        child_sock.close()
+        w.conn = Connection(parent_sock.detach())
+        if not w.conn.poll(READY_TIMEOUT):
+            w.stop()
+            raise RuntimeError(f"encoder worker {w.index} did not start within {READY_TIMEOUT:.0f}s")
+        w.conn.recv()
+
+    def _restart(self, w, why):
+        self.restarts += 1
+        print(f"  [encoder pool] restarting worker {w.index} ({why})")
+        self._start(w)
+
+    def _run(self, w, blob_offsets, blob, n):
+        """One round trip on worker w → (n, dim) float32 copy. Raises on a dead / hung worker."""
+        buf = w.shm.buf
+        np.ndarray((n + 1,), dtype=np.uint32, buffer=buf)[:] = blob_offsets
+        buf[self._text_off:self._text_off + len(blob)] = blob
+        w.conn.send(("encode", n))
+        if not w.conn.poll(self.timeout):
+            raise TimeoutError(f"no answer within {self.timeout:.0f}s")
+        status, value = w.conn.recv()
+        if status != "ok":
+            raise ValueError(value)
+        return np.ndarray((n, value), dtype=np.float32, buffer=buf, offset=self._out_off).copy()
+
+    def _encode_chunk(self, texts):
+        encoded = [t.encode("utf-8")[:self.max_text_bytes] for t in texts]
+        encoded = [e.decode("utf-8", "ignore").encode("utf-8") for e in encoded]   # whole characters
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = b"".join(encoded)
+
+        w = self._idle.get()
+        try:
+            if not w.alive():
+                self._restart(w, "found dead")
+            try:
+                return self._run(w, offsets, blob, len(texts))
+            except (EOFError, OSError, TimeoutError) as e:
+                self._restart(w, f"{type(e).__name__}: {e}")
+                return self._run(w, offsets, blob, len(texts))
+        finally:
+            self._idle.put(w)
+
+    def _chunks(self, texts):
+        chunk, size = [], 0
+        for t in texts:
+            n = min(len(t.encode("utf-8")), self.max_text_bytes)
+            if chunk and (len(chunk) == self.max_texts or size + n > self.max_text_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(t)
+            size += n
+        if chunk:
+            yield chunk
+
+    def encode(self, sentences, convert_to_numpy=True, **_):
+        """Same shapes as SentenceTransformer.encode: (dim,) for a str, (n, dim) for a list."""
+        if self._closed:
+            raise RuntimeError("encoder pool is closed")
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        parts = [self._encode_chunk(c) for c in self._chunks(texts)]
+        out = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        return out[0] if single else out
+
+    def stats(self):
+        return {"workers": len(self._workers), "alive": sum(w.alive() for w in self._workers),
+                "idle": self._idle.qsize(), "restarts": self.restarts}
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for w in self._workers:
+            w.stop()
+            w.shm.close()
+            w.shm.unlink()
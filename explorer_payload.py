@@ -0,0 +1,120 @@
+"""
+Timbre – Columnar binary encoding of the Explorer song library
+
+Instead of one JSON object per song, the library is shipped as a few
+little-endian typed-array columns that emotion_ui.html maps with zero-copy
+Float32Array / Uint16Array / Uint8Array views and scores in place.
+
+Layout (every section starts on a 4-byte boundary):
+  0   b"TMBR"
+  4   uint32  header length H
+  8   H bytes UTF-8 JSON header:
+        {"version": 1, "n": n_songs,
+         "columns": {name: {"offset", "length", "dtype", ["div"]}}}
+  ..  column data; offsets are relative to the start of the buffer
+
+Columns:
+  b, v, a, h, s, ag,   uint16    bpm / valence / arousal / mood_* / danceability,
+  r, p, d                        value = u16 / div (0.1, 0.01 and 0.001 steps) — the
+                                 same rounding the old JSON payload used, and u16 / div
+                                 in JS yields exactly the double JSON.parse gave
+  title_offsets        uint32    n + 1 byte offsets into title_utf8
+  title_utf8           uint8     all titles, UTF-8, concatenated
+  yt                   uint8     n * 11 ASCII video ids, zero-filled when unknown
+"""
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"TMBR"
+FORMAT_VERSION = 1
+YT_ID_LEN = 11
+
+# payload key → (song_features column, divisor)
+NUMERIC_COLUMNS = {
+    "b":  ("bpm", 10),
+    "v":  ("valence", 100),
+    "a":  ("arousal", 100),
+    "h":  ("mood_happy", 1000),
+    "s":  ("mood_sad", 1000),
+    "ag": ("mood_aggressive", 1000),
+    "r":  ("mood_relaxed", 1000),
+    "p":  ("mood_party", 1000),
+    "d":  ("danceability", 1000),
+}
+
+
+def _pad4(n):
+    return (-n) % 4
+
+
+def quantize_columns(song_data):
+    """{payload key: (uint16 array, div)} — the numeric columns exactly as shipped."""
+    out = {}
+    for key, (col, div) in NUMERIC_COLUMNS.items():
+        digits = len(str(div)) - 1
+        q = np.array([round(round(float(x), digits) * div) for x in song_data[col]])
+        out[key] = (np.clip(q, 0, 65535).astype("<u2"), div)
+    return out
+
+
+def valid_yt_id(vid):
+    return bool(vid) and len(vid) == YT_ID_LEN and vid.isascii()
+
+
+def encode_songs(song_data, yt_ids):
+    """song_features DataFrame + {title: video_id} → bytes in the layout above."""
+    titles = song_data["title"].astype(str).tolist()
+    n = len(titles)
+
+    # name → (np array, extra header fields)
+    columns = {key: (q, {"div": div}) for key, (q, div) in quantize_columns(song_data).items()}
+
+    encoded = [t.encode("utf-8") for t in titles]
+    offsets = np.zeros(n + 1, dtype="<u4")
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    columns["title_offsets"] = (offsets, {})
+    columns["title_utf8"] = (np.frombuffer(b"".join(encoded), dtype=np.uint8), {})
+
+    yt = bytearray(n * YT_ID_LEN)
+    for i, t in enumerate(titles):
+        vid = yt_ids.get(t)
+        if valid_yt_id(vid):
+            yt[i * YT_ID_LEN:(i + 1) * YT_ID_LEN] = vid.encode("ascii")
+    columns["yt"] = (np.frombuffer(bytes(yt), dtype=np.uint8), {})
+
+    # Two passes: the header size depends on the offsets it contains
+    header_len = 0
+    while True:
+        pos = 8 + header_len + _pad4(8 + header_len)
+        meta = {}
+        for name, (arr, extra) in columns.items():
+            meta[name] = {"offset": pos, "length": int(arr.size), "dtype": arr.dtype.name, **extra}
+            pos += arr.nbytes + _pad4(arr.nbytes)
+        header = json.dumps({"version": FORMAT_VERSION, "n": n, "columns": meta},
+                            separators=(",", ":")).encode("utf-8")
+        if len(header) == header_len:
+            break
+        header_len = len(header)
+
+    out = bytearray(MAGIC + struct.pack("<I", header_len) + header)
+    out += b"\0" * _pad4(len(out))
+    for arr, _ in columns.values():
+        out += arr.tobytes()
+        out += b"\0" * _pad4(arr.nbytes)
+    return bytes(out)
+
+
+def decode_songs(buf):
+    """Inverse of encode_songs (for checks / scripts) → (header, {name: array})."""
+    if buf[:4] != MAGIC:
+        raise ValueError("not a Timbre song payload")
+    (header_len,) = struct.unpack_from("<I", buf, 4)
+    header = json.loads(buf[8:8 + header_len])
+    cols = {}
+    for name, m in header["columns"].items():
+        dtype = np.dtype(m["dtype"]).newbyteorder("<")
+        arr = np.frombuffer(buf, dtype=dtype, count=m["length"], offset=m["offset"])
+        cols[name] = arr / m["div"] if "div" in m else arr
+    return header, cols
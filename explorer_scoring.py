@@ -0,0 +1,111 @@
+"""
+Timbre – Server-side port of the Explorer's findTopSongs
+
+The Explorer ranks songs by a valence/arousal distance plus a weighted mood
+dot product against EMOTION_PROFILES. The same scoring runs here, vectorized,
+so a device can ask /api/v1/explorer/top for its 25 songs instead of
+downloading and scoring the whole library.
+
+EMOTION_PROFILES below is the only copy of the table: app.py injects it into
+emotion_ui.html as window.__TIMBRE_PROFILES__, which the page's local
+fallback scorer reads.
+
+Rankings are identical to the JS version: scoring uses the payload's
+quantized values (u16 / div, as the page decodes them) with the same float64
+operations in the same order, and ties keep library order.
+"""
+import numpy as np
+
+from explorer_payload import quantize_columns, valid_yt_id
+
+# Explorer emotion key → target valence / arousal (1–9) and mood weights
+EMOTION_PROFILES = {
+    "joy":                  {"v": 7.5, "a": 6.5, "h": 0.90, "s": 0.00, "ag": 0.05, "r": 0.10, "p": 0.50, "d": 0.60},
+    "calm":                 {"v": 6.0, "a": 2.5, "h": 0.40, "s": 0.10, "ag": 0.00, "r": 0.90, "p": 0.05, "d": 0.20},
+    "sadness":              {"v": 2.5, "a": 3.0, "h": 0.00, "s": 0.90, "ag": 0.05, "r": 0.30, "p": 0.00, "d": 0.10},
+    "anger":                {"v": 2.5, "a": 7.5, "h": 0.00, "s": 0.10, "ag": 0.90, "r": 0.00, "p": 0.15, "d": 0.30},
+    "fear":                 {"v": 2.0, "a": 6.5, "h": 0.00, "s": 0.50, "ag": 0.30, "r": 0.10, "p": 0.00, "d": 0.10},
+    "anticipation":         {"v": 6.0, "a": 6.0, "h": 0.50, "s": 0.10, "ag": 0.15, "r": 0.10, "p": 0.30, "d": 0.40},
+    "joy+sadness":          {"v": 5.0, "a": 4.5, "h": 0.40, "s": 0.50, "ag": 0.00, "r": 0.30, "p": 0.05, "d": 0.20},
+    "joy+anger":            {"v": 5.5, "a": 7.0, "h": 0.50, "s": 0.00, "ag": 0.50, "r": 0.00, "p": 0.40, "d": 0.50},
+    "joy+fear":             {"v": 6.0, "a": 7.5, "h": 0.50, "s": 0.10, "ag": 0.10, "r": 0.00, "p": 0.35, "d": 0.50},
+    "joy+anticipation":     {"v": 7.0, "a": 7.0, "h": 0.70, "s": 0.00, "ag": 0.10, "r": 0.00, "p": 0.45, "d": 0.60},
+    "joy+calm":             {"v": 7.0, "a": 4.0, "h": 0.60, "s": 0.00, "ag": 0.00, "r": 0.50, "p": 0.15, "d": 0.30},
+    "calm+sadness":         {"v": 4.0, "a": 2.5, "h": 0.10, "s": 0.55, "ag": 0.00, "r": 0.65, "p": 0.00, "d": 0.10},
+    "calm+anger":           {"v": 3.5, "a": 5.0, "h": 0.00, "s": 0.10, "ag": 0.55, "r": 0.40, "p": 0.00, "d": 0.20},
+    "calm+fear":            {"v": 3.0, "a": 5.0, "h": 0.00, "s": 0.30, "ag": 0.10, "r": 0.45, "p": 0.00, "d": 0.10},
+    "calm+anticipation":    {"v": 6.0, "a": 4.5, "h": 0.30, "s": 0.00, "ag": 0.00, "r": 0.55, "p": 0.10, "d": 0.20},
+    "sadness+anger":        {"v": 2.0, "a": 6.0, "h": 0.00, "s": 0.50, "ag": 0.70, "r": 0.00, "p": 0.00, "d": 0.10},
+    "sadness+fear":         {"v": 2.0, "a": 5.0, "h": 0.00, "s": 0.70, "ag": 0.10, "r": 0.10, "p": 0.00, "d": 0.05},
+    "sadness+anticipation": {"v": 3.5, "a": 4.0, "h": 0.10, "s": 0.60, "ag": 0.00, "r": 0.20, "p": 0.00, "d": 0.10},
+    "anger+fear":           {"v": 2.0, "a": 8.0, "h": 0.00, "s": 0.30, "ag": 0.70, "r": 0.00, "p": 0.00, "d": 0.20},
+    "anger+anticipation":   {"v": 4.0, "a": 7.5, "h": 0.20, "s": 0.00, "ag": 0.60, "r": 0.00, "p": 0.20, "d": 0.35},
+    "fear+anticipation":    {"v": 3.5, "a": 7.0, "h": 0.10, "s": 0.35, "ag": 0.20, "r": 0.00, "p": 0.10, "d": 0.20},
+}
+
+
+class ExplorerTable:
+    """One library version's songs as the page sees them: titles + dequantized columns."""
+
+    def __init__(self, song_data):
+        self.titles = song_data["title"].astype(str).tolist()
+        self.cols = {key: q / div for key, (q, div) in quantize_columns(song_data).items()}
+        self.n = len(self.titles)
+
+
+def score(table, emotion_key):
+    """float64 score per song — findTopSongs' loop, one array op per term."""
+    p = EMOTION_PROFILES[emotion_key]
+    c = table.cols
+    vd = (c["v"] - p["v"]) / 9
+    ad = (c["a"] - p["a"]) / 9
+    dist = np.sqrt(vd * vd + ad * ad)
+    mood = (c["h"] * p["h"] + c["s"] * p["s"] + c["ag"] * p["ag"]
+            + c["r"] * p["r"] + c["p"] * p["p"] + c["d"] * p.get("d", 0))
+    return mood - dist * 1.5
+
+
+def top_indices(scores, top_k):
+    """Indices of the top_k scores, best first, ties in library order.
+
+    argpartition finds the k-th best score; everything tied with it is kept
+    so the (score desc, index asc) order matches the page's full sort.
+    """
+    n = len(scores)
+    if top_k <= 0 or not n:
+        return np.zeros(0, dtype=np.intp)
+    if top_k < n:
+        kth = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return order[:top_k]
+
+
+def song_at(table, i, yt_id=None):
+    """The page's song object (songAt in emotion_ui.html)."""
+    c = table.cols
+    song = {"t": table.titles[i]}
+    song.update({key: float(c[key][i]) for key in ("b", "v", "a", "h", "s", "ag", "r", "p", "d")})
+    song["yt"] = yt_id
+    return song
+
+
+def songs_at(table, indices, yt_ids=None):
+    yt_ids = yt_ids or {}
+    songs = []
+    for i in indices:
+        vid = yt_ids.get(table.titles[i])
+        songs.append(song_at(table, i, vid if valid_yt_id(vid) else None))
+    return songs
+
+
+def find_top_songs(table, emotion_key, top_k, yt_ids=None):
+    """findTopSongs(emotionKey, topK) → list of song objects, best first."""
+    return songs_at(table, top_indices(score(table, emotion_key), top_k), yt_ids)
+
+
+def rank_all(table, emotion_key):
+    """Every song index in findTopSongs order — page through it with slices."""
+    return top_indices(score(table, emotion_key), table.n)
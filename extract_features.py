@@ -25,9 +25,12 @@ Models required in ./models/:
   danceability-discogs-effnet-1.pb
 
 Pipeline:
-  1) build_library.py         → song_library.csv
+  1) build_library.py         → song_library.csv (+ song_library_delta.csv;
+                                 when present only those entries are re-extracted)
   2) extract_features.py      → song_features.csv (this file)
   3) get_song_emotions.py     → adds/updates 'emotion' column
+                                 (thresholds from emotion_thresholds.json,
+                                  which this script keeps up to date)
 """
 
 import numpy as np
@@ -41,6 +44,9 @@ from essentia.standard import (
 )
 import essentia
 
+from quantile_sketch import SKETCH_PATH, sync_library_sketch
+from library_scanner import load_delta, save_delta, clear_delta, load_manifest
+
 essentia.log.warningActive = False
 essentia.log.infoActive = False
 
@@ -49,6 +55,18 @@ MODELS_DIR = "./models"
 
 song_library = pd.read_csv("song_library.csv")
 
+# ── Incremental mode: only process what library_scanner.py reported ──────────
+delta = load_delta() if os.path.exists("song_features.csv") else {}
+if delta:
+    touched_files = set(delta)
+    to_process = song_library[song_library["filename"].isin(
+        [f for f, c in delta.items() if c != "removed"])].reset_index(drop=True)
+    print(f"Incremental run: {len(to_process)} to extract, "
+          f"{sum(1 for c in delta.values() if c == 'removed')} removed\n")
+else:
+    touched_files = None
+    to_process = song_library
+
 # ── Load models ───────────────────────────────────────────────────────────────
 print("Loading Essentia models...")
 
@@ -114,82 +132,144 @@ bpm_estimator = PercivalBpmEstimator()
 print("✅ Models loaded\n")
 
 # ── Extract features ──────────────────────────────────────────────────────────
+FEATURE_KEYS = ["bpm", "valence", "arousal", "mood_happy", "mood_sad",
+                "mood_aggressive", "mood_relaxed", "mood_party", "danceability"]
+
+
+def extract_one(filepath):
+    # 16 kHz for Essentia EffNet / MusiCNN models
+    audio_16k = MonoLoader(filename=filepath, sampleRate=16000, resampleQuality=4)()
+    # 44.1 kHz for BPM estimation (PercivalBpmEstimator expects native sample rate)
+    audio_44k = MonoLoader(filename=filepath, sampleRate=44100, resampleQuality=4)()
+
+    # EffNet embeddings → mood heads
+    embeddings_effnet = embedding_model_effnet(audio_16k)
+
+    # MusiCNN embeddings → DEAM only
+    embeddings_musicnn = embedding_model_musicnn(audio_16k)
+
+    # Valence / Arousal (MusiCNN path)
+    deam_preds = model_deam(embeddings_musicnn)
+    valence = float(np.mean(deam_preds[:, 0]))
+    arousal = float(np.mean(deam_preds[:, 1]))
+
+    # Mood probabilities (EffNet path)
+    mood_happy = float(np.mean(model_happy(embeddings_effnet)[:, 0]))
+    mood_sad = float(np.mean(model_sad(embeddings_effnet)[:, 1]))
+    mood_aggressive = float(np.mean(model_aggressive(embeddings_effnet)[:, 0]))
+    mood_relaxed = float(np.mean(model_relaxed(embeddings_effnet)[:, 1]))
+    mood_party = float(np.mean(model_party(embeddings_effnet)[:, 1]))
+    danceability = float(np.mean(model_dance(embeddings_effnet)[:, 0]))
+
+    bpm = float(bpm_estimator(audio_44k))
+
+    return {
+        "bpm":             round(bpm, 2),
+        "valence":         round(valence, 4),
+        "arousal":         round(arousal, 4),
+        "mood_happy":      round(mood_happy, 4),
+        "mood_sad":        round(mood_sad, 4),
+        "mood_aggressive": round(mood_aggressive, 4),
+        "mood_relaxed":    round(mood_relaxed, 4),
+        "mood_party":      round(mood_party, 4),
+        "danceability":    round(danceability, 4),
+    }
+
+
+# content_id → features, so duplicate audio is decoded/inferred only once.
+# Seeded from untouched songs in incremental mode: a new alias of known
+# audio costs nothing.
+content_ids = (dict(zip(song_library["filename"], song_library["content_id"]))
+               if "content_id" in song_library.columns else {})
+extracted = {}
+if touched_files is not None and content_ids:
+    _prev = pd.read_csv("song_features.csv")
+    _prev = _prev[~_prev["filename"].isin(touched_files)]
+    for _, r in _prev.iterrows():
+        cid = content_ids.get(r["filename"])
+        if cid is not None:
+            extracted.setdefault(cid, {k: r[k] for k in FEATURE_KEYS})
+
 features_list = []
+failed = []   # filenames to retry on the next incremental run
+reused = 0
 
-for i, row in song_library.iterrows():
+for i, row in to_process.iterrows():
     filepath = os.path.join(SONGS_FOLDER, row["filename"])
-    print(f"[{i+1}/{len(song_library)}] Processing: {row['title']}")
-
-    try:
-        # 16 kHz for Essentia EffNet / MusiCNN models
-        audio_16k = MonoLoader(filename=filepath, sampleRate=16000, resampleQuality=4)()
-        # 44.1 kHz for BPM estimation (PercivalBpmEstimator expects native sample rate)
-        audio_44k = MonoLoader(filename=filepath, sampleRate=44100, resampleQuality=4)()
-
-        # EffNet embeddings → mood heads
-        embeddings_effnet = embedding_model_effnet(audio_16k)
-
-        # MusiCNN embeddings → DEAM only
-        embeddings_musicnn = embedding_model_musicnn(audio_16k)
-
-        # Valence / Arousal (MusiCNN path)
-        deam_preds = model_deam(embeddings_musicnn)
-        valence = float(np.mean(deam_preds[:, 0]))
-        arousal = float(np.mean(deam_preds[:, 1]))
-
-        # Mood probabilities (EffNet path)
-        mood_happy = float(np.mean(model_happy(embeddings_effnet)[:, 0]))
-        mood_sad = float(np.mean(model_sad(embeddings_effnet)[:, 1]))
-        mood_aggressive = float(np.mean(model_aggressive(embeddings_effnet)[:, 0]))
-        mood_relaxed = float(np.mean(model_relaxed(embeddings_effnet)[:, 1]))
-        mood_party = float(np.mean(model_party(embeddings_effnet)[:, 1]))
-        danceability = float(np.mean(model_dance(embeddings_effnet)[:, 0]))
-
-        bpm = float(bpm_estimator(audio_44k))
-
-        features_list.append({
-            "filename":        row["filename"],
-            "title":           row["title"],
-            "bpm":             round(bpm, 2),
-            "valence":         round(valence, 4),
-            "arousal":         round(arousal, 4),
-            "mood_happy":      round(mood_happy, 4),
-            "mood_sad":        round(mood_sad, 4),
-            "mood_aggressive": round(mood_aggressive, 4),
-            "mood_relaxed":    round(mood_relaxed, 4),
-            "mood_party":      round(mood_party, 4),
-            "danceability":    round(danceability, 4),
-        })
-
+    cid = content_ids.get(row["filename"]) or row["filename"]
+    print(f"[{i+1}/{len(to_process)}] Processing: {row['title']}")
+
+    if cid in extracted:
+        feats = extracted[cid]
+        if feats is None:
+            print("  ❌ Skipped: duplicate of a file that failed")
+            failed.append(row["filename"])
+            continue
+        reused += 1
+        print("  ↪ duplicate audio — reusing features")
+    else:
+        try:
+            feats = extract_one(filepath)
+        except Exception as e:
+            extracted[cid] = None
+            failed.append(row["filename"])
+            print(f"  ❌ Failed: {e}")
+            continue
+        extracted[cid] = feats
         print(
-            f"  → valence={valence:.2f}  arousal={arousal:.2f}  "
-            f"happy={mood_happy:.2f}  sad={mood_sad:.2f}  "
-            f"party={mood_party:.2f}  dance={danceability:.2f}  bpm={bpm:.0f}"
+            f"  → valence={feats['valence']:.2f}  arousal={feats['arousal']:.2f}  "
+            f"happy={feats['mood_happy']:.2f}  sad={feats['mood_sad']:.2f}  "
+            f"party={feats['mood_party']:.2f}  dance={feats['danceability']:.2f}  "
+            f"bpm={feats['bpm']:.0f}"
         )
 
-    except Exception as e:
-        print(f"  ❌ Failed: {e}")
+    features_list.append({"filename": row["filename"], "title": row["title"], **feats})
+
+if reused:
+    print(f"\n🧬 {reused} duplicates reused existing features instead of re-extracting")
 
 # ── Build DataFrame and preserve existing emotion labels if present ───────────
 features_df = pd.DataFrame(features_list)
 
 old_path = "song_features.csv"
+old_df = None
 if os.path.exists(old_path):
     try:
         old_df = pd.read_csv(old_path)
-        if "emotion" in old_df.columns:
+        if "emotion" in old_df.columns and not features_df.empty:
             # Keep any existing emotion labels by title
             features_df = features_df.merge(
                 old_df[["title", "emotion"]],
                 on="title",
                 how="left",
             )
+        if touched_files is not None:
+            # Untouched songs keep their previous features
+            untouched = old_df[~old_df["filename"].isin(touched_files)]
+            features_df = pd.concat([untouched, features_df], ignore_index=True)
     except Exception as e:
+        if touched_files is not None:
+            raise  # never write a partial library in incremental mode
         print(f"⚠️  Could not merge previous emotion labels: {e}")
 
 features_df.to_csv("song_features.csv", index=False)
 
-print(f"\n✅ Done — processed {len(features_list)} / {len(song_library)} songs")
+# Consumed — except for files that failed: the manifest already has their new
+# hashes, so only the delta can bring them back for another try.
+if failed:
+    save_delta({f: (delta or {}).get(f, "added") for f in failed})
+    print(f"⚠️  {len(failed)} files failed and stay in the delta for the next run")
+else:
+    clear_delta()
+
+# ── Update threshold sketch: ingest new tracks, rebuild if any changed / went away ──
+if not features_df.empty:
+    hashes = {rel: entry["hash"] for rel, entry in load_manifest().items()}
+    mode, fed = sync_library_sketch(features_df, delta if touched_files is not None else None, hashes)
+    print(f"📈 Threshold sketch {mode} with {fed} tracks → {SKETCH_PATH}")
+
+print(f"\n✅ Done — processed {len(features_list)} / {len(to_process)} songs "
+      f"({len(features_df)} in library)")
 print(
     features_df[
         ["title", "valence", "arousal", "mood_happy", "mood_sad", "mood_party", "bpm"]
@@ -0,0 +1,90 @@
+"""
+Timbre – k-nearest tracks in the normalized feature space
+
+"Valence 6, arousal 7, 120 BPM, high party" or "more like this track" are
+nearest-neighbour queries over LibrarySnapshot.feature_vectors (the 9
+FEATURE_COLS, min-max normalized). Per library version:
+
+  all         a scipy cKDTree over every track
+  emotion     one cKDTree per emotion label, for emotion tiers
+
+nearest() with an emotion ranks like rank_order()'s boosting: tracks of that
+emotion first, then its EMOTION_NEIGHBORS, then everything else, by distance
+within each tier. Each tier only asks its trees for the k tracks still
+missing, so a query costs O(k log n) instead of a pass over the library.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def normalize_target(raw, feat_min, feat_max, defaults):
+    """{feature: raw value} → normalized target vector (feature order of feat_min).
+
+    Features left out take `defaults` (already normalized). Values outside the
+    library's range are clipped to it: no track lies beyond, and a column the
+    library barely varies in would otherwise dominate the distance. Raises
+    ValueError for names that aren't feature columns.
+    """
+    unknown = sorted(set(raw) - set(feat_min.index))
+    if unknown:
+        raise ValueError(f"unknown feature(s): {', '.join(unknown)} (use {', '.join(feat_min.index)})")
+    target = np.asarray(defaults, dtype=np.float64).copy()
+    for j, col in enumerate(feat_min.index):
+        if col in raw:
+            target[j] = (float(raw[col]) - feat_min[col]) / (feat_max[col] - feat_min[col] + 1e-8)
+    return np.clip(target, 0.0, 1.0)
+
+
+class FeatureIndex:
+    """KD-trees over one library version's feature vectors (row i = song_data.iloc[i])."""
+
+    def __init__(self, feature_vectors, emotions):
+        vectors = np.asarray(feature_vectors, dtype=np.float64)
+        self.n = len(vectors)
+        self.tree = cKDTree(vectors)
+        self.median = np.median(vectors, axis=0) if self.n else np.zeros(vectors.shape[1])
+        emotions = np.asarray(emotions, dtype=object).astype(str)
+        self.by_emotion = {}
+        for emotion in np.unique(emotions):
+            rows = np.flatnonzero(emotions == emotion)
+            self.by_emotion[emotion] = (rows, cKDTree(vectors[rows]))
+
+    def _query(self, tree, target, k):
+        """(distances, positions in the tree's data), nearest first."""
+        k = min(k, tree.n)
+        if k <= 0:
+            return np.zeros(0), np.zeros(0, dtype=np.intp)
+        dists, pos = tree.query(target, k=k)
+        return np.atleast_1d(dists), np.atleast_1d(pos)
+
+    def _tier(self, target, k, emotions, skip):
+        """Up to k (distance, row) pairs from the trees of `emotions` (all tracks if None), minus skip."""
+        if emotions is None:
+            parts = [(None, self.tree)]
+        else:
+            parts = [self.by_emotion[e] for e in emotions if e in self.by_emotion]
+        found = []
+        for rows, tree in parts:
+            dists, pos = self._query(tree, target, k + len(skip))
+            hits = pos if rows is None else rows[pos]
+            found += [(d, i) for d, i in zip(dists, hits) if i not in skip]
+        found.sort()   # distance, then row — ties keep library order
+        return found[:k]
+
+    def nearest(self, target, k, emotion=None, neighbors=(), exclude=()):
+        """Row indices of the k tracks nearest to `target` and their distances.
+
+        emotion:   rank its tracks first, then those of `neighbors`, then the rest
+        exclude:   rows to leave out (e.g. the seed track)
+        """
+        skip = set(int(i) for i in exclude)
+        tiers = [[emotion], list(neighbors), None] if emotion else [None]
+        found = []
+        for emotions in tiers:
+            if len(found) >= k:
+                break
+            tier = self._tier(target, k - len(found), emotions, skip)
+            found += tier
+            skip.update(i for _, i in tier)
+        rows = np.array([i for _, i in found], dtype=np.intp)
+        return rows, np.array([d for d, _ in found], dtype=np.float64)
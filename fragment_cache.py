@@ -0,0 +1,60 @@
+"""
+Timbre – Bounded LRU cache for rendered HTML fragments
+
+Song cards and acoustic briefs are pure functions of (library version,
+track(s), language, player state), so repeat traffic only has to join
+cached strings. Keys carry everything the fragment depends on; clear() on
+library reload just drops entries that can no longer be hit.
+"""
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered strings (or any other non-None value) with hit / miss counters."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = render()   # outside the lock; a concurrent duplicate render is harmless
+        if value is None:  # nothing to serve — don't let it take (or evict) a slot
+            return value
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -10,26 +10,39 @@ and EMOTION_DESCRIPTIONS in recommend_v2.py):
   Low Arousal + High Valence:   relaxed, romantic_tender, hopeful
   Low Arousal + Low/Mid Valence: sad, melancholic, lonely, nostalgic, dark_ambient
   Neutral:                      focused
+
+Thresholds come from the persisted quantile sketch (quantile_sketch.py):
+  python get_song_emotions.py                 # classify + write labels
+  python get_song_emotions.py --drift         # which labels would flip?
+  python get_song_emotions.py --ingest new.csv
+  python get_song_emotions.py --merge shard_a.json shard_b.json
+  python get_song_emotions.py --rebuild       # full rebuild from the library
 """
+import argparse
+
 import pandas as pd
 import numpy as np
 
-features = pd.read_csv('song_features.csv')
+from quantile_sketch import (
+    SKETCH_PATH, new_sketches, ingest, merge_sketches, load_sketches, load_tracks,
+    save_sketches, thresholds_from_sketches, track_hashes,
+)
+from library_scanner import load_manifest
+
+FEATURES_PATH = 'song_features.csv'
 
-# ── Data-driven thresholds ────────────────────────────────────────────────────
-V_HIGH = features['valence'].quantile(0.70)
-V_LOW  = features['valence'].quantile(0.30)
-V_MID  = features['valence'].quantile(0.50)
-A_HIGH = features['arousal'].quantile(0.70)
-A_LOW  = features['arousal'].quantile(0.30)
-A_MID  = features['arousal'].quantile(0.50)
-A_TOP  = features['arousal'].quantile(0.90)
 
-print(f"Thresholds: V_HIGH={V_HIGH:.2f}  V_MID={V_MID:.2f}  V_LOW={V_LOW:.2f}  "
-      f"A_HIGH={A_HIGH:.2f}  A_MID={A_MID:.2f}  A_LOW={A_LOW:.2f}  A_TOP={A_TOP:.2f}\n")
+def format_thresholds(th):
+    return (f"V_HIGH={th['V_HIGH']:.2f}  V_MID={th['V_MID']:.2f}  V_LOW={th['V_LOW']:.2f}  "
+            f"A_HIGH={th['A_HIGH']:.2f}  A_MID={th['A_MID']:.2f}  A_LOW={th['A_LOW']:.2f}  "
+            f"A_TOP={th['A_TOP']:.2f}")
+
 
 # ── Classifier ────────────────────────────────────────────────────────────────
-def classify_from_essentia(row):
+def classify_from_essentia(row, th):
+    V_HIGH, V_LOW, V_MID = th['V_HIGH'], th['V_LOW'], th['V_MID']
+    A_HIGH, A_LOW, A_MID, A_TOP = th['A_HIGH'], th['A_LOW'], th['A_MID'], th['A_TOP']
+
     scores = {
         'party':      row['mood_party'],
         'happy':      row['mood_happy'],
@@ -148,9 +161,101 @@ def classify_from_essentia(row):
     return 'focused'
 
 
-features['emotion'] = features.apply(classify_from_essentia, axis=1)
-features.to_csv('song_features.csv', index=False)
+def classify_all(features, th):
+    return features.apply(classify_from_essentia, axis=1, args=(th,))
+
+
+# ── Drift report ──────────────────────────────────────────────────────────────
+def drift_report(features, th, applied=None):
+    """Print which existing labels would flip under the current sketch thresholds."""
+    if applied:
+        print("Applied thresholds: " + format_thresholds(applied))
+    print("Sketch thresholds:  " + format_thresholds(th) + "\n")
+
+    if 'emotion' not in features.columns:
+        print("No existing emotion labels — nothing to compare.")
+        return features.iloc[0:0]
+
+    new_labels = classify_all(features, th)
+    flipped = features[features['emotion'] != new_labels].copy()
+    flipped['new_emotion'] = new_labels[flipped.index]
+
+    print(f"{len(flipped)} / {len(features)} labels would flip")
+    if len(flipped):
+        print("\nTransitions:")
+        print(flipped.groupby(['emotion', 'new_emotion']).size()
+              .sort_values(ascending=False).to_string())
+        print()
+        print(flipped[['title', 'valence', 'arousal', 'emotion', 'new_emotion']]
+              .head(50).to_string(index=False))
+    return flipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign emotion labels using sketch-maintained thresholds")
+    parser.add_argument('--rebuild', action='store_true',
+                        help=f"rebuild {SKETCH_PATH} from the full library (O(library))")
+    parser.add_argument('--ingest', metavar='CSV',
+                        help="add newly extracted tracks to the sketch (O(new tracks)) and exit; "
+                             "it can only add, so after tracks change or are removed use --rebuild")
+    parser.add_argument('--merge', nargs='+', metavar='SKETCH',
+                        help=f"merge shard sketch files into the existing {SKETCH_PATH} and exit")
+    parser.add_argument('--drift', action='store_true',
+                        help="report labels that would flip, without writing anything")
+    args = parser.parse_args()
+
+    hashes = {rel: entry["hash"] for rel, entry in load_manifest().items()}
+
+    if args.merge:
+        current, applied = load_sketches(SKETCH_PATH)
+        tracks = load_tracks(SKETCH_PATH) if current is not None else {}
+        shards = []
+        for p in args.merge:
+            shard = load_sketches(p)[0]
+            if shard is not None:
+                shards.append(shard)
+                shard_tracks = load_tracks(p)
+                tracks = None if tracks is None or shard_tracks is None else {**tracks, **shard_tracks}
+        merged = merge_sketches(*([current] if current is not None else []), *shards)
+        save_sketches(merged, SKETCH_PATH, applied, tracks)   # None: the next extraction rebuilds
+        print(f"Merged {len(shards)} shard sketches into {SKETCH_PATH}")
+        print("Thresholds: " + format_thresholds(thresholds_from_sketches(merged)))
+        raise SystemExit(0)
+
+    if args.ingest:
+        sketches, applied = load_sketches(SKETCH_PATH)
+        tracks = load_tracks(SKETCH_PATH) if sketches is not None else {}
+        sketches = sketches or new_sketches()
+        new_tracks = pd.read_csv(args.ingest)
+        ingest(sketches, new_tracks)
+        if tracks is not None:
+            tracks = ({**tracks, **track_hashes(new_tracks, hashes)}
+                      if "filename" in new_tracks.columns else None)
+        save_sketches(sketches, SKETCH_PATH, applied, tracks)
+        print(f"Ingested {len(new_tracks)} tracks into {SKETCH_PATH}")
+        raise SystemExit(0)
+
+    features = pd.read_csv(FEATURES_PATH)
+
+    # ── Data-driven thresholds (maintained incrementally in the sketch) ───────
+    sketches, applied = load_sketches(SKETCH_PATH)
+    tracks = load_tracks(SKETCH_PATH)
+    if sketches is None or args.rebuild:
+        sketches = ingest(new_sketches(), features)
+        tracks = track_hashes(features, hashes)
+        print(f"Built threshold sketch from {len(features)} songs → {SKETCH_PATH}")
+    th = thresholds_from_sketches(sketches)
+
+    if args.drift:
+        drift_report(features, th, applied)
+        raise SystemExit(0)
+
+    print("Thresholds: " + format_thresholds(th) + "\n")
+
+    features['emotion'] = classify_all(features, th)
+    features.to_csv(FEATURES_PATH, index=False)
+    save_sketches(sketches, SKETCH_PATH, applied=th, tracks=tracks)
 
-print("Distribution:")
-print(features['emotion'].value_counts().to_string())
-print(f"\nTotal: {len(features)} songs across {features['emotion'].nunique()} emotions")
+    print("Distribution:")
+    print(features['emotion'].value_counts().to_string())
+    print(f"\nTotal: {len(features)} songs across {features['emotion'].nunique()} emotions")
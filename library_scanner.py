@@ -0,0 +1,313 @@
+"""
+Timbre – 增量歌曲掃描器
+
+Walks songs/ (nested folders included) with os.scandir, stats files in
+parallel and keeps a manifest of size / mtime / content hash per file.
+Each run only hashes files whose size or mtime moved, and emits the
+added / changed / removed entries for extract_features.py to consume.
+
+Duplicates (re-uploads, "(Official Video)" vs "(Audio)" copies) share a
+content_id: files with the same byte hash, or — with pcm=True — the same
+decoded loudness envelope, so a re-encode or re-tagged copy still matches.
+extract_features.py extracts each content_id once and fans the result out.
+
+Outputs:
+  song_manifest.json        relpath → {"size", "mtime_ns", "hash", ["pcm"]}
+  song_library.csv          full filename,title,content_id list (rewritten only on change)
+  song_library_delta.csv    change,filename,title — pending work for extraction
+"""
+import base64
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+SONGS_FOLDER = "./songs"
+MANIFEST_PATH = "song_manifest.json"
+LIBRARY_PATH = "song_library.csv"
+DELTA_PATH = "song_library_delta.csv"
+
+AUDIO_EXTENSIONS = (
+    ".wav", ".mp3", ".flac", ".m4a", ".aac", ".ogg", ".oga", ".opus",
+    ".aif", ".aiff", ".wma", ".alac", ".webm",
+)
+
+STAT_BATCH = 256
+HASH_CHUNK = 1 << 20
+
+
+# ── Parallel walk ─────────────────────────────────────────
+def _stat_batch(root, entries):
+    out = {}
+    for rel, path in entries:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        out[rel] = (st.st_size, st.st_mtime_ns)
+    return out
+
+
+def _list_dir(root, path):
+    """One directory level → ([(relpath, path) audio files], [subdirs])."""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    files.append((rel, entry.path))
+    except OSError as e:
+        print(f"  ⚠️  無法讀取 {path}: {e}")
+    return files, subdirs
+
+
+def scan_tree(root=SONGS_FOLDER, workers=32):
+    """relpath → (size, mtime_ns) for every audio file under root."""
+    found = {}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = {ex.submit(_list_dir, root, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                result = fut.result()
+                if isinstance(result, dict):          # a stat batch
+                    found.update(result)
+                    continue
+                files, subdirs = result
+                for d in subdirs:
+                    pending.add(ex.submit(_list_dir, root, d))
+                for i in range(0, len(files), STAT_BATCH):
+                    pending.add(ex.submit(_stat_batch, root, files[i:i + STAT_BATCH]))
+    return found
+
+
+def file_hash(path):
+    """Content hash (BLAKE2b-128) of the raw file bytes."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ── Decoded-audio fingerprint (optional, needs essentia) ──
+PCM_RATE = 8000
+PCM_MIN_SECONDS = 5
+PCM_MAX_DB_DIFF = 0.75   # mean |Δ| of the per-second loudness envelope
+PCM_MIN_CORR = 0.95      # and the envelopes' shapes must move together
+PCM_MIN_SPREAD = 1.0     # dB std below which an envelope is too flat to tell masters apart
+
+
+def pcm_fingerprint(path):
+    """Per-second RMS loudness (0.5 dB steps) of the decoded audio, base64 uint8.
+
+    Survives re-encoding and tag/container changes, unlike the byte hash.
+    """
+    from essentia.standard import MonoLoader
+    audio = MonoLoader(filename=path, sampleRate=PCM_RATE, resampleQuality=4)()
+    n = len(audio) // PCM_RATE
+    if n < PCM_MIN_SECONDS:
+        return None
+    frames = np.asarray(audio[:n * PCM_RATE], dtype=np.float64).reshape(n, PCM_RATE)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-13)
+    q = np.clip(np.round(-db * 2), 0, 255).astype(np.uint8)
+    return base64.b64encode(q.tobytes()).decode("ascii")
+
+
+def _envelope(fp):
+    return np.frombuffer(base64.b64decode(fp), dtype=np.uint8).astype(np.float64) / 2
+
+
+def _pcm_match(a, b):
+    """Same audio: close loudness level *and* a correlated loudness contour.
+
+    Level alone can't separate two heavily limited masters that sit at the
+    same loudness; the contour (verse / chorus / breaks) can, so flat
+    envelopes never match.
+    """
+    n = min(len(a), len(b))
+    if abs(len(a) - len(b)) > 1 or n < PCM_MIN_SECONDS:
+        return False
+    a, b = a[:n], b[:n]
+    if float(np.mean(np.abs(a - b))) > PCM_MAX_DB_DIFF:
+        return False
+    if a.std() < PCM_MIN_SPREAD or b.std() < PCM_MIN_SPREAD:
+        return False
+    return float(np.corrcoef(a, b)[0, 1]) >= PCM_MIN_CORR
+
+
+def group_duplicates(manifest):
+    """relpath → content_id (smallest byte hash in its duplicate group)."""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    # identical bytes
+    for rel, entry in manifest.items():
+        find(entry["hash"])
+    # same decoded audio: compare envelopes within ±1 s duration buckets
+    by_len = {}
+    for rel, entry in manifest.items():
+        if entry.get("pcm"):
+            env = _envelope(entry["pcm"])
+            by_len.setdefault(len(env), []).append((entry["hash"], env))
+    for length, items in by_len.items():
+        candidates = items + by_len.get(length + 1, [])
+        for i, (ha, ea) in enumerate(items):
+            for hb, eb in candidates[i + 1:]:
+                if find(ha) != find(hb) and _pcm_match(ea, eb):
+                    union(ha, hb)
+    return {rel: find(entry["hash"]) for rel, entry in manifest.items()}
+
+
+# ── Manifest / delta ──────────────────────────────────────
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp, path)
+
+
+def title_for(rel):
+    return os.path.splitext(os.path.basename(rel))[0]
+
+
+def title_collisions(rels):
+    """title → sorted relpaths, for titles more than one file maps to.
+
+    The title is the key of song_features.csv, the YouTube cache and the
+    app's per-title metadata, so two files may not share one.
+    """
+    by_title = {}
+    for rel in rels:
+        by_title.setdefault(title_for(rel), []).append(rel)
+    return {title: sorted(r) for title, r in by_title.items() if len(r) > 1}
+
+
+def _merge_pending(pending, changes):
+    """Fold this run's changes into a not-yet-consumed delta (filename → change)."""
+    merged = dict(pending)
+    for rel, change in changes.items():
+        prev = merged.get(rel)
+        if prev == "added" and change == "removed":
+            del merged[rel]
+        elif prev == "added":
+            merged[rel] = "added"
+        elif prev == "removed" and change == "added":
+            merged[rel] = "changed"
+        else:
+            merged[rel] = change
+    return merged
+
+
+def load_delta(path=DELTA_PATH):
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path)
+    return dict(zip(df["filename"], df["change"]))
+
+
+def save_delta(delta, path=DELTA_PATH):
+    rows = [{"change": c, "filename": f, "title": title_for(f)} for f, c in sorted(delta.items())]
+    pd.DataFrame(rows, columns=["change", "filename", "title"]).to_csv(path, index=False)
+
+
+def clear_delta(path=DELTA_PATH):
+    """Called by the consumer once the delta has been applied."""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _fingerprint_or_none(path):
+    try:
+        return pcm_fingerprint(path)
+    except Exception as e:
+        print(f"  ⚠️  PCM fingerprint failed for {path}: {e}")
+        return None
+
+
+def scan(root=SONGS_FOLDER, workers=32, full=False, pcm=False):
+    """Scan root against the manifest; persist manifest, library list and delta.
+
+    pcm: also fingerprint decoded audio of new/changed files (needs essentia).
+    Returns {filename: "added" | "changed" | "removed"} for this run.
+    Raises ValueError (before writing anything) if two files would get the same title.
+    """
+    old = {} if full else load_manifest()
+    found = scan_tree(root, workers)
+    collisions = title_collisions(found)
+    if collisions:
+        listing = "\n".join(f"  {title}: {', '.join(rels)}" for title, rels in sorted(collisions.items()))
+        raise ValueError(f"{len(collisions)} titles are used by more than one file — rename one of each:\n"
+                         f"{listing}")
+
+    to_hash = [
+        rel for rel, (size, mtime) in found.items()
+        if rel not in old or old[rel]["size"] != size or old[rel]["mtime_ns"] != mtime
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        hashes = dict(zip(to_hash, ex.map(lambda rel: file_hash(os.path.join(root, rel)), to_hash)))
+    prints = {}
+    if pcm:
+        to_print = [rel for rel in found if rel in hashes or not old[rel].get("pcm")]
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, os.cpu_count() or 1))) as ex:
+            prints = dict(zip(to_print, ex.map(
+                lambda rel: _fingerprint_or_none(os.path.join(root, rel)), to_print)))
+
+    manifest, changes = {}, {}
+    for rel, (size, mtime) in found.items():
+        prev = old.get(rel)
+        digest = hashes.get(rel, prev["hash"] if prev else None)
+        manifest[rel] = {"size": size, "mtime_ns": mtime, "hash": digest}
+        fp = prints.get(rel) if rel in prints else (prev or {}).get("pcm")
+        if fp and (rel in prints or prev["hash"] == digest):
+            manifest[rel]["pcm"] = fp
+        if prev is None:
+            changes[rel] = "added"
+        elif prev["hash"] != digest:
+            changes[rel] = "changed"
+    for rel in old.keys() - found.keys():
+        changes[rel] = "removed"
+
+    save_manifest(manifest)
+    content_ids = group_duplicates(manifest)
+    library = pd.DataFrame(
+        [{"filename": rel, "title": title_for(rel), "content_id": content_ids[rel]}
+         for rel in sorted(manifest)],
+        columns=["filename", "title", "content_id"],
+    )
+    if changes or prints or not os.path.exists(LIBRARY_PATH):
+        library.to_csv(LIBRARY_PATH, index=False)
+    if changes:
+        save_delta(_merge_pending(load_delta(), changes))
+
+    groups = library.groupby("content_id").size()
+    dupes = groups[groups > 1]
+    if len(dupes):
+        print(f"  🧬 {len(dupes)} duplicate groups — {int(dupes.sum() - len(dupes))} files "
+              f"will reuse another file's features")
+    return changes
@@ -0,0 +1,36 @@
+"""
+Timbre – Opaque pagination cursors for the /api/v1 ranked lists
+
+A cursor is the unpadded urlsafe-base64 of a compact JSON array:
+
+  [library version, ranking generation, kind, key, offset, size, filters dict or null]
+
+kind is "mood" or "explorer"; key the emotion the list ranks by. Clients
+only echo cursors back, so decode_cursor() treats anything that doesn't
+round-trip as garbage (ValueError). The version and generation are returned,
+not checked — app.py answers a stale one with 410 instead of 400.
+"""
+import base64
+import json
+
+
+def encode_cursor(version, generation, kind, key, offset, size, filters=None):
+    raw = json.dumps([version, generation, kind, key, offset, size, filters or None],
+                     ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, kind, keys, max_size):
+    """cursor → (version, generation, key, offset, size, filters dict or None); ValueError unless it is a valid `kind` cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, generation, cursor_kind, key, offset, size, filters = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("malformed cursor") from e
+    valid = (cursor_kind == kind and type(generation) is int and type(offset) is int and offset >= 0
+             and type(size) is int and 1 <= size <= max_size
+             and isinstance(key, str) and key in keys
+             and (filters is None or isinstance(filters, dict)))
+    if not valid:
+        raise ValueError("cursor does not match this list")
+    return version, generation, key, offset, size, filters
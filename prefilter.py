@@ -0,0 +1,89 @@
+"""
+Timbre – Indexed prefilters for constrained recommendations
+
+"Around 90–110 BPM", "only Japanese tracks", "must have a player": these
+narrow the candidate set before anything is scored, so a tighter constraint
+means less work, not more. Per library version:
+
+  bpm         sorted BPM values + their row order → a range is two bisects
+              and one contiguous slice
+  language    per-row language code + posting list (sorted rows) per language
+  emotion     per-row emotion code + posting list per emotion
+  available   posting lists / masks for "local", "youtube", "playable"
+
+candidates() starts from the smallest matching set (the BPM slice or a union
+of postings) and checks the remaining constraints on those rows only, so its
+cost follows the candidate count rather than the library size.
+"""
+import numpy as np
+
+AVAILABILITY = ("local", "youtube", "playable")
+
+
+def _codes(values):
+    """values → (names, int32 code per row, {name: sorted rows})."""
+    names, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    postings = {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(names)}
+    return list(names), codes.astype(np.int32), postings
+
+
+class PrefilterIndex:
+    """Prefilter indexes over one library version's rows (row i = song_data.iloc[i])."""
+
+    def __init__(self, bpm, languages, emotions, local, youtube):
+        bpm = np.asarray(bpm, dtype=np.float64)
+        self.n = len(bpm)
+        self.bpm = bpm
+        self.bpm_order = np.argsort(bpm, kind="stable")          # NaN sorts last
+        self.bpm_sorted = bpm[self.bpm_order]
+        self.bpm_known = int(np.count_nonzero(~np.isnan(bpm)))
+        lang_names, self.lang_code, self.by_language = _codes([x.lower() for x in languages])
+        self._lang_index = {name: i for i, name in enumerate(lang_names)}
+        emo_names, self.emotion_code, self.by_emotion = _codes(emotions)
+        self._emotion_index = {name: i for i, name in enumerate(emo_names)}
+        local = np.asarray(local, dtype=bool)
+        youtube = np.asarray(youtube, dtype=bool)
+        self.available = {"local": local, "youtube": youtube, "playable": local | youtube}
+        self.by_available = {k: np.flatnonzero(m) for k, m in self.available.items()}
+
+    def candidates(self, bpm_min=None, bpm_max=None, languages=(), emotions=(), available=None):
+        """Sorted row indices meeting every constraint, or None when no row is excluded.
+
+        Within a constraint, values are alternatives (Japanese or Korean);
+        constraints combine with AND.
+        """
+        constraints = []   # (candidate count, rows(), check(rows) → mask); only the smallest is materialized
+        if bpm_min is not None or bpm_max is not None:
+            known = self.bpm_sorted[:self.bpm_known]
+            lo = 0 if bpm_min is None else int(np.searchsorted(known, bpm_min, "left"))
+            hi = max(lo, len(known) if bpm_max is None else int(np.searchsorted(known, bpm_max, "right")))
+            low = -np.inf if bpm_min is None else bpm_min
+            high = np.inf if bpm_max is None else bpm_max
+            constraints.append((hi - lo, lambda: np.sort(self.bpm_order[lo:hi]),
+                                lambda r: (self.bpm[r] >= low) & (self.bpm[r] <= high)))
+        for wanted, index, postings, codes in (
+                ({x.lower() for x in languages}, self._lang_index, self.by_language, self.lang_code),
+                (set(emotions), self._emotion_index, self.by_emotion, self.emotion_code)):
+            if not wanted:
+                continue
+            parts = [postings[w] for w in wanted if w in postings]
+            hits = np.array([index[w] for w in wanted if w in index], dtype=np.int32)
+            constraints.append((sum(len(p) for p in parts),
+                                lambda parts=parts: np.sort(np.concatenate(parts)) if parts
+                                else np.zeros(0, dtype=np.intp),
+                                lambda r, codes=codes, hits=hits: np.isin(codes[r], hits)))
+        if available:
+            rows, mask = self.by_available[available], self.available[available]
+            constraints.append((len(rows), lambda rows=rows: rows, lambda r, mask=mask: mask[r]))
+        if not constraints:
+            return None
+
+        constraints.sort(key=lambda c: c[0])
+        rows = constraints[0][1]()
+        for _, _, check in constraints[1:]:
+            if not len(rows):
+                break
+            rows = rows[check(rows)]
+        return None if len(rows) == self.n else rows
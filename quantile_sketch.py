@@ -0,0 +1,244 @@
+"""
+Timbre – Mergeable quantile sketches for classifier thresholds
+
+get_song_emotions.py 的 V_HIGH / V_LOW / A_HIGH / A_TOP 等門檻原本是對整個
+song_features.csv 做 quantile()。這裡改成持久化的 t-digest（merging digest），
+新歌抽完特徵後只需 ingest 新的那幾列，不同 shard 的 sketch 也可以直接 merge。
+
+Sketch file layout (emotion_thresholds.json):
+  {
+    "sketches": {"valence": <digest>, "arousal": <digest>},
+    "applied":  {"V_HIGH": ..., ...},  # thresholds last used to write labels
+    "tracks":   {filename: content hash, ...}   # library rows the digests hold
+  }
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+SKETCH_PATH = "emotion_thresholds.json"
+
+# threshold name → (feature column, quantile)
+THRESHOLD_QUANTILES = {
+    "V_HIGH": ("valence", 0.70),
+    "V_LOW":  ("valence", 0.30),
+    "V_MID":  ("valence", 0.50),
+    "A_HIGH": ("arousal", 0.70),
+    "A_LOW":  ("arousal", 0.30),
+    "A_MID":  ("arousal", 0.50),
+    "A_TOP":  ("arousal", 0.90),
+}
+SKETCH_COLUMNS = sorted({col for col, _ in THRESHOLD_QUANTILES.values()})
+
+
+# ── t-digest ──────────────────────────────────────────────
+class TDigest:
+    """Merging t-digest (k1 scale function). Memory is O(compression)."""
+
+    def __init__(self, compression=500):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    # k1 scale function and its inverse
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q_limit(self, q0):
+        k = self._k(q0) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    def update(self, values):
+        """Add raw values (any iterable of numbers); NaNs are ignored."""
+        arr = np.asarray(values, dtype=float).ravel()
+        arr = arr[~np.isnan(arr)]
+        if arr.size:
+            self._buffer.append(arr)
+            if sum(b.size for b in self._buffer) > 5 * self.compression:
+                self._flush()
+        return self
+
+    def merge(self, other):
+        """Fold another digest into this one (shards merge the same way)."""
+        other._flush()
+        if other.count:
+            self._flush()
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        values = np.concatenate(self._buffer)
+        self._buffer = []
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(values.size)]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = float(weights.sum())
+        out_m, out_w = [], []
+        cur_m, cur_w = float(means[0]), float(weights[0])
+        q0 = 0.0
+        q_limit = self._q_limit(q0)
+        for m, w in zip(means[1:].tolist(), weights[1:].tolist()):
+            if q0 + (cur_w + w) / total <= q_limit:
+                cur_m += (m - cur_m) * w / (cur_w + w)
+                cur_w += w
+            else:
+                out_m.append(cur_m)
+                out_w.append(cur_w)
+                q0 += cur_w / total
+                q_limit = self._q_limit(q0)
+                cur_m, cur_w = m, w
+        out_m.append(cur_m)
+        out_w.append(cur_w)
+        self.means = np.array(out_m)
+        self.weights = np.array(out_w)
+        self.count = total
+
+    def quantile(self, q):
+        """Approximate quantile; exact (pandas 'linear') while centroids are singletons."""
+        self._flush()
+        if not self.count:
+            return float("nan")
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xp, fp = centers, self.means
+        if centers[0] > 0.5:
+            xp, fp = np.concatenate([[0.5], xp]), np.concatenate([[self.min], fp])
+        if centers[-1] < self.count - 0.5:
+            xp, fp = np.concatenate([xp, [self.count - 0.5]]), np.concatenate([fp, [self.max]])
+        return float(np.interp(q * (self.count - 1) + 0.5, xp, fp))
+
+    def to_dict(self):
+        self._flush()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "means": [round(m, 6) for m in self.means.tolist()],
+            "weights": self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls(d.get("compression", 500))
+        digest.means = np.asarray(d.get("means", []), dtype=float)
+        digest.weights = np.asarray(d.get("weights", []), dtype=float)
+        digest.count = float(d.get("count", digest.weights.sum()))
+        digest.min = d["min"] if d.get("min") is not None else math.inf
+        digest.max = d["max"] if d.get("max") is not None else -math.inf
+        return digest
+
+
+# ── Threshold sketches (one digest per feature column) ───
+def new_sketches():
+    return {col: TDigest() for col in SKETCH_COLUMNS}
+
+
+def ingest(sketches, df):
+    """Add the rows of df (new tracks only) to the sketches — O(len(df))."""
+    for col in SKETCH_COLUMNS:
+        sketches[col].update(df[col].values)
+    return sketches
+
+
+def merge_sketches(*shards):
+    merged = new_sketches()
+    for shard in shards:
+        for col in SKETCH_COLUMNS:
+            merged[col].merge(shard[col])
+    return merged
+
+
+def thresholds_from_sketches(sketches):
+    return {
+        name: sketches[col].quantile(q)
+        for name, (col, q) in THRESHOLD_QUANTILES.items()
+    }
+
+
+def load_sketches(path=SKETCH_PATH):
+    """Returns (sketches, applied_thresholds) or (None, None) if no sketch file yet."""
+    if not os.path.exists(path):
+        return None, None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    sketches = {col: TDigest.from_dict(d) for col, d in data["sketches"].items()}
+    return sketches, data.get("applied")
+
+
+def load_tracks(path=SKETCH_PATH):
+    """{filename: content hash} the sketch was fed, or None if unknown (no file, or written without it)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("tracks")
+
+
+_KEEP = object()
+
+
+def save_sketches(sketches, path=SKETCH_PATH, applied=None, tracks=_KEEP):
+    """tracks: {filename: hash}, None for unknown, or left out to keep what is on disk."""
+    if tracks is _KEEP:
+        tracks = load_tracks(path)
+    data = {
+        "sketches": {col: s.to_dict() for col, s in sketches.items()},
+        "applied": applied,
+        "tracks": tracks,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def track_hashes(df, hashes):
+    """{filename: content hash} for the rows of df (hash None if the manifest doesn't know the file)."""
+    return {f: hashes.get(f) for f in df["filename"]}
+
+
+def sync_library_sketch(new_df, delta=None, hashes=None, path=SKETCH_PATH):
+    """Bring the persisted sketch in line with a rewritten library (used by extract_features.py).
+
+    delta:   {filename: "added" | "changed" | "removed"} from library_scanner,
+             None for a full extraction
+    hashes:  {filename: content hash} from the scanner manifest
+
+    Only the delta's filenames are looked at. Files the sketch doesn't hold
+    yet are ingested (O(new tracks)); if a file it holds was removed or now
+    has a different hash — or its membership is unknown — it is rebuilt
+    from new_df. Returns ("ingested" | "rebuilt", number of rows fed to it).
+    """
+    hashes = hashes or {}
+    sketches, applied = load_sketches(path)
+    tracks = load_tracks(path)
+    if sketches is not None and tracks is not None and delta is not None:
+        stale = any(f in tracks and (change == "removed" or tracks[f] != hashes.get(f))
+                    for f, change in delta.items())
+        if not stale:
+            fresh = {f for f, change in delta.items() if change != "removed" and f not in tracks}
+            added = new_df[new_df["filename"].isin(fresh)]
+            ingest(sketches, added)
+            tracks.update(track_hashes(added, hashes))
+            save_sketches(sketches, path, applied, tracks)
+            return "ingested", len(added)
+    save_sketches(ingest(new_sketches(), new_df), path, applied, track_hashes(new_df, hashes))
+    return "rebuilt", len(new_df)
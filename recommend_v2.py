@@ -9,18 +9,52 @@ Timbre 推薦引擎 v4（Semantic Matching 版）
 4. 計算每首歌與目標的 euclidean similarity
 5. 排序推薦
 """
+import hashlib
+import json
+import os
+
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+
+from bundle import (
+    resolve_bundle_dir, read_manifest, load_library_npz,
+    ENCODER_DIR, EMBEDDINGS_FILE, LIBRARY_FILE,
+)
+from feature_index import FeatureIndex, normalize_target
+
+# ── Offline bundle (TIMBRE_BUNDLE_DIR) ────────────────────
+# 有 bundle 時 encoder / 情緒向量 / 歌曲庫全部從 bundle 讀，不碰 HF Hub。
+BUNDLE_DIR = resolve_bundle_dir()
+BUNDLE_MANIFEST = read_manifest(BUNDLE_DIR) if BUNDLE_DIR else None
+if BUNDLE_DIR:
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+MODEL_PATH = os.path.join(BUNDLE_DIR, ENCODER_DIR) if BUNDLE_DIR else MODEL_NAME
+
+# TIMBRE_ENCODER_WORKERS > 0: run the encoder in that many worker processes
+# (encoder_pool.py) instead of in this one; each uses TIMBRE_ENCODER_THREADS torch threads.
+ENCODER_WORKERS = int(os.environ.get("TIMBRE_ENCODER_WORKERS", "0"))
+# float | int8 | onnx — see encoder_backends.py (and its --report before switching)
+ENCODER_BACKEND = os.environ.get("TIMBRE_ENCODER_BACKEND", "float")
 
 # ── 載入 sentence-transformer 模型 ────────────────────────
 print("載入語意模型中...")
-semantic_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-print("✅ 語意模型載入完成")
-
-# ── 載入特徵數據（single source of truth）─────────────────
-song_data = pd.read_csv("song_features.csv")
-song_data["emotion"] = song_data["emotion"].fillna("focused")
+if ENCODER_WORKERS > 0:
+    from encoder_pool import EncoderPool
+    semantic_model = EncoderPool(MODEL_PATH, workers=ENCODER_WORKERS, backend=ENCODER_BACKEND,
+                                 torch_threads=int(os.environ.get("TIMBRE_ENCODER_THREADS", "1")))
+    print(f"✅ 語意模型載入完成（{ENCODER_WORKERS} 個 encoder worker process，{ENCODER_BACKEND}）")
+else:
+    from encoder_backends import load_encoder  # after the offline env above
+    semantic_model = load_encoder(ENCODER_BACKEND, MODEL_PATH)
+    if ENCODER_BACKEND != "float":
+        print(f"✅ 語意模型載入完成（{ENCODER_BACKEND}）")
+    elif BUNDLE_DIR:
+        print(f"✅ 語意模型載入完成（bundle {BUNDLE_MANIFEST['version']}）")
+    else:
+        print("✅ 語意模型載入完成")
 
 # 用於推薦的特徵欄位
 FEATURE_COLS = [
@@ -29,31 +63,7 @@ FEATURE_COLS = [
     "mood_relaxed", "mood_party", "danceability",
 ]
 
-# ── 修正 Essentia 模型的偏差 ──────────────────────────────
-arousal_norm = (song_data["arousal"] - song_data["arousal"].min()) / \
-               (song_data["arousal"].max() - song_data["arousal"].min() + 1e-8)
-
-song_data["mood_relaxed_corrected"] = (
-    song_data["mood_relaxed"]
-    * (1 - song_data["mood_aggressive"])
-    * (1 - arousal_norm * 0.6)
-)
-
-song_data["mood_sad_corrected"] = (
-    song_data["mood_sad"]
-    * (1 - arousal_norm * 0.3)
-)
-
-# 正規化特徵到 [0, 1]
-feature_matrix = song_data[FEATURE_COLS].copy()
-feature_matrix["mood_relaxed"] = song_data["mood_relaxed_corrected"]
-feature_matrix["mood_sad"] = song_data["mood_sad_corrected"]
-
-_feat_min = feature_matrix.min()
-_feat_max = feature_matrix.max()
-feature_matrix = (feature_matrix - _feat_min) / (_feat_max - _feat_min + 1e-8)
-
-feature_vectors = feature_matrix.values  # shape: (n_songs, n_features)
+SONG_FEATURES_PATH = os.path.join(BUNDLE_DIR, LIBRARY_FILE) if BUNDLE_DIR else "song_features.csv"
 
 # ── Derive MOOD_PROFILES from actual data medians ─────────
 # This guarantees targets live in the same normalized space as features.
@@ -77,7 +87,7 @@ _FALLBACK_PROFILES = {
     "focused":             {"valence": 0.5,  "arousal": 0.5,  "bpm": 0.5,  "mood_happy": 0.2,  "mood_sad": 0.2,  "mood_aggressive": 0.1,  "mood_relaxed": 0.6,  "mood_party": 0.1,  "danceability": 0.4},
 }
 
-def _compute_data_profiles():
+def _compute_data_profiles(song_data, feature_matrix):
     """Compute per-category median feature vectors from normalized song data."""
     profiles = {}
     for emotion in song_data["emotion"].unique():
@@ -88,12 +98,302 @@ def _compute_data_profiles():
         profiles[emotion] = {col: float(median_vec[col]) for col in FEATURE_COLS}
     return profiles
 
-_data_profiles = _compute_data_profiles()
 
-# Merge: data-derived profiles take priority, fallbacks fill gaps
-MOOD_PROFILES = {}
-for emotion in _FALLBACK_PROFILES:
-    MOOD_PROFILES[emotion] = _data_profiles.get(emotion, _FALLBACK_PROFILES[emotion])
+# ── Library snapshot ──────────────────────────────────────
+PROFILE_BINS = 1024   # resolution of the per-emotion median histograms
+
+
+class LibrarySnapshot:
+    """One consistent version of the library: data, normalized matrix, profiles.
+
+    Never mutated after construction — a reload builds a new snapshot and
+    swap_library() replaces the reference, so a request that grabbed the old
+    one keeps a coherent view until it finishes.
+
+    raw_matrix / arousal_bounds / profile_hists are the running state that
+    apply_library_delta() needs to update the snapshot incrementally.
+    """
+
+    def __init__(self, song_data, feature_matrix, feat_min, feat_max,
+                 data_profiles, mood_profiles, version,
+                 raw_matrix=None, arousal_bounds=None, profile_hists=None):
+        self.song_data = song_data
+        self.feature_matrix = feature_matrix
+        self.feature_vectors = feature_matrix.values  # shape: (n_songs, n_features)
+        self.feat_min = feat_min
+        self.feat_max = feat_max
+        self.data_profiles = data_profiles
+        self.mood_profiles = mood_profiles
+        self.version = version
+        self.raw_matrix = raw_matrix            # corrected, un-normalized features
+        self.arousal_bounds = arousal_bounds    # (min, max) used for arousal_norm
+        self.profile_hists = profile_hists      # emotion → (n_features, PROFILE_BINS) counts
+        self._feature_index = None              # KD-trees for nearest_songs, built on first use
+
+    def feature_index(self):
+        if self._feature_index is None:
+            self._feature_index = FeatureIndex(self.feature_vectors, self.song_data["emotion"].values)
+        return self._feature_index
+
+
+def _apply_corrections(song_data, a_min, a_max):
+    """修正 Essentia 模型的偏差 — adds the *_corrected columns in place."""
+    arousal_norm = (song_data["arousal"] - a_min) / (a_max - a_min + 1e-8)
+
+    song_data["mood_relaxed_corrected"] = (
+        song_data["mood_relaxed"]
+        * (1 - song_data["mood_aggressive"])
+        * (1 - arousal_norm * 0.6)
+    )
+
+    song_data["mood_sad_corrected"] = (
+        song_data["mood_sad"]
+        * (1 - arousal_norm * 0.3)
+    )
+
+
+def _raw_features(song_data):
+    feature_matrix = song_data[FEATURE_COLS].copy()
+    feature_matrix["mood_relaxed"] = song_data["mood_relaxed_corrected"]
+    feature_matrix["mood_sad"] = song_data["mood_sad_corrected"]
+    return feature_matrix
+
+
+def _merge_profiles(data_profiles):
+    # Merge: data-derived profiles take priority, fallbacks fill gaps
+    return {
+        emotion: data_profiles.get(emotion, _FALLBACK_PROFILES[emotion])
+        for emotion in _FALLBACK_PROFILES
+    }
+
+
+# ── Approximate per-emotion medians (histograms over [0, 1]) ──
+def _bin_index(values):
+    return np.clip((values * PROFILE_BINS).astype(int), 0, PROFILE_BINS - 1)
+
+
+def _emotion_hist(rows):
+    """(n_rows, n_features) normalized values → (n_features, PROFILE_BINS) counts."""
+    bins = _bin_index(rows)
+    hist = np.zeros((len(FEATURE_COLS), PROFILE_BINS), dtype=np.int32)
+    for j in range(len(FEATURE_COLS)):
+        hist[j] = np.bincount(bins[:, j], minlength=PROFILE_BINS)
+    return hist
+
+
+def _build_hists(emotions, normalized):
+    return {e: _emotion_hist(normalized[emotions == e]) for e in np.unique(emotions)}
+
+
+def _hist_median(hist):
+    """Median per feature, linearly interpolated inside the median bin."""
+    n = hist[0].sum()
+    cum = np.cumsum(hist, axis=1)
+    half = n / 2.0
+    idx = (cum < half).sum(axis=1)
+    below = np.where(idx > 0, cum[np.arange(len(idx)), idx - 1], 0)
+    in_bin = hist[np.arange(len(idx)), idx]
+    frac = np.where(in_bin > 0, (half - below) / np.maximum(in_bin, 1), 0.5)
+    return (idx + frac) / PROFILE_BINS
+
+
+def build_library(song_data, version=None):
+    """Run the feature pipeline on a song_features DataFrame → LibrarySnapshot."""
+    song_data = song_data.reset_index(drop=True)
+    song_data["emotion"] = song_data["emotion"].fillna("focused")
+
+    a_min, a_max = song_data["arousal"].min(), song_data["arousal"].max()
+    _apply_corrections(song_data, a_min, a_max)
+
+    # 正規化特徵到 [0, 1]
+    feature_matrix = _raw_features(song_data)
+    raw_matrix = feature_matrix.values.copy()
+
+    feat_min = feature_matrix.min()
+    feat_max = feature_matrix.max()
+    feature_matrix = (feature_matrix - feat_min) / (feat_max - feat_min + 1e-8)
+
+    data_profiles = _compute_data_profiles(song_data, feature_matrix)
+    profile_hists = _build_hists(song_data["emotion"].values, feature_matrix.values)
+
+    return LibrarySnapshot(song_data, feature_matrix, feat_min, feat_max,
+                           data_profiles, _merge_profiles(data_profiles), version,
+                           raw_matrix=raw_matrix, arousal_bounds=(a_min, a_max),
+                           profile_hists=profile_hists)
+
+
+# ── Incremental updates ───────────────────────────────────
+def _bounds_after(values_kept, values_added, old_lo, old_hi, removed_values):
+    """New (min, max) of a column; only rescans kept rows if a removed row held a bound."""
+    lo, hi = old_lo, old_hi
+    if len(removed_values) and (np.any(removed_values <= old_lo) or np.any(removed_values >= old_hi)):
+        lo = values_kept.min(axis=0) if len(values_kept) else np.inf
+        hi = values_kept.max(axis=0) if len(values_kept) else -np.inf
+    if len(values_added):
+        lo = np.minimum(lo, values_added.min(axis=0))
+        hi = np.maximum(hi, values_added.max(axis=0))
+    return lo, hi
+
+
+def apply_library_delta(snapshot, added=None, removed_titles=(), version=None):
+    """Return a new snapshot with tracks added/removed, without a full rebuild.
+
+    added: DataFrame of song_features rows (an existing title counts as a change).
+    Normalization is only redone when the min/max bounds actually move; otherwise
+    only the new rows are normalized. Profiles of the emotions touched by the
+    delta are re-derived from per-emotion histograms (approximate medians).
+    """
+    if added is None:
+        added = snapshot.song_data.iloc[0:0][[c for c in snapshot.song_data.columns
+                                              if not c.endswith("_corrected")]]
+    added = added.reset_index(drop=True).copy()
+    added["emotion"] = added["emotion"].fillna("focused") if "emotion" in added else "focused"
+
+    old = snapshot.song_data
+    drop = old["title"].isin(set(removed_titles) | set(added["title"])).values
+    keep = ~drop
+    if not drop.any() and added.empty:
+        return snapshot
+
+    # 1. arousal bounds → corrected columns
+    a_lo, a_hi = snapshot.arousal_bounds
+    new_a_lo, new_a_hi = _bounds_after(
+        old["arousal"].values[keep], added["arousal"].values,
+        a_lo, a_hi, old["arousal"].values[drop])
+    arousal_moved = (new_a_lo, new_a_hi) != (a_lo, a_hi)
+
+    kept = old.loc[keep]
+    _apply_corrections(added, new_a_lo, new_a_hi)
+    song_data = pd.concat([kept, added.reindex(columns=kept.columns)], ignore_index=True)
+    if arousal_moved:
+        _apply_corrections(song_data, new_a_lo, new_a_hi)
+        raw = _raw_features(song_data).values
+    else:
+        raw = np.vstack([snapshot.raw_matrix[keep], _raw_features(added).values])
+
+    # 2. normalization bounds
+    f_lo, f_hi = snapshot.feat_min.values, snapshot.feat_max.values
+    if arousal_moved:
+        new_lo, new_hi = raw.min(axis=0), raw.max(axis=0)
+    else:
+        new_lo, new_hi = _bounds_after(
+            raw[:keep.sum()], raw[keep.sum():], f_lo, f_hi, snapshot.raw_matrix[drop])
+    feat_min = pd.Series(new_lo, index=FEATURE_COLS)
+    feat_max = pd.Series(new_hi, index=FEATURE_COLS)
+    rescale = arousal_moved or not (np.array_equal(new_lo, f_lo) and np.array_equal(new_hi, f_hi))
+
+    emotions = song_data["emotion"].values
+    if rescale:
+        normalized = (raw - new_lo) / (new_hi - new_lo + 1e-8)
+        profile_hists = _build_hists(emotions, normalized)
+        touched = set(np.unique(emotions)) | set(snapshot.profile_hists)
+    else:
+        added_norm = (raw[keep.sum():] - new_lo) / (new_hi - new_lo + 1e-8)
+        normalized = np.vstack([snapshot.feature_vectors[keep], added_norm])
+        profile_hists = dict(snapshot.profile_hists)
+        removed_emotions = old["emotion"].values[drop]
+        removed_norm = snapshot.feature_vectors[drop]
+        touched = set(removed_emotions) | set(added["emotion"])
+        for e in touched:
+            hist = profile_hists.get(e)
+            hist = np.zeros((len(FEATURE_COLS), PROFILE_BINS), dtype=np.int32) if hist is None else hist.copy()
+            hist -= _emotion_hist(removed_norm[removed_emotions == e])
+            hist += _emotion_hist(added_norm[added["emotion"].values == e])
+            profile_hists[e] = hist
+
+    # 3. profiles — only touched emotions change
+    data_profiles = {e: p for e, p in snapshot.data_profiles.items() if e not in touched}
+    for e in touched:
+        hist = profile_hists.get(e)
+        if hist is not None and hist[0].sum() >= 3:
+            data_profiles[e] = dict(zip(FEATURE_COLS, map(float, _hist_median(hist))))
+
+    feature_matrix = pd.DataFrame(normalized, columns=FEATURE_COLS)
+    return LibrarySnapshot(song_data, feature_matrix, feat_min, feat_max,
+                           data_profiles, _merge_profiles(data_profiles), version,
+                           raw_matrix=raw, arousal_bounds=(new_a_lo, new_a_hi),
+                           profile_hists=profile_hists)
+
+
+def diff_library(snapshot, new_df):
+    """Compare a freshly read song_features DataFrame with a snapshot.
+
+    Returns (added_or_changed_rows, removed_titles).
+    """
+    cols = ["filename"] + FEATURE_COLS + ["emotion"]
+    new_df = new_df.copy()
+    new_df["emotion"] = new_df["emotion"].fillna("focused")
+    old = snapshot.song_data.set_index("title")[cols]
+    new = new_df.set_index("title")
+    removed = old.index.difference(new.index)
+    common = new.index.intersection(old.index)
+    changed = (new.loc[common, cols] != old.loc[common, cols]).any(axis=1)
+    changed_titles = common[changed.values]
+    added_titles = new.index.difference(old.index)
+    mask = new_df["title"].isin(added_titles.union(changed_titles))
+    return new_df[mask], list(removed)
+
+
+def library_version(path=SONG_FEATURES_PATH):
+    """Cheap change token for a library file (mtime + size)."""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def read_library_file(path=SONG_FEATURES_PATH):
+    """song_features as a DataFrame — CSV, or the bundle's library.npz."""
+    if path.endswith(".npz"):
+        return load_library_npz(path)
+    return pd.read_csv(path)
+
+
+# TIMBRE_SHARED_DIR (e.g. /dev/shm/timbre): app processes on one host map one
+# read-only copy of each library version (shared_library.py) instead of building their own.
+SHARED_DIR = os.environ.get("TIMBRE_SHARED_DIR", "")
+
+
+def shared_or_build(version, build):
+    """build() → LibrarySnapshot; with SHARED_DIR, attach the copy another worker published."""
+    if not SHARED_DIR:
+        return build()
+    from shared_library import load_or_publish
+    return load_or_publish(SHARED_DIR, version, build, LibrarySnapshot)
+
+
+def load_library(path=SONG_FEATURES_PATH):
+    version = library_version(path)
+    return shared_or_build(version, lambda: build_library(read_library_file(path), version=version))
+
+
+# ── 載入特徵數據（single source of truth）─────────────────
+_library = load_library()
+
+
+def get_library():
+    """Current snapshot — grab it once per request and use it throughout."""
+    return _library
+
+
+def swap_library(snapshot):
+    """Atomically publish a new snapshot (a single reference assignment)."""
+    global _library, song_data, feature_matrix, feature_vectors
+    global _feat_min, _feat_max, _data_profiles, MOOD_PROFILES
+    _library = snapshot
+    song_data = snapshot.song_data
+    feature_matrix = snapshot.feature_matrix
+    feature_vectors = snapshot.feature_vectors
+    _feat_min, _feat_max = snapshot.feat_min, snapshot.feat_max
+    _data_profiles = snapshot.data_profiles
+    MOOD_PROFILES = snapshot.mood_profiles
+
+
+# Module-level aliases of the current snapshot (for scripts / REPL use)
+song_data = _library.song_data
+feature_matrix = _library.feature_matrix
+feature_vectors = _library.feature_vectors
+_feat_min, _feat_max = _library.feat_min, _library.feat_max
+_data_profiles = _library.data_profiles
+MOOD_PROFILES = _library.mood_profiles
 
 print(f"✅ MOOD_PROFILES: {len(_data_profiles)} from data, "
       f"{len(MOOD_PROFILES) - len(_data_profiles)} from fallback")
@@ -140,42 +440,94 @@ EMOTION_DESCRIPTIONS = {
     "focused":             "studying working concentration productive chill background neutral steady",
 }
 
+EMOTION_ORDER = list(EMOTION_DESCRIPTIONS)
+
+
+def _unit_rows(m):
+    m = np.atleast_2d(np.asarray(m, dtype=np.float32))
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def _load_emotion_matrix():
+    """(n_emotions, dim) unit vectors in EMOTION_ORDER; the bundle's copy if it still matches.
+
+    The bundle holds float-model vectors, so other backends embed the descriptions
+    themselves — queries and emotions then come from the same encoder.
+    """
+    matches = BUNDLE_DIR and BUNDLE_MANIFEST.get("descriptions") == EMOTION_DESCRIPTIONS
+    if matches and ENCODER_BACKEND == "float":
+        return _unit_rows(np.load(os.path.join(BUNDLE_DIR, EMBEDDINGS_FILE)))
+    if BUNDLE_DIR and not matches:
+        print("  ⚠️ bundle 的情緒描述與程式不同，改用 bundle encoder 重新計算")
+    return _unit_rows(semantic_model.encode([EMOTION_DESCRIPTIONS[e] for e in EMOTION_ORDER],
+                                            convert_to_numpy=True))
+
+
 print("預計算情緒語意向量中...")
-emotion_embeddings = {
-    emotion: semantic_model.encode(desc, convert_to_tensor=True)
-    for emotion, desc in EMOTION_DESCRIPTIONS.items()
-}
+if SHARED_DIR:
+    from shared_library import shared_array
+    _key = hashlib.blake2b(json.dumps([MODEL_PATH, ENCODER_BACKEND, EMOTION_DESCRIPTIONS]).encode("utf-8"),
+                           digest_size=8).hexdigest()
+    EMOTION_MATRIX = shared_array(SHARED_DIR, f"emotions-{_key}", _load_emotion_matrix)
+else:
+    EMOTION_MATRIX = _load_emotion_matrix()
+emotion_embeddings = dict(zip(EMOTION_ORDER, EMOTION_MATRIX))
 print("✅ 情緒語意向量準備完成\n")
 
 def detect_emotion_semantic(text):
     """將輸入文字對應到最符合的 Emotion 標籤"""
-    query_tensor = semantic_model.encode(text, convert_to_tensor=True)
-
-    scores = {}
-    for emotion, em_tensor in emotion_embeddings.items():
-        cos_score = util.cos_sim(query_tensor, em_tensor)[0].cpu().numpy()[0]
-        scores[emotion] = float(cos_score)
+    query = _unit_rows(semantic_model.encode(text, convert_to_numpy=True))[0]
+    sims = EMOTION_MATRIX @ query   # cosine similarity (rows are unit length)
 
+    scores = {emotion: float(s) for emotion, s in zip(EMOTION_ORDER, sims)}
     best = max(scores, key=scores.get)
     return best, scores
 
 
-def recommend(mood_description, top_k=5, return_results=False):
-    """推薦歌曲 — returns list of dicts with song metadata + score."""
-    if not mood_description or not mood_description.strip():
-        if not return_results:
-            print("  ⚠️ 請輸入情緒描述")
-        return []
+def detect_emotions_semantic(texts):
+    """Batch 版 detect_emotion_semantic：一次 encode 全部文字 → [(best, scores), ...]"""
+    queries = _unit_rows(semantic_model.encode(list(texts), convert_to_numpy=True))
+    out = []
+    for sims in queries @ EMOTION_MATRIX.T:
+        scores = {emotion: float(s) for emotion, s in zip(EMOTION_ORDER, sims)}
+        out.append((max(scores, key=scores.get), scores))
+    return out
 
-    # 1. Semantic emotion detection
-    best_emotion, scores = detect_emotion_semantic(mood_description)
 
-    if not return_results:
-        print(f"  [情緒偵測] {mood_description} → {best_emotion} ({scores[best_emotion]:.3f})")
+RESULT_FEATURES = ["bpm", "valence", "arousal", "mood_happy", "mood_sad",
+                   "mood_aggressive", "mood_relaxed", "mood_party", "danceability"]
+
+
+def result_rows(song_data, indices, sim_scores):
+    """Result dicts for song rows `indices`; sim_scores[i] belongs to indices[i]."""
+    results = []
+    for idx, sim in zip(indices, sim_scores):
+        row = song_data.iloc[idx]
+        results.append({
+            "title":    row["title"],
+            "filename": row["filename"],
+            "score":    float(sim),
+            "emotion":  row["emotion"],
+            "features": {col: float(row[col]) for col in RESULT_FEATURES},
+        })
+    return results
+
+
+def rank_order(best_emotion, library=None, candidates=None):
+    """Ranking for a detected emotion → (song indices best first, their sim_scores).
+
+    candidates: sorted row indices to rank (e.g. from a prefilter); None ranks
+    the whole library. Only those rows are scored.
+    """
+    lib = library or _library
+    feature_vectors = lib.feature_vectors
+    emotions = lib.song_data["emotion"].values
+    if candidates is not None:
+        feature_vectors, emotions = feature_vectors[candidates], emotions[candidates]
 
     # 2. Target feature vector from data-derived profiles
     target_vector = np.array([
-        MOOD_PROFILES.get(best_emotion, MOOD_PROFILES["focused"])[col] for col in FEATURE_COLS
+        lib.mood_profiles.get(best_emotion, lib.mood_profiles["focused"])[col] for col in FEATURE_COLS
     ])
 
     # 3. Vectorized Euclidean similarity
@@ -183,29 +535,74 @@ def recommend(mood_description, top_k=5, return_results=False):
     sim_scores = 1.0 / (1.0 + dists)
 
     # 4. Tiered emotion boosting (primary + neighbors for sparse categories)
-    is_primary = (song_data["emotion"] == best_emotion).values
+    is_primary = emotions == best_emotion
     neighbors = EMOTION_NEIGHBORS.get(best_emotion, [])
-    is_neighbor = song_data["emotion"].isin(neighbors).values
+    is_neighbor = np.isin(emotions, neighbors)
 
     primary_boost = 100.0
     neighbor_boost = 30.0
     final_scores = sim_scores + (is_primary * primary_boost) + (is_neighbor * neighbor_boost)
 
-    top_indices = np.argsort(final_scores)[::-1][:top_k]
+    order = np.argsort(final_scores)[::-1]
+    return (order if candidates is None else np.asarray(candidates)[order]), sim_scores[order]
+
+
+def rank_for_emotion(best_emotion, top_k=5, library=None, candidates=None):
+    """Top-k songs for an already-detected emotion (steps 2–5 of recommend())."""
+    lib = library or _library
+    order, sim_scores = rank_order(best_emotion, lib, candidates)
 
     # 5. Build result dicts with metadata
-    results = []
-    for idx in top_indices:
-        row = song_data.iloc[idx]
-        results.append({
-            "title":    row["title"],
-            "filename": row["filename"],
-            "score":    float(sim_scores[idx]),
-            "emotion":  row["emotion"],
-            "features": {col: float(row[col]) for col in
-                         ["bpm", "valence", "arousal", "mood_happy", "mood_sad",
-                          "mood_aggressive", "mood_relaxed", "mood_party", "danceability"]},
-        })
+    return result_rows(lib.song_data, order[:top_k], sim_scores[:top_k])
+
+
+def nearest_songs(target=None, title=None, top_k=5, emotion=None, library=None):
+    """離目標特徵最近的歌曲 — target: {feature: 原始單位的值} 或 title: 曲庫中的種子歌曲（不含自己）。
+
+    target 沒給的特徵用 emotion 的 profile 值（沒給 emotion 時用曲庫中位數）。
+    emotion: 同 rank_order 的分層 — 該情緒的歌優先，再來是 EMOTION_NEIGHBORS，最後其他。
+    title 不在曲庫時回傳 None；target 有未知特徵時 raise ValueError。
+    """
+    lib = library or _library
+    index = lib.feature_index()
+    exclude = ()
+    if title is not None:
+        matches = np.flatnonzero(lib.song_data["title"].values == title)
+        if not len(matches):
+            return None
+        exclude = matches[:1]
+        target_vector = lib.feature_vectors[matches[0]]
+    else:
+        defaults = ([lib.mood_profiles.get(emotion, lib.mood_profiles["focused"])[col] for col in FEATURE_COLS]
+                    if emotion else index.median)
+        target_vector = normalize_target(target or {}, lib.feat_min, lib.feat_max, defaults)
+    rows, dists = index.nearest(target_vector, top_k, emotion, EMOTION_NEIGHBORS.get(emotion, []), exclude)
+    return result_rows(lib.song_data, rows, 1.0 / (1.0 + dists))
+
+
+def similar_songs(title, top_k=5, library=None):
+    """與指定歌曲聲學特徵最接近的歌曲（不含自己）；title 不在曲庫時回傳 None"""
+    return nearest_songs(title=title, top_k=top_k, library=library)
+
+
+def recommend(mood_description, top_k=5, return_results=False, library=None, candidates=None):
+    """推薦歌曲 — returns list of dicts with song metadata + score.
+
+    library:    LibrarySnapshot to rank against (defaults to the current one).
+    candidates: only rank these row indices (see prefilter.py); None = whole library.
+    """
+    if not mood_description or not mood_description.strip():
+        if not return_results:
+            print("  ⚠️ 請輸入情緒描述")
+        return []
+
+    # 1. Semantic emotion detection
+    best_emotion, scores = detect_emotion_semantic(mood_description)
+
+    if not return_results:
+        print(f"  [情緒偵測] {mood_description} → {best_emotion} ({scores[best_emotion]:.3f})")
+
+    results = rank_for_emotion(best_emotion, top_k, library, candidates)
 
     if not return_results:
         print(f"\n🎵 情緒描述：「{mood_description}」")
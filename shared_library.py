@@ -0,0 +1,163 @@
+"""
+Timbre – Library arrays shared by several app processes on one host
+
+With TIMBRE_SHARED_DIR set (e.g. /dev/shm/timbre), the first process that
+needs a library version builds it and publishes its arrays as .npy files
+under that directory; every other process (and the publisher itself)
+attaches them read-only with np.load(mmap_mode="r"), so the pages live once
+in the page cache instead of once per worker. A file lock elects the
+publisher — no separate coordinator process is needed.
+
+  <root>/lib-<version>/
+      numeric.npy    float64 song_data columns (one pandas block, no copy)
+      features.npy   normalized feature matrix
+      raw.npy        corrected, un-normalized features
+      hists.npy      int32 per-emotion histograms (emotions listed in meta)
+      meta.json      column order, string columns, bounds, profiles
+  <root>/<name>.npy  other shared arrays (e.g. the emotion embeddings)
+
+Older versions are pruned after a publish; a worker that still maps one
+keeps it readable until it lets go (unlinked files stay mapped).
+"""
+import contextlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:     # not on Windows — no cross-process lock there
+    fcntl = None
+
+KEEP_VERSIONS = 2
+
+
+@contextlib.contextmanager
+def _locked(root):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _lib_dir(root, version):
+    return os.path.join(root, f"lib-{version}")
+
+
+def _save(path, arr):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(arr))
+
+
+# ── Library snapshot ──────────────────────────────────────
+def publish(lib, root):
+    """Write a LibrarySnapshot's arrays to <root>/lib-<version> (atomic rename)."""
+    final = _lib_dir(root, lib.version)
+    if os.path.isdir(final):
+        return final
+    tmp = f"{final}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    df = lib.song_data
+    numeric = [c for c in df.columns if df[c].dtype == np.float64]
+    others = {c: {"dtype": str(df[c].dtype), "values": df[c].tolist()}
+              for c in df.columns if c not in numeric}
+    hist_emotions = sorted(lib.profile_hists)
+    _save(os.path.join(tmp, "numeric.npy"), df[numeric].to_numpy(dtype=np.float64))
+    _save(os.path.join(tmp, "features.npy"), lib.feature_vectors)
+    _save(os.path.join(tmp, "raw.npy"), lib.raw_matrix)
+    _save(os.path.join(tmp, "hists.npy"), np.stack([lib.profile_hists[e] for e in hist_emotions])
+          if hist_emotions else np.zeros((0, 0, 0), dtype=np.int32))
+    meta = {
+        "version": lib.version,
+        "columns": list(df.columns),
+        "numeric_columns": numeric,
+        "other_columns": others,
+        "feature_columns": list(lib.feature_matrix.columns),
+        "feat_min": [float(x) for x in lib.feat_min.values],
+        "feat_max": [float(x) for x in lib.feat_max.values],
+        "data_profiles": lib.data_profiles,
+        "mood_profiles": lib.mood_profiles,
+        "arousal_bounds": [float(x) for x in lib.arousal_bounds],
+        "hist_emotions": hist_emotions,
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.rename(tmp, final)
+    return final
+
+
+def attach(root, version, snapshot_cls):
+    """Map a published version read-only → snapshot_cls instance, or None if absent."""
+    d = _lib_dir(root, version)
+    try:
+        with open(os.path.join(d, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    def load(name):
+        return np.load(os.path.join(d, name), mmap_mode="r")
+
+    song_data = pd.DataFrame(load("numeric.npy"), columns=meta["numeric_columns"], copy=False)
+    for pos, col in enumerate(meta["columns"]):   # in order, so every position is valid
+        if col in meta["other_columns"]:
+            spec = meta["other_columns"][col]
+            song_data.insert(pos, col, pd.Series(spec["values"], dtype=spec["dtype"]))
+
+    cols = meta["feature_columns"]
+    hists = load("hists.npy")
+    return snapshot_cls(
+        song_data,
+        pd.DataFrame(load("features.npy"), columns=cols, copy=False),
+        pd.Series(meta["feat_min"], index=cols),
+        pd.Series(meta["feat_max"], index=cols),
+        meta["data_profiles"], meta["mood_profiles"], meta["version"],
+        raw_matrix=load("raw.npy"),
+        arousal_bounds=tuple(meta["arousal_bounds"]),
+        profile_hists=dict(zip(meta["hist_emotions"], hists)),
+    )
+
+
+def _prune(root, keep):
+    dirs = [os.path.join(root, n) for n in os.listdir(root) if n.startswith("lib-")]
+    dirs.sort(key=os.path.getmtime, reverse=True)
+    for d in dirs[KEEP_VERSIONS:]:
+        if d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def load_or_publish(root, version, build, snapshot_cls):
+    """Attach `version` if published; otherwise build(), publish and attach it.
+
+    Runs under the directory lock, so concurrent workers build each version once.
+    """
+    with _locked(root):
+        lib = attach(root, version, snapshot_cls)
+        if lib is None:
+            built = build()
+            publish(built, root)
+            _prune(root, keep=_lib_dir(root, version))
+            lib = attach(root, built.version, snapshot_cls)
+    return lib
+
+
+# ── Other arrays ──────────────────────────────────────────
+def shared_array(root, name, build):
+    """<root>/<name>.npy mapped read-only; build() → ndarray publishes it the first time."""
+    path = os.path.join(root, f"{name}.npy")
+    with _locked(root):
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp-{os.getpid()}"
+            _save(tmp, build())
+            os.rename(tmp, path)
+        return np.load(path, mmap_mode="r")
@@ -0,0 +1,101 @@
+"""
+Timbre – Precompressed, ETag-cached HTTP assets
+
+A payload is encoded once (identity / gzip / brotli) when it is built, not
+per request. Browsers revalidate with If-None-Match and get a 304 while the
+content is unchanged.
+
+With share_dir, the variants are stored content-addressed on disk (e.g. under
+/dev/shm) and memory-mapped, so app workers on one host serving the same
+payload share one copy — and only the first one pays for compression.
+"""
+import gzip
+import hashlib
+import mmap
+import os
+import shutil
+
+try:
+    import brotli   # optional — gzip is always available
+except ImportError:
+    brotli = None
+
+from starlette.responses import Response
+
+
+class CompressedAsset:
+    """Immutable bytes plus their precompressed variants and a strong ETag."""
+
+    def __init__(self, body, media_type, share_dir=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.media_type = media_type
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.etag = '"' + digest + '"'
+        if share_dir and body:
+            self.variants = _shared_variants(os.path.join(share_dir, digest), body)
+        else:
+            self.variants = _compress(body)
+
+    @property
+    def size(self):
+        return len(self.variants["identity"])
+
+    def pick(self, accept_encoding):
+        """Smallest variant the client accepts → (encoding, bytes)."""
+        accepted = {e.split(";")[0].strip() for e in (accept_encoding or "").split(",")}
+        for enc in ("br", "gzip"):
+            if enc in accepted and enc in self.variants:
+                return enc, self.variants[enc]
+        return "identity", self.variants["identity"]
+
+
+def _compress(body):
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+SHARED_KEEP = 8   # newest shared payloads kept per directory
+
+
+def _shared_variants(path, body):
+    """Variants of body under path/ (written once, atomically), memory-mapped read-only."""
+    if not os.path.isdir(path):
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for enc, data in _compress(body).items():
+            with open(os.path.join(tmp, enc), "wb") as f:
+                f.write(data)
+        try:
+            os.rename(tmp, path)
+        except OSError:   # another worker published it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        _prune(os.path.dirname(path), keep=path)
+    variants = {}
+    for enc in os.listdir(path):
+        with open(os.path.join(path, enc), "rb") as f:
+            variants[enc] = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    return variants
+
+
+def _prune(root, keep):
+    dirs = [os.path.join(root, n) for n in os.listdir(root) if ".tmp-" not in n]
+    dirs.sort(key=os.path.getmtime, reverse=True)
+    for d in dirs[SHARED_KEEP:]:
+        if d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def asset_response(request, asset, cache_control="no-cache"):
+    """200 with the best encoding, or 304 if the client already has this ETag."""
+    headers = {"ETag": asset.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    inm = request.headers.get("if-none-match", "")
+    if asset.etag in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    encoding, body = asset.pick(request.headers.get("accept-encoding"))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=asset.media_type, headers=headers)
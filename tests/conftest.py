@@ -0,0 +1,31 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root (python app.py, python bundle.py, …)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_or_skip(name):
+    # recommend_v2 loads the sentence encoder at import: use the local cache, never download
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    try:
+        return importlib.import_module(name)
+    except OSError as e:   # no bundle and no cached model
+        pytest.skip(f"{name} needs the sentence encoder: {e}")
+
+
+@pytest.fixture(scope="session")
+def recommend_v2():
+    return _import_or_skip("recommend_v2")
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # no lookups, no library watcher, no writes to the real ID cache
+    os.environ.setdefault("TIMBRE_YT_DB", str(tmp_path_factory.mktemp("yt") / "youtube_ids.sqlite"))
+    os.environ.setdefault("TIMBRE_YT_BACKENDS", "")
+    os.environ.setdefault("TIMBRE_RELOAD_INTERVAL", "0")
+    return _import_or_skip("app")
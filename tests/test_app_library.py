@@ -0,0 +1,64 @@
+"""app.py against the served library: filtered rankings after a rescan or lookup, and /api/v1 input checks."""
+import pytest
+
+
+@pytest.fixture
+def snap(app, monkeypatch):
+    """The served AppLibrary, rebuilt with nothing available locally or on YouTube."""
+    monkeypatch.setattr(app, "scan_local_audio", lambda: ("empty", {}))
+    snap = app.build_app_library(app._app_lib.lib)
+    snap.youtube_ids.clear()
+    monkeypatch.setattr(app, "_app_lib", snap)
+    return snap
+
+
+def _ranked(app, snap, available):
+    filters = app.Filters(available=available).key()
+    return [r["title"] for r in snap.ranked(app.EMOTION_ORDER[0], len(snap.lib.song_data), filters=filters)]
+
+
+def test_rescan_changes_local_rankings(app, snap, monkeypatch):
+    assert _ranked(app, snap, "local") == [] and _ranked(app, snap, "playable") == []
+    row = snap.lib.song_data.iloc[3]
+    monkeypatch.setattr(app, "scan_local_audio", lambda: ("rescanned", {row["filename"]: "/songs/x.mp3"}))
+    app.refresh_local_audio()
+
+    after = app._app_lib
+    assert after.lib is snap.lib                 # same library version, new generation
+    assert _ranked(app, after, "local") == [row["title"]]
+    assert _ranked(app, after, "playable") == [row["title"]]
+    assert _ranked(app, after, "youtube") == []
+
+
+def test_resolved_id_changes_youtube_rankings(app, snap):
+    assert _ranked(app, snap, "youtube") == []
+    unfiltered = snap.ranking("mood", app.EMOTION_ORDER[0])
+    title = str(snap.lib.song_data["title"].iloc[5])
+    generation = snap.generation
+
+    app._on_yt_resolved(title, "A" * 11)
+    assert snap.generation != generation
+    assert _ranked(app, snap, "youtube") == [title]
+    assert _ranked(app, snap, "playable") == [title]
+    assert snap.ranking("mood", app.EMOTION_ORDER[0]) is unfiltered   # not rebuilt
+
+
+def test_an_invalid_or_known_id_keeps_the_generation(app, snap):
+    title = str(snap.lib.song_data["title"].iloc[5])
+    generation = snap.generation
+    app._on_yt_resolved(title, "short")
+    assert snap.generation == generation and _ranked(app, snap, "youtube") == []
+    app._on_yt_resolved(title, "A" * 11)
+    generation = snap.generation
+    app._on_yt_resolved(title, "B" * 11)
+    assert snap.generation == generation
+
+
+@pytest.mark.parametrize("path", ["/api/v1/recommend", "/api/v1/brief"])
+def test_blank_moods_are_rejected(app, path):
+    from fastapi.testclient import TestClient
+    client = TestClient(app.server)
+    for mood in ("", "   ", "\t\n"):
+        assert client.post(path, json={"mood": mood}).status_code == 422
+        assert client.post(path, json={"queries": [{"mood": "calm"}, {"mood": mood}]}).status_code == 422
+    assert app.MoodQuery(mood="  rainy night drive \n").mood == "rainy night drive"
@@ -0,0 +1,174 @@
+"""download_models against a local HTTP server: resume, checksums, mirror fallback."""
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_models
+
+BLOB = bytes(range(256)) * 64            # 16 KiB "model"
+DIGEST = hashlib.sha256(BLOB).hexdigest()
+NAME = "mood_party-discogs-effnet-1.pb"
+REL = "classification-heads/mood_party/" + NAME
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        start = 0
+        rng = self.headers.get("Range")
+        if rng:
+            start = int(rng.split("=")[1].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        chunk = body[start:]
+        self.send_header("Content-Length", str(len(chunk)))
+        self.end_headers()
+        if server.cut_next:       # drop the connection halfway through
+            server.cut_next -= 1
+            chunk = chunk[:len(chunk) // 2]
+        self.wfile.write(chunk)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.files, httpd.requests, httpd.cut_next = {}, [], 0
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    d = tmp_path / "models"
+    d.mkdir()
+    monkeypatch.setattr(download_models, "MODELS_DIR", str(d))
+    monkeypatch.setattr(download_models, "BASE_URL", "http://upstream.invalid/models")
+    return d
+
+
+def _url(server, prefix="/models"):
+    return f"{server.base}{prefix}/{REL}"
+
+
+def test_resumes_from_part_file(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    (models_dir / (NAME + ".part")).write_bytes(BLOB[:5000])
+    name, ok, _ = download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror="")
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+    assert server.requests == [("/models/" + REL, "bytes=5000-")]
+    assert not (models_dir / (NAME + ".part")).exists()
+
+
+def test_interrupted_download_is_resumed_not_kept(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    server.cut_next = 1
+    _, ok, _ = download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror="")
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+    assert server.requests[0][1] is None and server.requests[1][1] == f"bytes={len(BLOB) // 2}-"
+
+
+def test_checksum_mismatch_leaves_nothing_behind(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    _, ok, msg = download_models.download_one(NAME, _url(server), {NAME: "0" * 64}, mirror="")
+    assert not ok and "SHA-256 mismatch" in msg
+    assert os.listdir(models_dir) == []
+
+
+def test_falls_back_to_mirror_url(server, models_dir):
+    server.files["/mirror/" + REL] = BLOB          # upstream path 404s
+    _, ok, _ = download_models.download_one(
+        NAME, "http://upstream.invalid/models/" + REL, {NAME: DIGEST}, mirror=server.base + "/mirror")
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+    assert ("/mirror/" + REL, None) in server.requests
+
+
+def test_mirror_is_tried_before_upstream(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    server.files["/mirror/" + REL] = BLOB
+    _, ok, _ = download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror=server.base + "/mirror")
+    assert ok and server.requests == [("/mirror/" + REL, None)]
+
+
+def test_upstream_is_used_when_the_mirror_lacks_a_model(server, models_dir, tmp_path):
+    empty = tmp_path / "mirror"
+    empty.mkdir()
+    server.files["/models/" + REL] = BLOB
+    _, ok, _ = download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror=str(empty))
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+
+
+def test_falls_back_to_local_mirror_directory(server, models_dir, tmp_path):
+    flat = tmp_path / "mirror"
+    flat.mkdir()
+    (flat / NAME).write_bytes(BLOB)
+    _, ok, _ = download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror=str(flat))
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+
+
+def test_unpinned_model_is_an_error_unless_pinning(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    checksums = {}
+    _, ok, _ = download_models.download_one(NAME, _url(server), checksums, mirror="")
+    assert not ok and not server.requests and not checksums
+
+    _, ok, _ = download_models.download_one(NAME, _url(server), checksums, mirror="", pin=True)
+    assert ok and checksums == {NAME: DIGEST}
+
+
+def test_without_a_checksum_file_unpinned_models_still_download(server, models_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_models, "CHECKSUMS_PATH", str(tmp_path / "models.sha256"))
+    monkeypatch.setattr(download_models, "MODELS", {NAME: _url(server)})
+    server.files["/models/" + REL] = BLOB
+    assert download_models.ensure_models(mirror="", workers=1)
+    assert (models_dir / NAME).read_bytes() == BLOB
+    assert not os.path.exists(download_models.CHECKSUMS_PATH)     # nothing recorded without --pin
+
+    (models_dir / NAME).unlink()
+    download_models.save_checksums({"other.pb": "0" * 64}, download_models.CHECKSUMS_PATH)   # now unlisted fails
+    assert not download_models.ensure_models(mirror="", workers=1)
+
+
+def test_pinning_resumes_a_truncated_leftover(server, models_dir):
+    server.files["/models/" + REL] = BLOB
+    (models_dir / NAME).write_bytes(BLOB[:3000])   # what the old urlretrieve code could leave
+    checksums = {}
+    _, ok, _ = download_models.download_one(NAME, _url(server), checksums, mirror="", pin=True)
+    assert ok and (models_dir / NAME).read_bytes() == BLOB
+    assert checksums == {NAME: DIGEST}
+
+
+def test_verified_file_is_not_downloaded_again(server, models_dir):
+    (models_dir / NAME).write_bytes(BLOB)
+    assert download_models.download_one(NAME, _url(server), {NAME: DIGEST}, mirror="") == (NAME, True, "exists")
+    assert not server.requests
+
+
+def test_checksum_file_round_trip(tmp_path):
+    path = str(tmp_path / "models.sha256")
+    download_models.save_checksums({NAME: DIGEST, "a.pb": "f" * 64}, path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("# pinned\n")
+    assert download_models.load_checksums(path) == {NAME: DIGEST, "a.pb": "f" * 64}
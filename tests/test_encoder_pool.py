@@ -0,0 +1,53 @@
+"""EncoderPool against the same model loaded in-process, with a tiny bag-of-words model built on the spot."""
+import signal
+
+import numpy as np
+import pytest
+
+VOCAB = ["calm", "rain", "night", "joy", "dance", "悲しい", "夜"]
+TEXTS = ["calm rain at night", "joy dance dance", "", "悲しい 夜", "nothing in the vocabulary"]   # > max_texts
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    BoW = pytest.importorskip("sentence_transformers.models").BoW
+    from sentence_transformers import SentenceTransformer
+    path = str(tmp_path_factory.mktemp("encoder") / "bow")
+    SentenceTransformer(modules=[BoW(vocab=VOCAB)]).save(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def pool(model_path):
+    from encoder_pool import EncoderPool
+    pool = EncoderPool(model_path, workers=2, max_texts=4, timeout=60)
+    yield pool
+    pool.close()
+
+
+def _expected(model_path, texts):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_path).encode(texts, convert_to_numpy=True)
+
+
+def test_matches_the_in_process_model(pool, model_path):
+    texts = TEXTS * 3                       # more than max_texts: several round trips
+    out = pool.encode(texts)
+    assert out.dtype == np.float32 and out.shape == (len(texts), len(VOCAB))
+    np.testing.assert_array_equal(out, _expected(model_path, texts))
+    np.testing.assert_array_equal(pool.encode("calm night"), _expected(model_path, ["calm night"])[0])
+
+
+def test_killed_worker_is_restarted(pool, model_path):
+    before = pool.restarts
+    for w in pool._workers:
+        w.proc.send_signal(signal.SIGKILL)
+        w.proc.wait()
+    assert pool.stats()["alive"] == 0
+
+    out = pool.encode(TEXTS)                 # two chunks: each worker is found dead and restarted
+    np.testing.assert_array_equal(out, _expected(model_path, TEXTS))
+    assert pool.restarts == before + 2
+    assert pool.stats() == {"workers": 2, "alive": 2, "idle": 2, "restarts": before + 2}
+    np.testing.assert_array_equal(pool.encode(TEXTS[::-1]), _expected(model_path, TEXTS[::-1]))
+    assert pool.restarts == before + 2
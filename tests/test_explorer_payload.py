@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from explorer_payload import MAGIC, NUMERIC_COLUMNS, YT_ID_LEN, decode_songs, encode_songs, valid_yt_id
+
+
+def _library(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "title": [f"song {i}" for i in range(n - 3)] + ["悲しみの歌", "café ☕", ""],
+        "bpm": rng.uniform(60, 180, n),
+        "valence": rng.uniform(1, 9, n),
+        "arousal": rng.uniform(1, 9, n),
+        **{col: rng.uniform(0, 1, n) for col in
+           ("mood_happy", "mood_sad", "mood_aggressive", "mood_relaxed", "mood_party", "danceability")},
+    })
+
+
+def _titles(cols):
+    raw = cols["title_utf8"].tobytes()
+    offsets = cols["title_offsets"]
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def test_decode_round_trips_every_column():
+    df = _library()
+    yt = {"song 0": "A" * 11, "song 5": "short", "悲しみの歌": "Zz_-0123456"}
+    buf = encode_songs(df, yt)
+    assert buf[:4] == MAGIC and len(buf) % 4 == 0
+    header, cols = decode_songs(buf)
+    assert header["n"] == len(df)
+    for name, m in header["columns"].items():
+        assert m["offset"] % 4 == 0, name
+
+    assert _titles(cols) == list(df["title"])
+    for key, (col, div) in NUMERIC_COLUMNS.items():
+        digits = len(str(div)) - 1
+        assert list(cols[key]) == pytest.approx(df[col].round(digits).tolist(), abs=1e-9), key
+
+    ids = cols["yt"].tobytes()
+    got = {t: ids[i * YT_ID_LEN:(i + 1) * YT_ID_LEN] for i, t in enumerate(df["title"])}
+    assert got["song 0"] == b"A" * 11 and got["悲しみの歌"] == b"Zz_-0123456"
+    assert got["song 5"] == b"\0" * 11                 # invalid IDs are not shipped
+    assert sum(v != b"\0" * 11 for v in got.values()) == 2
+
+
+def test_empty_library():
+    header, cols = decode_songs(encode_songs(_library().iloc[0:0], {}))
+    assert header["n"] == 0 and _titles(cols) == [] and len(cols["yt"]) == 0
+
+
+def test_encoding_is_deterministic():
+    df = _library(seed=3)
+    assert encode_songs(df, {"song 1": "B" * 11}) == encode_songs(df.copy(), {"song 1": "B" * 11})
+
+
+def test_rejects_other_payloads():
+    with pytest.raises(ValueError):
+        decode_songs(b"JSON[{}]")
+
+
+def test_valid_yt_id():
+    assert valid_yt_id("dQw4w9WgXcQ")
+    assert not any(valid_yt_id(v) for v in (None, "", "short", "é" * 11, "x" * 12))
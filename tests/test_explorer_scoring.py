@@ -0,0 +1,95 @@
+"""explorer_scoring against a brute-force sort and the page's own findTopSongs."""
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from explorer_payload import encode_songs
+from explorer_scoring import EMOTION_PROFILES, ExplorerTable, find_top_songs, rank_all, score, top_indices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _library(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "title": [f"song {i}" for i in range(n)],
+        "bpm": rng.uniform(60, 180, n).round(1),
+        "valence": rng.uniform(1, 9, n).round(2),
+        "arousal": rng.uniform(1, 9, n).round(2),
+        **{col: rng.uniform(0, 1, n).round(3) for col in
+           ("mood_happy", "mood_sad", "mood_aggressive", "mood_relaxed", "mood_party", "danceability")},
+    })
+    # exact score ties under different titles
+    ties = min(n, 40)
+    copies = [df.iloc[:ties].assign(title=[f"{tag} {i}" for i in range(ties)]) for tag in ("copy", "again")]
+    return pd.concat([df, *copies], ignore_index=True)
+
+
+def _reference_order(scores):
+    """The page's sort: score descending, library order within ties."""
+    return np.lexsort((np.arange(len(scores)), -scores))
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 25, 299, 300, 380, 1000])
+def test_top_indices_matches_a_full_sort(top_k):
+    table = ExplorerTable(_library())
+    for key in ("joy", "calm+fear"):
+        scores = score(table, key)
+        assert list(top_indices(scores, top_k)) == list(_reference_order(scores)[:top_k])
+
+
+def test_ties_keep_library_order():
+    scores = np.array([0.5, 0.9, 0.5, 0.9, 0.1, 0.5])
+    assert list(top_indices(scores, 3)) == [1, 3, 0]
+    assert list(top_indices(scores, 4)) == [1, 3, 0, 2]
+    assert list(top_indices(scores, 0)) == []
+
+
+def test_rank_all_covers_every_song_once():
+    table = ExplorerTable(_library())
+    order = rank_all(table, "sadness")
+    assert sorted(order) == list(range(table.n))
+
+
+def test_only_valid_video_ids_are_attached():
+    table = ExplorerTable(_library(20))
+    top = find_top_songs(table, "joy", table.n, {"song 0": "A" * 11, "song 1": "short"})
+    by_title = {s["t"]: s["yt"] for s in top}
+    assert by_title["song 0"] == "A" * 11
+    assert by_title["song 1"] is None
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_rankings_match_the_page(tmp_path):
+    df = _library()
+    bin_path = tmp_path / "songs.bin"
+    bin_path.write_bytes(encode_songs(df, {}))
+    with open(os.path.join(ROOT, "emotion_ui.html"), encoding="utf-8") as f:
+        html = f.read()
+    decode = re.search(r"(const SONG_DTYPES.*?)function loadSongs", html, re.S).group(1)
+    find_top = re.search(r"(function findTopSongs.*?\n\})", html, re.S).group(1)
+    script = tmp_path / "rank.js"
+    script.write_text(f"""
+const EMOTION_PROFILES = {json.dumps(EMOTION_PROFILES)};
+{decode}
+{find_top}
+const b = require('fs').readFileSync(process.argv[2]);
+SONG_TABLE = decodeSongTable(b.buffer.slice(b.byteOffset, b.byteOffset + b.length));
+const out = {{}};
+for (const k of Object.keys(EMOTION_PROFILES))
+  for (const n of [1, 25, SONG_TABLE.n]) out[k + '|' + n] = findTopSongs(k, n);
+console.log(JSON.stringify(out));
+""", encoding="utf-8")
+    expected = json.loads(subprocess.check_output(["node", str(script), str(bin_path)], timeout=60))
+
+    table = ExplorerTable(df)
+    assert len(expected) == 3 * len(EMOTION_PROFILES)
+    for key, songs in expected.items():
+        emotion, top_k = key.split("|")
+        assert find_top_songs(table, emotion, int(top_k)) == songs, key
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_index import FeatureIndex, normalize_target
+
+EMOTIONS = ["joy", "sadness", "calm", "anger", "fear"]
+
+
+def _library(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, 9)), rng.choice(EMOTIONS, n)
+
+
+def _brute(vectors, target, rows):
+    """rows ordered by (distance, row)."""
+    rows = np.asarray(sorted(rows))
+    dists = np.linalg.norm(vectors[rows] - target, axis=1)
+    order = np.lexsort((rows, dists))
+    return rows[order], dists[order]
+
+
+@pytest.mark.parametrize("k", [1, 10, 100, 2000, 5000])
+def test_nearest_matches_brute_force(k):
+    vectors, emotions = _library()
+    index = FeatureIndex(vectors, emotions)
+    for target in np.random.default_rng(1).random((5, 9)):
+        rows, dists = index.nearest(target, k)
+        want_rows, want_dists = _brute(vectors, target, range(len(vectors)))
+        assert list(rows) == list(want_rows[:k])
+        assert dists == pytest.approx(want_dists[:k])
+
+
+def test_emotion_tiers_come_first():
+    vectors, emotions = _library()
+    index = FeatureIndex(vectors, emotions)
+    target = np.full(9, 0.5)
+    k = 900
+    rows, _ = index.nearest(target, k, emotion="joy", neighbors=("calm", "fear"))
+    joy = np.flatnonzero(emotions == "joy")
+    near = np.flatnonzero(np.isin(emotions, ["calm", "fear"]))
+    rest = np.flatnonzero(~np.isin(emotions, ["joy", "calm", "fear"]))
+    expected = np.concatenate([_brute(vectors, target, tier)[0] for tier in (joy, near, rest)])[:k]
+    assert len(joy) < k < len(joy) + len(near)
+    assert list(rows) == list(expected)
+
+
+def test_unknown_emotion_falls_through_to_everything():
+    vectors, emotions = _library(200)
+    index = FeatureIndex(vectors, emotions)
+    rows, _ = index.nearest(vectors[0], 10, emotion="nostalgia")
+    assert list(rows) == list(_brute(vectors, vectors[0], range(200))[0][:10])
+
+
+def test_exclude_drops_the_seed():
+    vectors, emotions = _library(500)
+    index = FeatureIndex(vectors, emotions)
+    rows, dists = index.nearest(vectors[42], 5, exclude=[42])
+    assert 42 not in rows and len(rows) == 5
+    assert list(rows) == list(_brute(vectors, vectors[42], set(range(500)) - {42})[0][:5])
+
+
+def test_exact_ties_keep_library_order():
+    vectors = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 0.0], [1.0, 1.0]])
+    index = FeatureIndex(vectors, ["joy"] * 5)
+    rows, _ = index.nearest(np.array([0.0, 0.0]), 4)
+    assert list(rows) == [0, 3, 1, 2]
+
+
+def test_normalize_target_fills_defaults_and_clips():
+    feat_min = pd.Series({"bpm": 60.0, "valence": 1.0, "arousal": 1.0})
+    feat_max = pd.Series({"bpm": 180.0, "valence": 9.0, "arousal": 9.0})
+    target = normalize_target({"bpm": 120, "arousal": 12}, feat_min, feat_max, [0.1, 0.2, 0.3])
+    assert target == pytest.approx([0.5, 0.2, 1.0])
+    assert normalize_target({"valence": -5}, feat_min, feat_max, [0.1, 0.2, 0.3])[1] == 0.0
+
+
+def test_normalize_target_rejects_unknown_features():
+    feat_min = pd.Series({"bpm": 60.0})
+    with pytest.raises(ValueError, match="tempo"):
+        normalize_target({"tempo": 120}, feat_min, feat_min + 1, [0.5])
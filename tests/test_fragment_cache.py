@@ -0,0 +1,74 @@
+import threading
+
+from fragment_cache import FragmentCache
+
+
+def _renderer(value):
+    calls = []
+
+    def render():
+        calls.append(value)
+        return value
+    return render, calls
+
+
+def test_hit_skips_render():
+    cache = FragmentCache(4)
+    render, calls = _renderer("<div>a</div>")
+    assert cache.get_or_render(("card", "v1", "a"), render) == "<div>a</div>"
+    assert cache.get_or_render(("card", "v1", "a"), render) == "<div>a</div>"
+    assert calls == ["<div>a</div>"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = FragmentCache(2)
+    cache.get_or_render("a", lambda: "A")
+    cache.get_or_render("b", lambda: "B")
+    cache.get_or_render("a", lambda: "A")         # a is now the most recent
+    cache.get_or_render("c", lambda: "C")         # evicts b
+    assert cache.get_or_render("c", lambda: "C2") == "C"
+    assert cache.get_or_render("a", lambda: "A2") == "A"
+    render, calls = _renderer("B2")
+    assert cache.get_or_render("b", render) == "B2" and calls == ["B2"]   # evicts c
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 2
+
+
+def test_new_library_version_misses_and_clear_drops_old_entries():
+    cache = FragmentCache(8)
+    cache.get_or_render(("card", "v1", "a", "en"), lambda: "old")
+    assert cache.get_or_render(("card", "v2", "a", "en"), lambda: "new") == "new"
+    cache.clear()                                  # reload_library() does this
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_render(("card", "v1", "a", "en"), lambda: "again") == "again"
+
+
+def test_none_is_not_cached():
+    cache = FragmentCache(4)
+    render, calls = _renderer(None)
+    for i in range(4):
+        cache.get_or_render(i, lambda i=i: f"v{i}")
+    cache.get_or_render("k", render)
+    cache.get_or_render("k", render)
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert len(cache) == stats["entries"] == 4 and stats["evictions"] == 0
+    assert stats["misses"] == 6
+
+
+def test_hit_rate_and_concurrent_use():
+    cache = FragmentCache(64)
+
+    def worker():
+        for i in range(200):
+            cache.get_or_render(i % 16, lambda i=i: f"v{i % 16}")
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["entries"] == 16
+    assert stats["hits"] + stats["misses"] == 1600
+    assert stats["hit_rate"] > 0.9
@@ -0,0 +1,90 @@
+"""apply_library_delta() against a full build_library() of the same rows."""
+import numpy as np
+import pandas as pd
+import pytest
+
+EMOTIONS = ["joy", "sadness", "calm", "anger"]
+
+
+def _songs(n, seed=0, prefix="song"):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "filename": [f"{prefix}_{i}.mp3" for i in range(n)],
+        "title": [f"{prefix} {i}" for i in range(n)],
+        "bpm": rng.uniform(70, 170, n).round(1),
+        "valence": rng.uniform(2, 8, n).round(3),
+        "arousal": rng.uniform(2, 8, n).round(3),
+        **{col: rng.uniform(0.05, 0.95, n).round(4) for col in
+           ("mood_happy", "mood_sad", "mood_aggressive", "mood_relaxed", "mood_party", "danceability")},
+        "emotion": rng.choice(EMOTIONS, n),
+    })
+
+
+def _inner(snapshot):
+    """Rows that hold no normalization bound (nor an arousal bound)."""
+    raw = snapshot.raw_matrix
+    on_bound = (raw == raw.min(axis=0)) | (raw == raw.max(axis=0))
+    arousal = snapshot.song_data["arousal"].values
+    on_bound |= ((arousal == arousal.min()) | (arousal == arousal.max()))[:, None]
+    return np.flatnonzero(~on_bound.any(axis=1))
+
+
+def _check(recommend_v2, base_df, added, removed):
+    base = recommend_v2.build_library(base_df.copy(), version="v1")
+    delta = recommend_v2.apply_library_delta(base, added.copy(), removed, version="v2")
+    kept = base_df[~base_df["title"].isin(set(removed) | set(added["title"]))]
+    full = recommend_v2.build_library(pd.concat([kept, added], ignore_index=True), version="v2")
+
+    assert delta.version == "v2"
+    assert list(delta.song_data["title"]) == list(full.song_data["title"])
+    np.testing.assert_allclose(delta.feature_vectors, full.feature_vectors, atol=1e-9)
+    np.testing.assert_allclose(delta.raw_matrix, full.raw_matrix, atol=1e-9)
+    np.testing.assert_allclose(delta.feat_min.values, full.feat_min.values)
+    np.testing.assert_allclose(delta.feat_max.values, full.feat_max.values)
+    assert delta.arousal_bounds == pytest.approx(full.arousal_bounds)
+    for emotion, hist in full.profile_hists.items():
+        assert np.array_equal(delta.profile_hists[emotion], hist), emotion
+    # a histogram median lands between the two middle values, give or take a bin
+    assert set(delta.data_profiles) == set(full.data_profiles)
+    bin_width = 1 / recommend_v2.PROFILE_BINS
+    for emotion in full.data_profiles:
+        rows = np.sort(full.feature_vectors[full.song_data["emotion"].values == emotion], axis=0)
+        low, high = rows[(len(rows) - 1) // 2], rows[len(rows) // 2]
+        median = np.array([delta.data_profiles[emotion][col] for col in recommend_v2.FEATURE_COLS])
+        assert np.all((low - bin_width <= median) & (median <= high + bin_width)), emotion
+    return base, delta
+
+
+def test_delta_inside_the_bounds_keeps_the_normalization(recommend_v2):
+    df = _songs(400)
+    inner = _inner(recommend_v2.build_library(df.copy()))
+    copies = df.iloc[inner[:10]].assign(title=[f"new {i}" for i in range(10)])
+    retagged = df.iloc[inner[10:13]].assign(emotion="anger")
+    removed = list(df["title"].iloc[inner[20:30]])
+    base, delta = _check(recommend_v2, df, pd.concat([copies, retagged]), removed)
+    assert np.array_equal(delta.feat_min.values, base.feat_min.values)
+    assert np.array_equal(delta.feat_max.values, base.feat_max.values)
+
+
+def test_delta_that_moves_the_bounds_renormalizes(recommend_v2):
+    df = _songs(300)
+    extreme = _songs(2, seed=2, prefix="loud").assign(arousal=[1.0, 9.5], bpm=[40.0, 200.0])
+    removed = [df.loc[df["valence"].idxmax(), "title"], df.loc[df["bpm"].idxmin(), "title"]]
+    base, delta = _check(recommend_v2, df, extreme, removed)
+    assert delta.arousal_bounds != base.arousal_bounds
+
+
+def test_removing_only_tracks(recommend_v2):
+    df = _songs(300, seed=3)
+    _check(recommend_v2, df, df.iloc[0:0], list(df["title"].iloc[::7]))
+
+
+def test_diff_library_feeds_the_delta(recommend_v2):
+    df = _songs(200, seed=4)
+    base = recommend_v2.build_library(df.copy(), version="v1")
+    new_df = pd.concat([df.iloc[5:], _songs(3, seed=5, prefix="new")], ignore_index=True)
+    new_df.loc[0, "mood_happy"] = 0.5
+    added, removed = recommend_v2.diff_library(base, new_df)
+    assert sorted(removed) == sorted(df["title"].iloc[:5])
+    assert sorted(added["title"]) == sorted([new_df.loc[0, "title"], "new 0", "new 1", "new 2"])
+    assert recommend_v2.apply_library_delta(base, added.iloc[0:0], [], version="v2") is base
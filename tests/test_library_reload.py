@@ -0,0 +1,61 @@
+"""Hot reload: reload_library() publishes a new snapshot through swap_library(), and only when the file changed."""
+import pytest
+
+
+@pytest.fixture
+def library_file(app, recommend_v2, tmp_path, monkeypatch):
+    """A copy of the served library that reload_library() watches instead of the real file."""
+    original = recommend_v2.get_library()
+    path = tmp_path / "song_features.csv"
+    df = recommend_v2.read_library_file(recommend_v2.SONG_FEATURES_PATH)
+    df.to_csv(path, index=False)
+    monkeypatch.setattr(app, "SONG_FEATURES_PATH", str(path))
+    monkeypatch.setattr(app, "_app_lib", app._app_lib)
+    yield path, df
+    recommend_v2.swap_library(original)
+
+
+def test_swap_library_publishes_every_alias(recommend_v2):
+    original = recommend_v2.get_library()
+    df = recommend_v2.read_library_file(recommend_v2.SONG_FEATURES_PATH).head(50)
+    snapshot = recommend_v2.build_library(df, version="small")
+    try:
+        recommend_v2.swap_library(snapshot)
+        assert recommend_v2.get_library() is snapshot
+        assert recommend_v2.song_data is snapshot.song_data
+        assert recommend_v2.feature_vectors is snapshot.feature_vectors
+        assert recommend_v2.MOOD_PROFILES is snapshot.mood_profiles
+    finally:
+        recommend_v2.swap_library(original)
+    assert recommend_v2.get_library() is original and recommend_v2.song_data is original.song_data
+
+
+def test_reload_round_trip(app, recommend_v2, library_file):
+    path, df = library_file
+    held = app._app_lib                       # what a request in flight is holding
+    held_titles = list(held.lib.song_data["title"])
+    assert app.reload_library(force=True)
+    assert app._app_lib.lib.version == recommend_v2.library_version(str(path))
+    assert not app.reload_library()           # unchanged file: nothing to publish
+
+    changed = df.iloc[10:].copy()             # drop ten tracks, retag one
+    changed.loc[changed.index[0], "emotion"] = "calm" if changed["emotion"].iloc[0] != "calm" else "joy"
+    changed.to_csv(path, index=False)
+    assert app.reload_library()
+
+    current = app._app_lib
+    assert current.lib is recommend_v2.get_library()
+    assert current.lib.version == recommend_v2.library_version(str(path))
+    assert sorted(current.lib.song_data["title"]) == sorted(changed["title"])
+    row = current.lib.song_data.set_index("title").loc[changed["title"].iloc[0]]
+    assert row["emotion"] == changed["emotion"].iloc[0]
+    assert set(current.song_meta) == set(changed["title"].astype(str))
+    assert list(held.lib.song_data["title"]) == held_titles   # the old snapshot is untouched
+
+
+def test_failed_reload_keeps_the_current_library(app, library_file):
+    path, _ = library_file
+    current = app._app_lib
+    path.write_text("not,a,library\n1,2,3\n")
+    assert not app.reload_library()
+    assert app._app_lib is current
@@ -0,0 +1,122 @@
+import base64
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import library_scanner
+from library_scanner import (
+    DELTA_PATH, LIBRARY_PATH, group_duplicates, load_delta, scan, scan_tree, title_collisions,
+)
+
+
+def _write(root, rel, data=b"audio"):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def songs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)          # manifest / library / delta are written to the cwd
+    root = tmp_path / "songs"
+    root.mkdir()
+    return root
+
+
+def test_scan_tree_walks_nested_folders_and_skips_others(songs):
+    _write(songs, "a.mp3")
+    _write(songs, "rock/b.flac")
+    _write(songs, "rock/live/c.WAV")
+    _write(songs, "notes.txt")
+    _write(songs, ".hidden/d.mp3")
+    assert sorted(scan_tree(str(songs), workers=4)) == ["a.mp3", "rock/b.flac", "rock/live/c.WAV"]
+
+
+def test_incremental_scan_reports_only_changes(songs):
+    _write(songs, "a.mp3", b"one")
+    _write(songs, "b.mp3", b"two")
+    assert scan(str(songs), workers=2) == {"a.mp3": "added", "b.mp3": "added"}
+    assert scan(str(songs), workers=2) == {}
+
+    _write(songs, "a.mp3", b"one, re-tagged")
+    os.remove(songs / "b.mp3")
+    _write(songs, "sub/c.mp3", b"three")
+    assert scan(str(songs), workers=2) == {"a.mp3": "changed", "b.mp3": "removed", "sub/c.mp3": "added"}
+    # b was added and removed before extraction consumed the delta: no work left for it
+    assert load_delta() == {"a.mp3": "added", "sub/c.mp3": "added"}
+    assert list(pd.read_csv(LIBRARY_PATH)["title"]) == ["a", "c"]
+
+
+def test_identical_bytes_share_a_content_id(songs):
+    _write(songs, "x - Official Video.mp3", b"same")
+    _write(songs, "x - Audio.mp3", b"same")
+    _write(songs, "y.mp3", b"other")
+    scan(str(songs), workers=2)
+    lib = pd.read_csv(LIBRARY_PATH).set_index("filename")["content_id"]
+    assert lib["x - Official Video.mp3"] == lib["x - Audio.mp3"] != lib["y.mp3"]
+
+
+def test_group_duplicates_uses_the_smallest_hash():
+    manifest = {"a": {"hash": "b2"}, "b": {"hash": "b2"}, "c": {"hash": "a1"}}
+    assert group_duplicates(manifest) == {"a": "b2", "b": "b2", "c": "a1"}
+
+
+def _pcm(db):
+    """Fingerprint of a per-second loudness envelope given in dB below full scale."""
+    q = np.clip(np.round(np.asarray(db) * 2), 0, 255).astype(np.uint8)
+    return base64.b64encode(q.tobytes()).decode("ascii")
+
+
+def _song(seconds=180, seed=0):
+    """Loudness contour with quiet verses, loud choruses and a break."""
+    rng = np.random.default_rng(seed)
+    sections = np.repeat(rng.choice([6.0, 9.0, 14.0], seconds // 15 + 1), 15)[:seconds]
+    return sections + rng.normal(0, 0.6, seconds)
+
+
+def _groups(**pcms):
+    manifest = {rel: {"hash": f"h-{rel}", "pcm": _pcm(db)} for rel, db in pcms.items()}
+    ids = group_duplicates(manifest)
+    return ids["a"] == ids["b"]
+
+
+def test_pcm_match_joins_a_re_encode():
+    song = _song()
+    reencoded = np.append(song + np.random.default_rng(1).normal(0, 0.3, len(song)), 7.0)   # +1 s padding
+    assert _groups(a=song, b=reencoded)
+
+
+def _mean_db_diff(a, b):
+    return np.mean(np.abs(np.round(a * 2) - np.round(b * 2))) / 2
+
+
+def test_pcm_match_rejects_loud_masters_of_different_songs():
+    rng = np.random.default_rng(2)
+    # brick-walled: both flat at the same loudness, a level-only match would merge them
+    a, b = 4 + rng.normal(0, 0.4, 200), 4 + rng.normal(0, 0.4, 200)
+    assert _mean_db_diff(a, b) <= 0.75
+    assert not _groups(a=a, b=b)
+    # some dynamics (a shared slow swell) but otherwise unrelated contours
+    swell = 5 + 1.5 * np.sin(np.linspace(0, 3 * np.pi, 200))
+    a, b = swell + rng.normal(0, 0.45, 200), swell + rng.normal(0, 0.45, 200)
+    assert _mean_db_diff(a, b) <= 0.75 and min(a.std(), b.std()) >= 1.0
+    assert not _groups(a=a, b=b)
+    # and plainly different songs
+    assert not _groups(a=_song(), b=_song(seed=4))
+
+
+def test_title_collisions():
+    assert title_collisions(["rock/a.mp3", "pop/a.flac", "b.mp3"]) == {"a": ["pop/a.flac", "rock/a.mp3"]}
+    assert title_collisions(["a.mp3", "b.mp3"]) == {}
+
+
+def test_colliding_titles_are_rejected_before_writing(songs):
+    _write(songs, "rock/Song.mp3", b"1")
+    _write(songs, "pop/Song.mp3", b"2")
+    with pytest.raises(ValueError, match="pop/Song.mp3, rock/Song.mp3"):
+        scan(str(songs), workers=2)
+    for path in (library_scanner.MANIFEST_PATH, LIBRARY_PATH, DELTA_PATH):
+        assert not os.path.exists(path)
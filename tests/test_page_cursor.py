@@ -0,0 +1,51 @@
+import base64
+import json
+
+import pytest
+
+from page_cursor import decode_cursor, encode_cursor
+
+KEYS = ("joy", "calm+sadness", "悲しみ")
+
+
+def _raw(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    filters = {"bpm_min": 90.0, "languages": ["Japanese"]}
+    cursor = encode_cursor("v7", 4, "mood", "calm+sadness", 25, 25, filters)
+    assert "=" not in cursor and cursor.isascii()
+    assert decode_cursor(cursor, "mood", KEYS, 50) == ("v7", 4, "calm+sadness", 25, 25, filters)
+
+
+def test_non_ascii_key_and_no_filters():
+    cursor = encode_cursor(3, 0, "explorer", "悲しみ", 0, 1)
+    assert decode_cursor(cursor, "explorer", KEYS, 50) == (3, 0, "悲しみ", 0, 1, None)
+    assert decode_cursor(encode_cursor(3, 0, "explorer", "joy", 0, 1, {}), "explorer", KEYS, 50)[-1] is None
+
+
+def test_version_and_generation_are_returned_not_checked():
+    assert decode_cursor(encode_cursor("old", 9, "mood", "joy", 5, 5), "mood", KEYS, 50)[:2] == ("old", 9)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64 at all!",
+    _raw({"a": 1}),
+    _raw([1, 0, "mood", "joy", 0]),                       # too short
+    _raw([1, "mood", "joy", 0, 5, None]),                 # no generation
+    _raw([1, "0", "mood", "joy", 0, 5, None]),
+    _raw([1, 0, "explorer", "joy", 0, 5, None]),          # another list's cursor
+    _raw([1, 0, "mood", "nope", 0, 5, None]),             # unknown key
+    _raw([1, 0, "mood", ["joy"], 0, 5, None]),
+    _raw([1, 0, "mood", "joy", -1, 5, None]),
+    _raw([1, 0, "mood", "joy", 1.5, 5, None]),
+    _raw([1, 0, "mood", "joy", True, 5, None]),
+    _raw([1, 0, "mood", "joy", 0, 0, None]),
+    _raw([1, 0, "mood", "joy", 0, 51, None]),
+    _raw([1, 0, "mood", "joy", 0, 5, [1, 2]]),
+])
+def test_rejects_anything_that_is_not_a_valid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "mood", KEYS, 50)
@@ -0,0 +1,81 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from prefilter import PrefilterIndex
+
+LANGUAGES = ["English", "Japanese", "Korean", "Chinese"]
+EMOTIONS = ["joy", "sadness", "calm", "anger"]
+
+
+def _index(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    bpm = rng.uniform(60, 180, n).round(0)
+    bpm[rng.choice(n, 20, replace=False)] = np.nan           # tracks without a BPM
+    languages = rng.choice(LANGUAGES, n)
+    emotions = rng.choice(EMOTIONS, n)
+    local = rng.random(n) < 0.3
+    youtube = rng.random(n) < 0.6
+    return PrefilterIndex(bpm, languages, emotions, local, youtube), (bpm, languages, emotions, local, youtube)
+
+
+def _brute(columns, bpm_min=None, bpm_max=None, languages=(), emotions=(), available=None):
+    bpm, langs, emos, local, youtube = columns
+    keep = np.ones(len(bpm), dtype=bool)
+    if bpm_min is not None:
+        keep &= bpm >= bpm_min
+    if bpm_max is not None:
+        keep &= bpm <= bpm_max
+    if languages:
+        keep &= np.isin(np.char.lower(langs.astype(str)), [x.lower() for x in languages])
+    if emotions:
+        keep &= np.isin(emos, list(emotions))
+    if available:
+        keep &= {"local": local, "youtube": youtube, "playable": local | youtube}[available]
+    return np.flatnonzero(keep)
+
+
+def test_postings_are_sorted_rows_per_value():
+    index, (_, languages, emotions, _, _) = _index()
+    for name, rows in index.by_language.items():
+        assert list(rows) == list(np.flatnonzero(np.char.lower(languages.astype(str)) == name))
+    for name, rows in index.by_emotion.items():
+        assert list(rows) == list(np.flatnonzero(emotions == name))
+
+
+def test_bpm_index_sorts_known_values_first():
+    index, (bpm, *_) = _index()
+    assert index.bpm_known == np.count_nonzero(~np.isnan(bpm))
+    known = index.bpm_sorted[:index.bpm_known]
+    assert np.all(np.diff(known) >= 0) and np.all(np.isnan(index.bpm_sorted[index.bpm_known:]))
+
+
+@pytest.mark.parametrize("bpm_min,bpm_max", [(90, 110), (120, 120), (None, 80), (170, None), (200, 250), (110, 90)])
+def test_bpm_ranges_are_inclusive_and_skip_unknown(bpm_min, bpm_max):
+    index, columns = _index()
+    assert list(index.candidates(bpm_min, bpm_max)) == list(_brute(columns, bpm_min, bpm_max))
+
+
+def test_every_combination_matches_brute_force():
+    index, columns = _index(seed=1)
+    for bpm_range, langs, emos, available in itertools.product(
+            [(None, None), (95, 125), (None, 70)],
+            [(), ("japanese",), ("English", "KOREAN"), ("Klingon",)],
+            [(), ("joy",), ("calm", "anger", "nope")],
+            [None, "local", "youtube", "playable"]):
+        got = index.candidates(*bpm_range, languages=langs, emotions=emos, available=available)
+        expected = _brute(columns, *bpm_range, languages=langs, emotions=emos, available=available)
+        if got is None:
+            assert len(expected) == index.n
+        else:
+            assert list(got) == list(expected), (bpm_range, langs, emos, available)
+
+
+def test_none_means_nothing_was_excluded():
+    index = PrefilterIndex([100, 120], ["en", "en"], ["joy", "calm"], [True, True], [False, True])
+    assert index.candidates() is None
+    assert index.candidates(bpm_min=50) is None
+    assert index.candidates(languages=["EN"], available="local") is None
+    assert list(index.candidates(emotions=["calm"])) == [1]
+    assert list(index.candidates(available="youtube", bpm_max=110)) == []
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantile_sketch import (
+    TDigest, THRESHOLD_QUANTILES, load_sketches, load_tracks, new_sketches, ingest, merge_sketches,
+    save_sketches, sync_library_sketch, thresholds_from_sketches,
+)
+
+QS = [0.01, 0.1, 0.3, 0.5, 0.7, 0.9, 0.99]
+
+
+def _library(n, seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "filename": [f"song {i}.mp3" for i in range(start, start + n)],
+        "title": [f"song {i}" for i in range(start, start + n)],
+        "valence": rng.normal(5, 1.2, n).round(4),
+        "arousal": rng.gamma(4, 1.2, n).round(4),
+    })
+
+
+def test_small_digest_is_exact():
+    values = np.random.default_rng(1).normal(size=200)
+    d = TDigest().update(values)
+    for q in QS:
+        assert d.quantile(q) == pytest.approx(np.quantile(values, q), abs=1e-12)
+
+
+def test_large_digest_tracks_numpy_quantiles():
+    values = np.random.default_rng(2).gamma(2, 2, 100_000)
+    d = TDigest().update(values)
+    for q in QS:
+        assert d.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.01)
+    assert len(d.means) < 2_000
+
+
+def test_nan_is_ignored_and_empty_is_nan():
+    assert np.isnan(TDigest().quantile(0.5))
+    d = TDigest().update([1.0, np.nan, 3.0])
+    assert d.quantile(0.5) == pytest.approx(2.0) and d.count == 2
+
+
+def test_merged_shards_match_the_whole():
+    values = np.random.default_rng(3).normal(0, 1, 60_000)
+    whole = TDigest().update(values)
+    merged = TDigest()
+    for shard in np.array_split(values, 6):
+        merged.merge(TDigest().update(shard))
+    assert merged.count == whole.count == len(values)
+    assert merged.min == values.min() and merged.max == values.max()
+    for q in QS:
+        assert merged.quantile(q) == pytest.approx(np.quantile(values, q), abs=0.02)
+
+
+def test_round_trip_through_dict():
+    d = TDigest().update(np.random.default_rng(4).uniform(size=5_000))
+    back = TDigest.from_dict(d.to_dict())
+    for q in QS:
+        assert back.quantile(q) == pytest.approx(d.quantile(q), abs=1e-5)
+
+
+def test_thresholds_match_pandas_on_a_small_library():
+    lib = _library(300)
+    th = thresholds_from_sketches(ingest(new_sketches(), lib))
+    for name, (col, q) in THRESHOLD_QUANTILES.items():
+        assert th[name] == pytest.approx(lib[col].quantile(q), abs=1e-9)
+
+
+def test_merge_sketches_of_shards():
+    lib = _library(3_000)
+    shards = [ingest(new_sketches(), lib.iloc[i::3]) for i in range(3)]
+    th = thresholds_from_sketches(merge_sketches(*shards))
+    for name, (col, q) in THRESHOLD_QUANTILES.items():
+        assert th[name] == pytest.approx(lib[col].quantile(q), abs=0.02)
+
+
+# ── Keeping the persisted sketch in line with the library ──
+def _hashes(df, salt=""):
+    return {f: f"h{salt}:{f}" for f in df["filename"]}
+
+
+def test_additions_are_ingested(tmp_path):
+    path = str(tmp_path / "sketch.json")
+    old = _library(100)
+    assert sync_library_sketch(old, None, _hashes(old), path) == ("rebuilt", 100)
+    new = pd.concat([old, _library(10, seed=9, start=100)], ignore_index=True)
+    delta = {f: "added" for f in new["filename"][100:]}
+    assert sync_library_sketch(new, delta, _hashes(new), path) == ("ingested", 10)
+    assert load_sketches(path)[0]["valence"].count == 110
+    assert load_tracks(path) == _hashes(new)
+    # the same delta again (e.g. a retried run) is already in the sketch
+    assert sync_library_sketch(new, delta, _hashes(new), path) == ("ingested", 0)
+
+
+def test_float_reformatting_does_not_force_a_rebuild(tmp_path):
+    path = str(tmp_path / "sketch.json")
+    old = _library(100)
+    sync_library_sketch(old, None, _hashes(old), path)
+    csv = tmp_path / "features.csv"
+    old.assign(valence=old["valence"] + 1e-12).to_csv(csv, index=False)
+    reread = pd.read_csv(csv)
+    assert sync_library_sketch(reread, {}, _hashes(reread), path) == ("ingested", 0)
+
+
+@pytest.mark.parametrize("edit", ["change", "remove"])
+def test_changed_or_removed_tracks_force_a_rebuild(tmp_path, edit):
+    path = str(tmp_path / "sketch.json")
+    old = _library(100)
+    sync_library_sketch(old, None, _hashes(old), path)
+    new, hashes = old.copy(), _hashes(old)
+    if edit == "change":
+        new.loc[5, "arousal"] += 3
+        hashes[new.loc[5, "filename"]] = "re-encoded"
+        delta = {new.loc[5, "filename"]: "changed"}
+    else:
+        new = new.drop(index=5)
+        del hashes[old.loc[5, "filename"]]
+        delta = {old.loc[5, "filename"]: "removed"}
+    assert sync_library_sketch(new, delta, hashes, path) == ("rebuilt", len(new))
+    sketches, _ = load_sketches(path)
+    assert sketches["arousal"].count == len(new)
+    assert sketches["arousal"].quantile(0.9) == pytest.approx(new["arousal"].quantile(0.9), abs=1e-9)
+    assert load_tracks(path) == hashes
+
+
+def test_unknown_membership_rebuilds(tmp_path):
+    path = str(tmp_path / "sketch.json")
+    lib = _library(50)
+    save_sketches(ingest(new_sketches(), lib), path, tracks=None)   # e.g. a sketch file from before
+    assert sync_library_sketch(lib, {"new.mp3": "added"}, _hashes(lib), path) == ("rebuilt", 50)
+    with open(path, "rb") as f:
+        assert f.read().endswith(b"\n")
+
+
+def test_thresholds_only_save_keeps_tracks(tmp_path):
+    path = str(tmp_path / "sketch.json")
+    lib = _library(20)
+    sync_library_sketch(lib, None, _hashes(lib), path)
+    sketches, _ = load_sketches(path)
+    save_sketches(sketches, path, applied=thresholds_from_sketches(sketches))
+    assert load_tracks(path) == _hashes(lib)
+
+
+def test_merge_flag_folds_shards_into_the_existing_sketch(tmp_path):
+    local, shard = _library(300, seed=1), _library(200, seed=2, start=300)
+    sync_library_sketch(local, None, _hashes(local), str(tmp_path / "emotion_thresholds.json"))
+    sync_library_sketch(shard, None, _hashes(shard), str(tmp_path / "shard.json"))
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "get_song_emotions.py")
+    subprocess.run([sys.executable, script, "--merge", "shard.json"], cwd=tmp_path, check=True,
+                   capture_output=True)
+    path = str(tmp_path / "emotion_thresholds.json")
+    both = pd.concat([local, shard], ignore_index=True)
+    assert load_sketches(path)[0]["valence"].count == 500
+    assert load_tracks(path) == _hashes(both)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from shared_library import KEEP_VERSIONS, attach, load_or_publish, publish, shared_array
+
+EMOTIONS = ["joy", "sadness", "calm", "anger"]
+
+
+def _library(recommend_v2, n=120, seed=0, version="v1"):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "filename": [f"song_{i}.mp3" for i in range(n)],
+        "title": [f"歌 {i}" for i in range(n)],
+        **{col: rng.uniform(0, 1, n) for col in recommend_v2.FEATURE_COLS},
+        "emotion": rng.choice(EMOTIONS, n),
+    })
+    df["bpm"] = rng.uniform(60, 180, n)
+    return recommend_v2.build_library(df, version=version)
+
+
+def test_attach_equals_the_published_snapshot(recommend_v2, tmp_path):
+    lib = _library(recommend_v2)
+    publish(lib, str(tmp_path))
+    shared = attach(str(tmp_path), "v1", recommend_v2.LibrarySnapshot)
+
+    assert shared.version == lib.version
+    pd.testing.assert_frame_equal(shared.song_data, lib.song_data)
+    pd.testing.assert_frame_equal(shared.feature_matrix, lib.feature_matrix)
+    np.testing.assert_array_equal(shared.raw_matrix, lib.raw_matrix)
+    pd.testing.assert_series_equal(shared.feat_min, lib.feat_min)
+    pd.testing.assert_series_equal(shared.feat_max, lib.feat_max)
+    assert shared.arousal_bounds == pytest.approx(lib.arousal_bounds)
+    assert shared.data_profiles == lib.data_profiles and shared.mood_profiles == lib.mood_profiles
+    assert sorted(shared.profile_hists) == sorted(lib.profile_hists)
+    for emotion, hist in lib.profile_hists.items():
+        np.testing.assert_array_equal(shared.profile_hists[emotion], hist)
+
+    assert not shared.feature_vectors.flags.writeable       # mapped read-only
+    target = lib.feature_vectors[7]
+    assert list(shared.feature_index().nearest(target, 5)[0]) == list(lib.feature_index().nearest(target, 5)[0])
+    assert attach(str(tmp_path), "v2", recommend_v2.LibrarySnapshot) is None
+
+
+def test_load_or_publish_builds_each_version_once(recommend_v2, tmp_path):
+    builds = []
+
+    def build(version):
+        builds.append(version)
+        return _library(recommend_v2, seed=len(builds), version=version)
+
+    first = load_or_publish(str(tmp_path), "v1", lambda: build("v1"), recommend_v2.LibrarySnapshot)
+    again = load_or_publish(str(tmp_path), "v1", lambda: build("v1"), recommend_v2.LibrarySnapshot)
+    assert builds == ["v1"]
+    pd.testing.assert_frame_equal(first.song_data, again.song_data)
+
+    for i in range(2, 3 + KEEP_VERSIONS):
+        load_or_publish(str(tmp_path), f"v{i}", lambda i=i: build(f"v{i}"), recommend_v2.LibrarySnapshot)
+    published = sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("lib-"))
+    assert len(published) == KEEP_VERSIONS and f"lib-v{2 + KEEP_VERSIONS}" in published
+    np.testing.assert_array_equal(first.feature_vectors, again.feature_vectors)   # still mapped
+
+
+def test_shared_array_is_built_once(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return np.arange(12, dtype=np.float32).reshape(3, 4)
+    a = shared_array(str(tmp_path), "emotion_vectors", build)
+    b = shared_array(str(tmp_path), "emotion_vectors", build)
+    assert len(calls) == 1 and a.dtype == np.float32
+    np.testing.assert_array_equal(a, b)
+    assert not b.flags.writeable
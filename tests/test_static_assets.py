@@ -0,0 +1,69 @@
+import gzip
+import os
+
+import pytest
+from starlette.requests import Request
+
+import static_assets
+from static_assets import CompressedAsset, asset_response
+
+BODY = ("<tr><td>song</td><td>120</td></tr>" * 500).encode()
+
+
+def _request(**headers):
+    return Request({"type": "http", "method": "GET", "path": "/",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_etag_follows_the_content():
+    asset = CompressedAsset(BODY, "text/html")
+    assert asset.etag == CompressedAsset(BODY.decode(), "text/html").etag
+    assert asset.etag != CompressedAsset(BODY + b" ", "text/html").etag
+    assert asset.etag.startswith('"') and asset.etag.endswith('"')
+
+
+def test_if_none_match_gets_a_304():
+    asset = CompressedAsset(BODY, "text/html")
+    for inm in (asset.etag, f'"other", W/{asset.etag}'):
+        response = asset_response(_request(if_none_match=inm, accept_encoding="gzip"), asset)
+        assert response.status_code == 304 and response.body == b""
+        assert response.headers["etag"] == asset.etag
+    stale = asset_response(_request(if_none_match='"other"'), asset)
+    assert stale.status_code == 200 and stale.body == BODY
+
+
+def test_gzip_negotiation():
+    asset = CompressedAsset(BODY, "application/octet-stream")
+    response = asset_response(_request(accept_encoding="deflate, gzip;q=0.8"), asset)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.body) == BODY and len(response.body) < len(BODY)
+
+    plain = asset_response(_request(), asset)
+    assert "content-encoding" not in plain.headers and plain.body == BODY
+    assert plain.headers["content-type"] == "application/octet-stream"
+
+
+def test_brotli_is_preferred_when_installed():
+    brotli = pytest.importorskip("brotli")
+    asset = CompressedAsset(BODY, "text/html")
+    response = asset_response(_request(accept_encoding="gzip, br"), asset)
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(response.body) == BODY
+
+
+def test_without_brotli_br_clients_get_gzip(monkeypatch):
+    monkeypatch.setattr(static_assets, "brotli", None)
+    asset = CompressedAsset(BODY, "text/html")
+    assert set(asset.variants) == {"identity", "gzip"}
+    assert asset.pick("br, gzip")[0] == "gzip"
+    assert asset.pick("br")[0] == "identity"
+
+
+def test_shared_variants_are_written_once(tmp_path):
+    first = CompressedAsset(BODY, "text/html", share_dir=str(tmp_path))
+    second = CompressedAsset(BODY, "text/html", share_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == [first.etag.strip('"')]
+    for enc, data in first.variants.items():
+        assert bytes(second.variants[enc]) == bytes(data)
+    assert bytes(second.pick("gzip")[1]) == gzip.compress(BODY, compresslevel=9, mtime=0)
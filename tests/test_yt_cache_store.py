@@ -0,0 +1,75 @@
+import json
+import sqlite3
+import threading
+import time
+
+from yt_cache_store import YTCacheStore
+
+
+def test_writes_are_visible_to_another_connection(tmp_path):
+    path = str(tmp_path / "ids.sqlite")
+    a, b = YTCacheStore(path), YTCacheStore(path)
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    a.put("song a", "A" * 11)
+    b.put_miss("song b", time.time() + 3600)
+    b.put_miss("gone", time.time() - 1)
+    for store in (a, b):
+        ids, misses = store.load()
+        assert ids == {"song a": "A" * 11} and list(misses) == ["song b"]   # expired misses are not loaded
+
+    b.put("song b", "B" * 11)                        # a later hit replaces the miss
+    a.put_miss("song a", time.time() + 3600)         # a failed revalidation keeps the ID
+    assert a.load()[0] == b.load()[0] == {"song a": "A" * 11, "song b": "B" * 11}
+    assert a.load()[1] == {}
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "ids.sqlite")
+    stores = [YTCacheStore(path), YTCacheStore(path)]
+
+    def worker(store, w):
+        for i in range(100):
+            store.put(f"song {w}-{i}", f"{w:02d}{i:09d}")
+    threads = [threading.Thread(target=worker, args=(stores[w % 2], w)) for w in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ids, _ = YTCacheStore(path).load()
+    assert len(ids) == 600 and ids["song 5-99"] == "05000000099"
+
+
+def test_stale_is_oldest_first(tmp_path):
+    store = YTCacheStore(str(tmp_path / "ids.sqlite"))
+    now = time.time()
+    store.put("new", "N" * 11, fetched_at=now)
+    store.put("older", "O" * 11, fetched_at=now - 200 * 86400)
+    store.put("old", "o" * 11, fetched_at=now - 100 * 86400)
+    store.put_miss("miss", now + 60)
+    assert store.stale(90 * 86400) == ["older", "old"]
+
+
+def test_json_migration_runs_once(tmp_path):
+    cache, misses = tmp_path / "cache.json", tmp_path / "misses.json"
+    cache.write_text(json.dumps({"a": "A" * 11, "b": None}))
+    misses.write_text(json.dumps({"c": time.time() + 3600}))
+    store = YTCacheStore(str(tmp_path / "ids.sqlite"))
+    assert store.migrate_json(str(cache), str(misses)) == 2
+    cache.write_text(json.dumps({"d": "D" * 11}))
+    assert YTCacheStore(store.path).migrate_json(str(cache), str(misses)) == 0
+    ids, live_misses = store.load()
+    assert ids == {"a": "A" * 11} and list(live_misses) == ["c"]
+
+
+def test_compact_drops_expired_misses_only(tmp_path):
+    path = str(tmp_path / "ids.sqlite")
+    store = YTCacheStore(path)
+    store.put("hit", "H" * 11)
+    store.put_miss("expired", time.time() - 1)
+    store.put_miss("live", time.time() + 3600)
+    assert store.compact() == 1
+    ids, misses = YTCacheStore(path).load()
+    assert ids == {"hit": "H" * 11} and list(misses) == ["live"]
+    rows = sqlite3.connect(path).execute("SELECT title FROM yt_ids ORDER BY title").fetchall()
+    assert rows == [("hit",), ("live",)]
@@ -0,0 +1,182 @@
+"""YTResolver against local fake backends — no network."""
+import threading
+import time
+
+import pytest
+
+import yt_resolver
+from yt_resolver import Backend, TokenBucket, YTResolver
+
+
+class FakeBackend(Backend):
+    """answers: title → video ID, None (not found) or an exception to raise."""
+
+    def __init__(self, answers=None, name="fake", rate=1000.0, burst=1000, gate=None):
+        self.name, self.rate, self.burst = name, rate, burst
+        self.answers = answers or {}
+        self.gate = gate          # threading.Event the search waits on
+        self.calls = []
+
+    def search(self, title):
+        self.calls.append(title)
+        if self.gate is not None:
+            self.gate.wait(5)
+        answer = self.answers.get(title)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def resolvers():
+    made = []
+
+    def make(backends, **kwargs):
+        r = YTResolver(backends, {}, **kwargs)
+        made.append(r)
+        return r
+    yield make
+    for r in made:
+        r._pool.shutdown(wait=False, cancel_futures=True)
+        r._warm_pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ── Rate limiting ─────────────────────────────────────────
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        assert bucket.acquire()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_token_bucket_gives_up_past_timeout():
+    bucket = TokenBucket(rate=0.1, burst=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.05)
+
+
+def test_rate_limited_backend_is_transient_not_a_miss(resolvers):
+    slow = FakeBackend({"a": "x" * 11}, rate=0.01, burst=1)
+    r = resolvers([slow], max_wait=0.01)
+    assert r.lookup("a") == "x" * 11          # the banked token
+    assert r.lookup("b") is None              # no token within max_wait
+    assert not r.is_negative("b")
+    assert slow.calls == ["a"]
+
+
+# ── Backoff ───────────────────────────────────────────────
+def test_transport_error_backs_off_and_skips_backend(resolvers, monkeypatch):
+    monkeypatch.setattr(yt_resolver, "BACKOFF_BASE", 60.0)
+    flaky = FakeBackend({"a": OSError("503")}, name="flaky")
+    good = FakeBackend({"a": "A" * 11}, name="good")
+    r = resolvers([flaky, good])
+    assert r.lookup("a") == "A" * 11
+    state = r._state["flaky"]
+    assert state.failures == 1 and state.blocked_until > time.monotonic() + 40
+
+    r.cache.clear()
+    assert r.lookup("a") == "A" * 11
+    assert flaky.calls == ["a"]               # still backing off: not asked again
+
+
+def test_backoff_grows_and_resets(resolvers):
+    flaky = FakeBackend({"a": OSError("down"), "b": None}, name="flaky")
+    r = resolvers([flaky])
+    state = r._state["flaky"]
+    delays = []
+    for _ in range(3):
+        state.blocked_until = 0.0
+        r.lookup("a")
+        delays.append(state.blocked_until - time.monotonic())
+    assert delays[0] < delays[1] < delays[2]
+    assert not r.is_negative("a")             # errors never negative-cache
+
+    state.blocked_until = 0.0
+    r.lookup("b")
+    assert state.failures == 0 and state.blocked_until == 0.0
+
+
+# ── Negative cache ────────────────────────────────────────
+def test_not_found_is_negative_cached_for_ttl(resolvers):
+    misses = []
+    backend = FakeBackend({})
+    r = resolvers([backend], negative_ttl=60, on_miss=lambda t, exp: misses.append((t, exp)))
+    assert r.lookup("gone") is None
+    assert r.is_negative("gone")
+    assert misses and misses[0][0] == "gone" and misses[0][1] > time.time() + 50
+    assert r.lookup("gone") is None
+    assert backend.calls == ["gone"]          # answered from the negative cache
+
+    r.negative["gone"] = time.time() - 1      # expired
+    r.lookup("gone")
+    assert backend.calls == ["gone", "gone"]
+
+
+def test_no_backends_is_not_a_miss(resolvers):
+    misses = []
+    r = resolvers([], on_miss=lambda t, exp: misses.append(t))
+    assert r.lookup("a") is None
+    assert not r.is_negative("a") and not misses
+
+
+def test_refresh_keeps_cached_id_when_nothing_newer(resolvers):
+    resolved = []
+    r = resolvers([FakeBackend({})], on_resolved=lambda t, v: resolved.append((t, v)))
+    r.cache["a"] = "C" * 11
+    assert r.lookup("a", refresh=True) == "C" * 11
+    assert resolved == [("a", "C" * 11)] and not r.is_negative("a")
+
+
+# ── Singleflight ──────────────────────────────────────────
+def test_concurrent_lookups_share_one_request(resolvers):
+    gate = threading.Event()
+    backend = FakeBackend({"a": "A" * 11}, gate=gate)
+    r = resolvers([backend])
+    futures = [r.submit("a") for _ in range(5)]
+    assert all(f is futures[0] for f in futures)
+    gate.set()
+    assert futures[0].result(5) == "A" * 11
+    assert backend.calls == ["a"]
+
+
+def test_submit_of_finished_lookup_does_not_deadlock(resolvers):
+    r = resolvers([])
+    assert r.submit("a").result(5) is None
+    assert r.submit("a").result(5) is None    # in-flight entry was released
+
+
+def test_interactive_lookup_jumps_the_warm_queue(resolvers):
+    gate = threading.Event()
+    backend = FakeBackend({"busy": "B" * 11, "a": "A" * 11}, gate=gate)
+    r = resolvers([backend], workers=1, warm_workers=1)
+    busy = r.submit("busy", warm=True)        # occupies the only warm worker
+    queued = r.submit("a", warm=True)
+    fut = r.submit("a")
+    assert fut is not queued and queued.cancelled()
+    gate.set()
+    assert fut.result(5) == "A" * 11 and busy.result(5) == "B" * 11
+    assert backend.calls.count("a") == 1
+
+
+def test_interactive_lookup_joins_a_running_warm_lookup(resolvers):
+    gate = threading.Event()
+    backend = FakeBackend({"a": "A" * 11}, gate=gate)
+    r = resolvers([backend], warm_workers=1)
+    warm = r.submit("a", warm=True)
+    while not backend.calls:
+        time.sleep(0.001)
+    assert r.submit("a") is warm
+    gate.set()
+    assert warm.result(5) == "A" * 11
+
+
+def test_resolve_many_respects_deadline(resolvers):
+    gate = threading.Event()
+    r = resolvers([FakeBackend({"slow": "S" * 11}, gate=gate)])
+    r.cache["fast"] = "F" * 11
+    start = time.monotonic()
+    out = r.resolve_many(["fast", "slow"], deadline=0.05)
+    assert time.monotonic() - start < 1
+    assert out == {"fast": "F" * 11, "slow": None}
+    gate.set()
@@ -0,0 +1,129 @@
+"""
+Timbre – Durable YouTube ID cache (SQLite, WAL)
+
+Replaces the all-or-nothing youtube_id_cache.json rewrite: every resolved ID
+or miss is upserted as its own row the moment it is known, so warm-up
+progress survives crashes and restarts. WAL mode lets several app workers
+read and write the same file concurrently.
+
+Table yt_ids:
+  title       primary key
+  video_id    NULL for a negative ("not found") entry
+  fetched_at  unix time of the last lookup — used to revalidate old IDs
+  expires_at  negative entries only; retried after this
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DB_PATH = "youtube_ids.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS yt_ids (
+    title      TEXT PRIMARY KEY,
+    video_id   TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class YTCacheStore:
+    """Thread-safe handle (one connection per thread) on the SQLite cache."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ── reads ──
+    def load(self):
+        """(ids, misses): title → video_id, and title → expiry of live negative entries."""
+        now = time.time()
+        ids, misses = {}, {}
+        for title, vid, expires in self._conn().execute(
+                "SELECT title, video_id, expires_at FROM yt_ids"):
+            if vid:
+                ids[title] = vid
+            elif expires and expires > now:
+                misses[title] = expires
+        return ids, misses
+
+    def stale(self, max_age):
+        """Titles whose cached ID was fetched more than max_age seconds ago (oldest first)."""
+        cutoff = time.time() - max_age
+        rows = self._conn().execute(
+            "SELECT title FROM yt_ids WHERE video_id IS NOT NULL AND fetched_at < ? "
+            "ORDER BY fetched_at", (cutoff,))
+        return [r[0] for r in rows]
+
+    # ── per-entry writes ──
+    def put(self, title, video_id, fetched_at=None):
+        self._conn().execute(
+            "INSERT INTO yt_ids (title, video_id, fetched_at, expires_at) VALUES (?, ?, ?, NULL) "
+            "ON CONFLICT(title) DO UPDATE SET video_id=excluded.video_id, "
+            "fetched_at=excluded.fetched_at, expires_at=NULL",
+            (title, video_id, fetched_at or time.time()))
+
+    def put_miss(self, title, expires_at):
+        # never let a miss overwrite a known ID (e.g. a failed revalidation)
+        self._conn().execute(
+            "INSERT INTO yt_ids (title, video_id, fetched_at, expires_at) VALUES (?, NULL, ?, ?) "
+            "ON CONFLICT(title) DO UPDATE SET fetched_at=excluded.fetched_at, "
+            "expires_at=excluded.expires_at WHERE yt_ids.video_id IS NULL",
+            (title, time.time(), expires_at))
+
+    # ── maintenance ──
+    def migrate_json(self, cache_path, misses_path=None):
+        """One-time import of the old JSON cache files. Returns the number of rows imported."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key='migrated_json'").fetchone():
+            return 0
+        rows = []
+        now = time.time()
+        for path, is_miss in ((cache_path, False), (misses_path, True)):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  ⚠️  skipping {path}: {e}")
+                continue
+            rows += [(t, None, now, v) if is_miss else (t, v, now, None)
+                     for t, v in data.items() if v]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO yt_ids (title, video_id, fetched_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(title) DO NOTHING", rows)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_json', ?)", (str(now),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def compact(self):
+        """Drop expired negative entries, fold the WAL back in, VACUUM if mostly free pages."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM yt_ids WHERE video_id IS NULL AND expires_at < ?", (time.time(),)).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if pages and free / pages > 0.25:
+            conn.execute("VACUUM")
+        return removed
@@ -0,0 +1,313 @@
+"""
+Timbre – YouTube ID resolver
+
+Keeps third-party lookups (ytmusicapi / DuckDuckGo / YouTube HTML) off the
+request path. A request asks for a batch of titles with a deadline: cached
+IDs come back immediately, the rest are queued on a small background pool
+and whatever finishes before the deadline is used (or, for a streamed
+response, handed over as each lookup lands). Late results still land in the
+cache for the next request; the caller falls back to a search link.
+
+Every backend sits behind its own token bucket and exponential backoff, so a
+boot-time warm-up can't hammer an endpoint that is already failing. Titles
+that no backend finds are negative-cached for NEGATIVE_TTL, and concurrent
+lookups of one title share a single in-flight request.
+
+Backends are pluggable: anything with name / rate / burst / search(title)
+works, e.g. a local fake for tests. TIMBRE_YT_BACKENDS picks and orders the
+built-in ones (default "ytmusic,duckduckgo,youtube").
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+
+NEGATIVE_TTL = 7 * 24 * 3600      # seconds before a "not found" title is retried
+BACKOFF_BASE = 2.0                # first backoff after a transport error (seconds)
+BACKOFF_MAX = 600.0
+_UA = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+
+
+# ── Rate limiting ─────────────────────────────────────────
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` banked."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, sleeping as needed. False if it would take longer than timeout."""
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_s = (1 - self._tokens) / self.rate
+            if give_up is not None and now + wait_s > give_up:
+                return False
+            time.sleep(wait_s)
+
+
+# ── Backends ──────────────────────────────────────────────
+class Backend:
+    """One lookup source. search() returns a video ID or None (= not found)
+    and raises on transport errors, which trigger backoff instead of a
+    negative-cache entry."""
+
+    name = "backend"
+    rate = 1.0     # requests per second
+    burst = 1
+
+    def search(self, title):
+        raise NotImplementedError
+
+
+class YTMusicBackend(Backend):
+    """ytmusicapi (YouTube Music 原生搜尋，包含官方 MV 與純音軌，極低廣告干擾)"""
+
+    name, rate, burst = "ytmusic", 2.0, 4
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _ytmusic(self):
+        with self._lock:    # created on first use so a cold start makes no network calls
+            if self._client is None:
+                from ytmusicapi import YTMusic
+                self._client = YTMusic()
+            return self._client
+
+    def search(self, title):
+        for r in self._ytmusic().search(title):
+            if r.get("videoId"):
+                return r["videoId"]
+        return None
+
+
+class DuckDuckGoBackend(Backend):
+    """DuckDuckGo HTML search (穩定的網頁抓取)"""
+
+    name, rate, burst = "duckduckgo", 0.5, 2
+    _pattern = re.compile(r'v=([a-zA-Z0-9_-]{11})')
+
+    def search(self, title):
+        encoded = urllib.parse.quote("site:youtube.com/watch " + title)
+        req = urllib.request.Request(f"https://html.duckduckgo.com/html/?q={encoded}", headers=_UA)
+        html = urllib.request.urlopen(req, timeout=5).read().decode("utf-8")
+        match = self._pattern.search(html)
+        return match.group(1) if match else None
+
+
+class YouTubeHTMLBackend(Backend):
+    """YouTube search results page (最易受廣告干擾)"""
+
+    name, rate, burst = "youtube", 0.5, 2
+    _pattern = re.compile(r'"videoId":"([a-zA-Z0-9_-]{11})"')
+
+    def search(self, title):
+        encoded = urllib.parse.quote(title)
+        req = urllib.request.Request(f"https://www.youtube.com/results?search_query={encoded}", headers=_UA)
+        html = urllib.request.urlopen(req, timeout=5).read().decode("utf-8")
+        match = self._pattern.search(html)
+        return match.group(1) if match else None
+
+
+BACKENDS = {b.name: b for b in (YTMusicBackend, DuckDuckGoBackend, YouTubeHTMLBackend)}
+
+
+def make_backends(names="ytmusic,duckduckgo,youtube"):
+    """Backend instances from a comma-separated list of BACKENDS names."""
+    return [BACKENDS[n.strip()]() for n in names.split(",") if n.strip()]
+
+
+class _BackendState:
+    def __init__(self, backend):
+        self.bucket = TokenBucket(backend.rate, backend.burst)
+        self.failures = 0
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            self.blocked_until = time.monotonic() + delay * random.uniform(0.75, 1.0)
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.blocked_until = 0.0
+
+
+# ── Resolver ──────────────────────────────────────────────
+class YTResolver:
+    """title → YouTube video ID with a shared cache, negative cache and singleflight.
+
+    cache:       dict shared with the rest of the app (title → video_id)
+    negative:    dict title → unix expiry of a "not found" result
+    on_resolved: called as on_resolved(title, video_id) after a successful lookup
+    on_miss:     called as on_miss(title, expires_at) when a title is negative-cached
+    """
+
+    def __init__(self, backends, cache, negative=None, workers=4, warm_workers=2,
+                 on_resolved=None, on_miss=None, negative_ttl=NEGATIVE_TTL, max_wait=30.0):
+        self.backends = list(backends)
+        self.cache = cache
+        self.negative = {} if negative is None else negative
+        self.negative_ttl = negative_ttl
+        self.max_wait = max_wait          # longest a lookup waits for a rate-limit token
+        self._on_resolved = on_resolved
+        self._on_miss = on_miss
+        self._state = {b.name: _BackendState(b) for b in self.backends}
+        # Interactive lookups get their own pool so a warm-up backlog never delays them
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-resolve")
+        self._warm_pool = ThreadPoolExecutor(max_workers=warm_workers, thread_name_prefix="yt-warm")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def is_negative(self, title):
+        return self.negative.get(title, 0) > time.time()
+
+    def lookup(self, title, refresh=False):
+        """Blocking lookup through the backends in order (rate-limited).
+
+        refresh: revalidate a cached ID; it is kept if no backend finds a newer one.
+        """
+        cached = self.cache.get(title)
+        if not refresh and (cached or self.is_negative(title)):
+            return cached
+        transient = not self.backends   # nothing to ask isn't a "not found"
+        for backend in self.backends:
+            state = self._state[backend.name]
+            if time.monotonic() < state.blocked_until or not state.bucket.acquire(self.max_wait):
+                transient = True
+                continue
+            try:
+                vid = backend.search(title)
+            except Exception as e:
+                state.failed()
+                transient = True
+                print(f"  [YT resolver] {backend.name} failed ({state.failures}x, backing off): {e}")
+                continue
+            state.succeeded()
+            if vid:
+                self.cache[title] = vid
+                self.negative.pop(title, None)
+                if self._on_resolved:
+                    self._on_resolved(title, vid)
+                return vid
+        if cached:
+            if not transient and self._on_resolved:
+                self._on_resolved(title, cached)   # still the best answer — mark as checked
+            return cached
+        if not transient:   # every backend answered "not found"
+            expires = time.time() + self.negative_ttl
+            self.negative[title] = expires
+            if self._on_miss:
+                self._on_miss(title, expires)
+        return None
+
+    def _run(self, title, refresh=False):
+        try:
+            return self.lookup(title, refresh)
+        except Exception as e:
+            print(f"  [YT resolver] {title}: {e}")
+            return None
+
+    def _done(self, title, fut):
+        with self._lock:
+            if self._inflight.get(title, (None,))[0] is fut:
+                del self._inflight[title]
+
+    def submit(self, title, warm=False, refresh=False):
+        """Queue a background lookup (or join the one already running) → Future.
+
+        An interactive caller never queues behind the warm-up: a warm lookup of
+        the title that hasn't started yet is cancelled and moved to the
+        interactive pool (its warm future ends up cancelled).
+        """
+        while True:
+            with self._lock:
+                fut, fut_warm = self._inflight.get(title, (None, False))
+                if fut is None or fut.cancelled():
+                    pool = self._warm_pool if warm else self._pool
+                    fut = pool.submit(self._run, title, refresh)
+                    self._inflight[title] = (fut, warm)
+                    break
+                if warm or not fut_warm:
+                    return fut
+            # Outside the lock: cancel() runs _done inline, which drops the entry
+            if not fut.cancel():
+                return fut      # already running — join it
+        # Outside the lock: a future that is already done runs the callback inline
+        fut.add_done_callback(lambda f, t=title: self._done(t, f))
+        return fut
+
+    def resolve_many(self, titles, deadline):
+        """{title: video_id | None}, waiting at most `deadline` seconds in total."""
+        start = time.monotonic()
+        out, pending = {}, {}
+        for title in titles:
+            vid = self.cache.get(title)
+            if vid or self.is_negative(title):
+                out[title] = vid
+            else:
+                pending[title] = self.submit(title)
+        if pending and deadline > 0:
+            wait(pending.values(), timeout=max(0.0, deadline - (time.monotonic() - start)))
+        for title, fut in pending.items():
+            out[title] = fut.result() if fut.done() else None
+        return out
+
+    async def resolve_progressively(self, titles, deadline):
+        """Async-yield (known, pending) snapshots for a streamed response.
+
+        The first snapshot holds whatever the cache answers right away; another
+        follows each time a lookup finishes. known maps title → video_id | None.
+        Titles still pending after `deadline` seconds end up as None (their
+        lookups keep running and land in the cache). Waiting holds no thread.
+        """
+        known, waiting = {}, {}
+        for title in dict.fromkeys(titles):
+            vid = self.cache.get(title)
+            if vid or self.is_negative(title):
+                known[title] = vid
+            else:
+                waiting[asyncio.wrap_future(self.submit(title))] = title
+        yield dict(known), set(waiting.values())
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + deadline
+        while waiting:
+            done, _ = await asyncio.wait(waiting, timeout=max(0.0, give_up - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                known[waiting.pop(fut)] = fut.result()
+            yield dict(known), set(waiting.values())
+        if waiting:
+            known.update(dict.fromkeys(waiting.values()))
+            yield dict(known), set()
+
+    def warm(self, titles, refresh=()):
+        """Queue low-priority lookups → futures (cancelled if a request took the lookup over).
+
+        titles:  looked up unless cached or negative-cached
+        refresh: cached titles to revalidate (e.g. IDs fetched long ago)
+        """
+        todo = [t for t in titles if t not in self.cache and not self.is_negative(t)]
+        return ([self.submit(t, warm=True) for t in todo]
+                + [self.submit(t, warm=True, refresh=True) for t in refresh])